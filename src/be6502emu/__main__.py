@@ -0,0 +1,5 @@
+import sys
+
+from be6502emu.emulator import main
+
+sys.exit(main())
@@ -0,0 +1,186 @@
+"""Precomputed flag and ALU tables used by the generated handlers.
+
+Every table is built on first use from the same arithmetic as the
+reference ``op*`` helpers and then kept for the life of the process:
+
+* ``NZ[value]`` holds the N and Z flags of a byte;
+* ``CMP[(register << 8) | operand]`` holds the C, Z and N flags of a compare;
+* ``ASL[value]`` and ``LSR[value]`` hold ``result | flags << 8`` with flags
+  C, N and Z, ``ROL`` and ``ROR`` are indexed by ``(carry << 8) | value``;
+* ``ADC`` and ``SBC`` are indexed by ``adc_index(p, a, operand)`` and hold
+  ``result | flags << 8`` with flags C, V, N and Z, for binary and decimal
+  mode alike.
+"""
+
+from array import array
+
+NEGATIVE = 128
+OVERFLOW = 64
+DECIMAL = 8
+ZERO = 2
+CARRY = 1
+
+_tables: dict[str, object] = {}
+
+
+def adc_index(p, a, operand):
+    """Index into ``ADC``/``SBC`` for status ``p``, ``a`` and ``operand``."""
+    return ((p & DECIMAL) << 14) | ((p & CARRY) << 16) | (a << 8) | operand
+
+
+def _nz(value):
+    return value & NEGATIVE if value else ZERO
+
+
+def _adc(a, data, carry, decimal):
+    if decimal:
+        halfcarry = 0
+        decimalcarry = 0
+        adjust0 = 0
+        adjust1 = 0
+        nibble0 = (data & 0xF) + (a & 0xF) + carry
+        if nibble0 > 9:
+            adjust0 = 6
+            halfcarry = 1
+        nibble1 = ((data >> 4) & 0xF) + ((a >> 4) & 0xF) + halfcarry
+        if nibble1 > 9:
+            adjust1 = 6
+            decimalcarry = 1
+
+        # the ALU outputs are not decimally adjusted
+        nibble0 &= 0xF
+        nibble1 &= 0xF
+        aluresult = (nibble1 << 4) + nibble0
+
+        # the final A contents will be decimally adjusted
+        nibble0 = (nibble0 + adjust0) & 0xF
+        nibble1 = (nibble1 + adjust1) & 0xF
+        flags = _nz(aluresult)
+        if decimalcarry == 1:
+            flags |= CARRY
+        if (~(a ^ data) & (a ^ aluresult)) & NEGATIVE:
+            flags |= OVERFLOW
+        return (nibble1 << 4) + nibble0, flags
+
+    result = data + a + carry
+    flags = 0
+    if (~(a ^ data) & (a ^ result)) & NEGATIVE:
+        flags |= OVERFLOW
+    if result > 0xFF:
+        flags |= CARRY
+        result &= 0xFF
+    return result, flags | _nz(result)
+
+
+def _sbc(a, data, carry, decimal):
+    if decimal:
+        halfcarry = 1
+        decimalcarry = 0
+        adjust0 = 0
+        adjust1 = 0
+
+        nibble0 = (a & 0xF) + (~data & 0xF) + carry
+        if nibble0 <= 0xF:
+            halfcarry = 0
+            adjust0 = 10
+        nibble1 = ((a >> 4) & 0xF) + ((~data >> 4) & 0xF) + halfcarry
+        if nibble1 <= 0xF:
+            adjust1 = 10 << 4
+
+        # the ALU outputs are not decimally adjusted
+        aluresult = a + (~data & 0xFF) + carry
+        if aluresult > 0xFF:
+            decimalcarry = 1
+        aluresult &= 0xFF
+
+        # but the final result will be adjusted
+        nibble0 = (aluresult + adjust0) & 0xF
+        nibble1 = ((aluresult + adjust1) >> 4) & 0xF
+
+        flags = _nz(aluresult)
+        if decimalcarry == 1:
+            flags |= CARRY
+        if ((a ^ data) & (a ^ aluresult)) & NEGATIVE:
+            flags |= OVERFLOW
+        return (nibble1 << 4) + nibble0, flags
+
+    result = a + (~data & 0xFF) + carry
+    flags = 0
+    if ((a ^ data) & (a ^ result)) & NEGATIVE:
+        flags |= OVERFLOW
+    data = result & 0xFF
+    if data == 0:
+        flags |= ZERO
+    if result > 0xFF:
+        flags |= CARRY
+    return data, flags | (data & NEGATIVE)
+
+
+def _arithmetic(op):
+    table = array("H", bytes(2 * 4 * 0x10000))
+    for p in (0, CARRY, DECIMAL, DECIMAL | CARRY):
+        for a in range(0x100):
+            base = adc_index(p, a, 0)
+            for data in range(0x100):
+                result, flags = op(a, data, p & CARRY, p & DECIMAL)
+                table[base + data] = result | (flags << 8)
+    return table
+
+
+def _compare():
+    table = bytearray(0x10000)
+    for register in range(0x100):
+        for data in range(0x100):
+            flags = (register - data) & NEGATIVE
+            if register == data:
+                flags |= CARRY | ZERO
+            elif register > data:
+                flags |= CARRY
+            table[(register << 8) | data] = flags
+    return bytes(table)
+
+
+def _shift(op):
+    table = array("H", bytes(2 * 0x200))
+    for carry in (0, 1):
+        for value in range(0x100):
+            result, carry_out = op(value, carry)
+            flags = _nz(result) | carry_out
+            table[(carry << 8) | value] = result | (flags << 8)
+    return table
+
+
+BUILDERS = {
+    "NZ": lambda: bytes(_nz(value) for value in range(0x100)),
+    "CMP": _compare,
+    "ADC": lambda: _arithmetic(_adc),
+    "SBC": lambda: _arithmetic(_sbc),
+    "ASL": lambda: _shift(lambda v, c: ((v << 1) & 0xFF, v >> 7)),
+    "LSR": lambda: _shift(lambda v, c: (v >> 1, v & 1)),
+    "ROL": lambda: _shift(lambda v, c: (((v << 1) | c) & 0xFF, v >> 7)),
+    "ROR": lambda: _shift(lambda v, c: ((v >> 1) | (c << 7), v & 1)),
+}
+
+
+def table(name):
+    """Return the table ``name``, building it on first use."""
+    built = _tables.get(name)
+    if built is None:
+        built = _tables[name] = BUILDERS[name]()
+    return built
+
+
+class LazyTable:
+    """Stand-in bound as a global of generated code until first indexed.
+
+    On first access it builds the real table and rebinds the global in
+    ``namespace``, so later lookups hit the ``array``/``bytes`` directly.
+    """
+
+    def __init__(self, name, namespace):
+        self.name = name
+        self.namespace = namespace
+
+    def __getitem__(self, index):
+        built = self.namespace[self.name] = table(self.name)
+        return built[index]  # type: ignore[index]
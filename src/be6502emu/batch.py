@@ -0,0 +1,627 @@
+"""Many independent 65C02s executed in lockstep with NumPy.
+
+A ``BatchMPU`` holds ``lanes`` processors as arrays: a row of 64K RAM
+per lane in ``memory`` and an element per lane in ``a``, ``x``, ``y``,
+``sp``, ``p``, ``pc`` and ``processorCycles``. Each step fetches the
+opcode of every running lane, groups the lanes by opcode and executes
+every group with one vectorised handler, so a step costs a few array
+operations per distinct opcode rather than a Python call per lane.
+Branches diverge per lane through the mask of lanes taking them.
+
+Handlers are built from the ``MPU`` instruction table and the
+``be6502emu.alu`` tables, like ``be6502emu.codegen``, so a lane computes
+what an ``MPU`` over the same memory would, cycle counts included.
+Lanes are plain RAM: there is no bus with devices or hooks and no
+scheduler, interrupts come from ``irq()`` and ``nmi()``. ``lane(i)``
+gives one lane the register and memory API of an ``MPU`` and
+``Lane.to_mpu()`` copies it out to carry on as a full machine.
+
+NumPy is an optional dependency: ``pip install be6502emu[batch]``.
+"""
+
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError as e:  # pragma: no cover
+    raise ImportError("be6502emu.batch needs NumPy,"
+                      " pip install be6502emu[batch]") from e
+
+from be6502emu import alu
+from be6502emu.codegen import JUMPS, SIZES
+from be6502emu.mpu import MPU
+
+NEGATIVE = MPU.NEGATIVE
+OVERFLOW = MPU.OVERFLOW
+UNUSED = MPU.UNUSED
+BREAK = MPU.BREAK
+DECIMAL = MPU.DECIMAL
+INTERRUPT = MPU.INTERRUPT
+ZERO = MPU.ZERO
+CARRY = MPU.CARRY
+
+# Outcome of BatchMPU.run(), per lane: arrays of the cycles and
+# instructions executed and a list of the reasons, as in RunResult.
+BatchResult = namedtuple("BatchResult", ["cycles", "instructions", "reason"])
+
+_arrays: dict[str, "np.ndarray"] = {}
+_handlers: list[object] = []
+
+
+def _table(name):
+    """The ``be6502emu.alu`` table ``name`` as an array."""
+    array = _arrays.get(name)
+    if array is None:
+        array = _arrays[name] = np.asarray(
+            memoryview(alu.table(name))).astype(np.int64)
+    return array
+
+
+# memory and stack, ``lanes`` index the rows and ``addr`` is per lane
+
+def _read(batch, lanes, addr):
+    return batch.memory[lanes, addr].astype(np.int64)
+
+
+def _word(batch, lanes, addr):
+    return (_read(batch, lanes, addr)
+            | _read(batch, lanes, (addr + 1) & 0xFFFF) << 8)
+
+
+def _zero_page_word(batch, lanes, zp):
+    return (_read(batch, lanes, zp)
+            | _read(batch, lanes, (zp + 1) & 0xFF) << 8)
+
+
+def _push(batch, lanes, value):
+    sp = batch.sp[lanes]
+    batch.memory[lanes, 0x100 + sp] = value & 0xFF
+    batch.sp[lanes] = (sp - 1) & 0xFF
+
+
+def _pop(batch, lanes):
+    sp = (batch.sp[lanes] + 1) & 0xFF
+    batch.sp[lanes] = sp
+    return _read(batch, lanes, 0x100 + sp)
+
+
+def _nz(batch, lanes, value):
+    batch.p[lanes] = ((batch.p[lanes] & ~(ZERO | NEGATIVE))
+                      | _table("NZ")[value])
+
+
+def _address(batch, lanes, mode, pc, addcycles):
+    """Effective addresses and page crossing cycles, operands at ``pc``."""
+    if mode == "imm":
+        return pc, 0
+    if mode == "zpg":
+        return _read(batch, lanes, pc), 0
+    if mode in ("zpx", "zpy"):
+        index = batch.x if mode == "zpx" else batch.y
+        return (_read(batch, lanes, pc) + index[lanes]) & 0xFF, 0
+    if mode == "inx":
+        zp = (_read(batch, lanes, pc) + batch.x[lanes]) & 0xFF
+        return _zero_page_word(batch, lanes, zp), 0
+    if mode == "abs" or mode == "ind":
+        return _word(batch, lanes, pc), 0
+    if mode == "zpi":
+        return _word(batch, lanes, _read(batch, lanes, pc)), 0
+    if mode == "iax":
+        return (_word(batch, lanes, pc) + batch.x[lanes]) & 0xFFFF, 0
+    if mode == "iny":
+        base = _zero_page_word(batch, lanes, _read(batch, lanes, pc))
+        addr = (base + batch.y[lanes]) & 0xFFFF
+    else:  # abx, aby
+        index = batch.x if mode == "abx" else batch.y
+        base = _word(batch, lanes, pc)
+        addr = (base + index[lanes]) & 0xFFFF
+    if not addcycles:
+        return addr, 0
+    return addr, ((base ^ addr) & 0xFF00 != 0).astype(np.int64)
+
+
+# operations, ``addr`` holds the effective addresses or None for A
+
+def _operation(name, mode):
+    """The vectorised body of ``name`` in ``mode``."""
+    if name in ("ORA", "AND", "EOR"):
+        combine = {"ORA": np.bitwise_or, "AND": np.bitwise_and,
+                   "EOR": np.bitwise_xor}[name]
+
+        def logic(batch, lanes, addr):
+            a = combine(batch.a[lanes], _read(batch, lanes, addr))
+            batch.a[lanes] = a
+            _nz(batch, lanes, a)
+        return logic
+    if name in ("LDA", "LDX", "LDY"):
+        target = name[2].lower()
+
+        def load(batch, lanes, addr):
+            value = _read(batch, lanes, addr)
+            getattr(batch, target)[lanes] = value
+            _nz(batch, lanes, value)
+        return load
+    if name in ("STA", "STX", "STY"):
+        source = name[2].lower()
+
+        def store(batch, lanes, addr):
+            batch.memory[lanes, addr] = getattr(batch, source)[lanes]
+        return store
+    if name == "STZ":
+        def zero(batch, lanes, addr):
+            batch.memory[lanes, addr] = 0
+        return zero
+    if name in ("CMP", "CPX", "CPY"):
+        register = {"CMP": "a", "CPX": "x", "CPY": "y"}[name]
+
+        def compare(batch, lanes, addr):
+            flags = _table("CMP")[getattr(batch, register)[lanes] << 8
+                                  | _read(batch, lanes, addr)]
+            batch.p[lanes] = (batch.p[lanes]
+                              & ~(CARRY | ZERO | NEGATIVE)) | flags
+        return compare
+    if name == "BIT":
+        def bit(batch, lanes, addr):
+            value = _read(batch, lanes, addr)
+            if mode == "imm":
+                p = batch.p[lanes] & ~ZERO
+            else:
+                p = (batch.p[lanes] & ~(ZERO | NEGATIVE | OVERFLOW)
+                     | value & (NEGATIVE | OVERFLOW))
+            batch.p[lanes] = p | np.where(batch.a[lanes] & value, 0, ZERO)
+        return bit
+    if name in ("ADC", "SBC"):
+        def arithmetic(batch, lanes, addr):
+            p = batch.p[lanes]
+            result = _table(name)[(p & DECIMAL) << 14 | (p & CARRY) << 16
+                                  | batch.a[lanes] << 8
+                                  | _read(batch, lanes, addr)]
+            batch.a[lanes] = result & 0xFF
+            batch.p[lanes] = (p & ~(CARRY | OVERFLOW | NEGATIVE | ZERO)
+                              | result >> 8)
+        return arithmetic
+    if name in ("ASL", "LSR", "ROL", "ROR", "INC", "DEC"):
+        def modify(batch, lanes, addr):
+            if addr is None:
+                value = batch.a[lanes]
+            else:
+                value = _read(batch, lanes, addr)
+            p = batch.p[lanes]
+            if name in ("INC", "DEC"):
+                value = (value + (1 if name == "INC" else -1)) & 0xFF
+                p = (p & ~(ZERO | NEGATIVE)) | _table("NZ")[value]
+            else:
+                if name in ("ROL", "ROR"):
+                    value = value | (p & CARRY) << 8
+                result = _table(name)[value]
+                value = result & 0xFF
+                p = (p & ~(CARRY | NEGATIVE | ZERO)) | result >> 8
+            batch.p[lanes] = p
+            if addr is None:
+                batch.a[lanes] = value
+            else:
+                batch.memory[lanes, addr] = value
+        return modify
+    if name in ("TSB", "TRB"):
+        def test_bits(batch, lanes, addr):
+            value = _read(batch, lanes, addr)
+            a = batch.a[lanes]
+            batch.p[lanes] = (batch.p[lanes] & ~ZERO
+                              | np.where(value & a, 0, ZERO))
+            if name == "TSB":
+                batch.memory[lanes, addr] = value | a
+            else:
+                batch.memory[lanes, addr] = value & ~a & 0xFF
+        return test_bits
+    if name[:3] in ("RMB", "SMB"):
+        mask = 1 << int(name[3])
+
+        def memory_bit(batch, lanes, addr):
+            value = _read(batch, lanes, addr)
+            if name[0] == "R":
+                batch.memory[lanes, addr] = value & (0xFF ^ mask)
+            else:
+                batch.memory[lanes, addr] = value | mask
+        return memory_bit
+    if name in ("CLC", "CLD", "CLI", "CLV", "SEC", "SED", "SEI"):
+        flag = {"C": CARRY, "D": DECIMAL, "I": INTERRUPT,
+                "V": OVERFLOW}[name[2]]
+
+        def status(batch, lanes, addr):
+            if name[0] == "C":
+                batch.p[lanes] &= ~flag
+            else:
+                batch.p[lanes] |= flag
+        return status
+    if name in ("TAX", "TAY", "TXA", "TYA", "TSX"):
+        source = {"A": "a", "X": "x", "Y": "y", "S": "sp"}[name[1]]
+        target = name[2].lower()
+
+        def transfer(batch, lanes, addr):
+            value = getattr(batch, source)[lanes]
+            getattr(batch, target)[lanes] = value
+            _nz(batch, lanes, value)
+        return transfer
+    if name == "TXS":
+        def txs(batch, lanes, addr):
+            batch.sp[lanes] = batch.x[lanes]
+        return txs
+    if name in ("INX", "INY", "DEX", "DEY"):
+        register = name[2].lower()
+        step = 1 if name[0] == "I" else -1
+
+        def count(batch, lanes, addr):
+            value = (getattr(batch, register)[lanes] + step) & 0xFF
+            getattr(batch, register)[lanes] = value
+            _nz(batch, lanes, value)
+        return count
+    if name in ("PHA", "PHX", "PHY", "PHP"):
+        source = name[2].lower()
+
+        def push(batch, lanes, addr):
+            value = getattr(batch, source)[lanes]
+            if name == "PHP":
+                value = value | BREAK | UNUSED
+            _push(batch, lanes, value)
+        return push
+    if name in ("PLA", "PLX", "PLY", "PLP"):
+        target = name[2].lower()
+
+        def pull(batch, lanes, addr):
+            value = _pop(batch, lanes)
+            if name == "PLP":
+                batch.p[lanes] = value | BREAK | UNUSED
+            else:
+                getattr(batch, target)[lanes] = value
+                _nz(batch, lanes, value)
+        return pull
+    if name in ("NOP", "WAI", "STP"):
+        def halt(batch, lanes, addr):
+            if name == "WAI":
+                batch.waiting[lanes] = True
+            elif name == "STP":
+                batch.stopped[lanes] = True
+        return halt
+    raise KeyError(name)
+
+
+# control flow, these set ``batch.pc`` themselves and return extra cycles
+
+def _control(name, mode):
+    """The vectorised body of the jump or branch ``name``."""
+    if name == "JMP":
+        def jump(batch, lanes, pc, addr):
+            if mode != "abs":
+                addr = _word(batch, lanes, addr)
+            batch.pc[lanes] = addr
+            return 0
+        return jump
+    if name in ("JSR", "BRK"):
+        def call(batch, lanes, pc, addr):
+            ret = (pc + 1) & 0xFFFF
+            _push(batch, lanes, ret >> 8)
+            _push(batch, lanes, ret)
+            if name == "BRK":
+                p = batch.p[lanes] | BREAK
+                _push(batch, lanes, p | UNUSED)
+                batch.p[lanes] = (p | INTERRUPT) & ~DECIMAL
+                addr = _word(batch, lanes, MPU.IRQ)
+            batch.pc[lanes] = addr
+            return 0
+        return call
+    if name in ("RTS", "RTI"):
+        def ret(batch, lanes, pc, addr):
+            if name == "RTI":
+                batch.p[lanes] = _pop(batch, lanes) | BREAK | UNUSED
+            low = _pop(batch, lanes)
+            addr = low | _pop(batch, lanes) << 8
+            if name == "RTS":
+                addr = (addr + 1) & 0xFFFF
+            batch.pc[lanes] = addr
+            return 0
+        return ret
+    flag, taken_if = {
+        "BPL": (NEGATIVE, 0), "BMI": (NEGATIVE, NEGATIVE),
+        "BVC": (OVERFLOW, 0), "BVS": (OVERFLOW, OVERFLOW),
+        "BCC": (CARRY, 0), "BCS": (CARRY, CARRY),
+        "BNE": (ZERO, 0), "BEQ": (ZERO, ZERO),
+        "BRA": (0, 0),
+    }[name]
+
+    def branch(batch, lanes, pc, addr):
+        taken = (batch.p[lanes] & flag) == taken_if
+        offset = _read(batch, lanes, pc)
+        nxt = pc + 1
+        target = nxt + offset - (offset & NEGATIVE) * 2
+        batch.pc[lanes] = np.where(taken, target, nxt) & 0xFFFF
+        return np.where(taken, np.where((nxt ^ target) & 0xFF00, 2, 1), 0)
+    return branch
+
+
+def _handler(opcode):
+    name, mode = MPU.disassemble[opcode]
+    cycles = MPU.cycletime[opcode]
+    addcycles = MPU.extracycles[opcode]
+
+    if name == "???":
+        def undefined(batch, lanes):
+            # skips a byte and takes no time, like the reference handler
+            batch.pc[lanes] = (batch.pc[lanes] + 2) & 0xFFFF
+        return undefined
+
+    if name in JUMPS or mode == "rel":
+        control = _control(name, mode)
+
+        def jump(batch, lanes):
+            pc = (batch.pc[lanes] + 1) & 0xFFFF
+            addr = None
+            if mode not in ("imp", "rel"):
+                addr = _address(batch, lanes, mode, pc, addcycles)[0]
+            extra = control(batch, lanes, pc, addr)
+            batch.processorCycles[lanes] += cycles + extra
+        return jump
+
+    operate = _operation(name, mode)
+    size = SIZES[mode]
+
+    def handler(batch, lanes):
+        pc = (batch.pc[lanes] + 1) & 0xFFFF
+        if mode in ("imp", "acc"):
+            addr, extra = None, 0
+        else:
+            addr, extra = _address(batch, lanes, mode, pc, addcycles)
+        operate(batch, lanes, addr)
+        batch.pc[lanes] = (pc + size) & 0xFFFF
+        batch.processorCycles[lanes] += cycles + extra
+    return handler
+
+
+def handlers():
+    """The 256 vectorised handlers, built on first use."""
+    if not _handlers:
+        _handlers.extend(_handler(opcode) for opcode in range(256))
+    return _handlers
+
+
+def _lane_register(name):
+    def get(lane):
+        return int(getattr(lane.batch, name)[lane.index])
+
+    def set(lane, value):
+        getattr(lane.batch, name)[lane.index] = value
+    return property(get, set)
+
+
+class Lane:
+    """One lane of a ``BatchMPU`` seen through the API of an ``MPU``."""
+
+    def __init__(self, batch, index):
+        self.batch = batch
+        self.index = index
+
+    a = _lane_register("a")
+    x = _lane_register("x")
+    y = _lane_register("y")
+    sp = _lane_register("sp")
+    p = _lane_register("p")
+    pc = _lane_register("pc")
+    processorCycles = _lane_register("processorCycles")
+
+    @property
+    def waiting(self):
+        return bool(self.batch.waiting[self.index])
+
+    @property
+    def stopped(self):
+        return bool(self.batch.stopped[self.index])
+
+    @property
+    def memory(self):
+        """The 64K of the lane, a writable view."""
+        return self.batch.memory[self.index]
+
+    def load(self, address, data):
+        """Copy the bytes of ``data`` into memory starting at ``address``."""
+        data = np.frombuffer(bytes(data), np.uint8)
+        self.memory[address:address + len(data)] = data
+
+    def dump(self, address=0, length=None):
+        """Return ``length`` bytes from ``address`` as ``bytes``."""
+        end = 0x10000 if length is None else address + length
+        return self.memory[address:end].tobytes()
+
+    def to_mpu(self, engine="reference"):
+        """An ``MPU`` over a copy of the lane's memory and registers."""
+        mpu = MPU(bytearray(self.dump()), self.batch.start_pc, engine)
+        for name in ("a", "x", "y", "sp", "p", "pc", "processorCycles",
+                     "waiting", "stopped"):
+            setattr(mpu, name, getattr(self, name))
+        return mpu
+
+    def __repr__(self):
+        return MPU.reprformat() % (" " * 7, "65C02", self.pc, self.a,
+                                   self.x, self.y, self.sp,
+                                   format(self.p, "08b"))
+
+
+class BatchMPU:
+    """``lanes`` 65C02s over 64K of RAM each, stepped in lockstep.
+
+    ``memory`` is a 64K image given to every lane, or an array of one
+    image per lane. ``pc`` is where lanes start and reset to, None for
+    the reset vector of each lane.
+    """
+
+    def __init__(self, lanes, memory=None, pc=0x0000):
+        if lanes < 1:
+            raise ValueError("a batch needs at least one lane")
+        self.lanes = lanes
+        self.memory = np.zeros((lanes, 0x10000), np.uint8)
+        if memory is not None:
+            if isinstance(memory, (bytes, bytearray, memoryview)):
+                memory = np.frombuffer(memory, np.uint8)
+            self.memory[:] = memory
+        self.start_pc = pc
+        # registers, one element per lane
+        self.a = np.zeros(lanes, np.int64)
+        self.x = np.zeros(lanes, np.int64)
+        self.y = np.zeros(lanes, np.int64)
+        self.sp = np.zeros(lanes, np.int64)
+        self.p = np.zeros(lanes, np.int64)
+        self.pc = np.zeros(lanes, np.int64)
+        self.processorCycles = np.zeros(lanes, np.int64)
+        self.waiting = np.zeros(lanes, bool)
+        self.stopped = np.zeros(lanes, bool)
+        self.instruct = handlers()
+        self.reset()
+
+    @classmethod
+    def from_mpu(cls, mpu, lanes):
+        """``lanes`` copies of the memory and registers of ``mpu``."""
+        batch = cls(lanes, mpu.dump(), mpu.start_pc)
+        for name in ("a", "x", "y", "sp", "p", "pc", "processorCycles",
+                     "waiting", "stopped"):
+            getattr(batch, name)[:] = getattr(mpu, name)
+        return batch
+
+    def _select(self, lanes):
+        if lanes is None:
+            return np.arange(self.lanes)
+        return np.asarray(lanes, np.int64).reshape(-1)
+
+    def reset(self, lanes=None):
+        """Reset ``lanes`` (default all) as ``MPU.reset`` does."""
+        lanes = self._select(lanes)
+        if self.start_pc is None:
+            self.pc[lanes] = _word(self, lanes, MPU.RESET)
+        else:
+            self.pc[lanes] = self.start_pc
+        self.sp[lanes] = 0xFF
+        self.a[lanes] = self.x[lanes] = self.y[lanes] = 0
+        self.p[lanes] = BREAK | UNUSED
+        self.waiting[lanes] = self.stopped[lanes] = False
+
+    def lane(self, index):
+        """The ``Lane`` at ``index``."""
+        if not -self.lanes <= index < self.lanes:
+            raise IndexError("lane %d out of range" % index)
+        return Lane(self, index % self.lanes)
+
+    def __len__(self):
+        return self.lanes
+
+    def __iter__(self):
+        return (Lane(self, index) for index in range(self.lanes))
+
+    def _interrupt(self, lanes, vector):
+        pc = self.pc[lanes]
+        _push(self, lanes, pc >> 8)
+        _push(self, lanes, pc)
+        p = self.p[lanes] & ~BREAK
+        _push(self, lanes, p | UNUSED)
+        self.p[lanes] = (p | INTERRUPT) & ~DECIMAL
+        self.pc[lanes] = _word(self, lanes, vector)
+        self.processorCycles[lanes] += 7
+
+    def irq(self, lanes=None):
+        """Take an IRQ on ``lanes`` (default all), see ``MPU.irq``."""
+        lanes = self._select(lanes)
+        lanes = lanes[~self.stopped[lanes]]
+        self.waiting[lanes] = False
+        self._interrupt(lanes[self.p[lanes] & INTERRUPT == 0], MPU.IRQ)
+
+    def nmi(self, lanes=None):
+        """Take an NMI on ``lanes`` (default all), see ``MPU.nmi``."""
+        lanes = self._select(lanes)
+        lanes = lanes[~self.stopped[lanes]]
+        self.waiting[lanes] = False
+        self._interrupt(lanes, MPU.NMI)
+
+    def step(self, lanes=None):
+        """Execute one instruction on every running lane of ``lanes``."""
+        lanes = self._select(lanes)
+        self._execute(lanes[~(self.waiting[lanes] | self.stopped[lanes])])
+        return self
+
+    def _execute(self, lanes):
+        if not len(lanes):
+            return
+        opcodes = self.memory[lanes, self.pc[lanes]]
+        first = opcodes[0]
+        if (opcodes == first).all():
+            self.instruct[first](self, lanes)
+            return
+        order = np.argsort(opcodes, kind="stable")
+        opcodes = opcodes[order]
+        lanes = lanes[order]
+        bounds = np.flatnonzero(opcodes[1:] != opcodes[:-1]) + 1
+        start = 0
+        for end in [*bounds.tolist(), len(lanes)]:
+            self.instruct[opcodes[start]](self, lanes[start:end])
+            start = end
+
+    def run(self, cycles=None, instructions=None, until_pc=None):
+        """Run every lane until its own budget or stop address.
+
+        The limits apply to each lane as in ``MPU.run``; a lane halted by
+        WAI or STP waits out its ``cycles`` budget. Lanes that finish
+        early sit out the remaining steps. Returns a ``BatchResult``.
+        """
+        if cycles is None and instructions is None and until_pc is None:
+            raise ValueError("run() needs a cycle, instruction or pc limit")
+
+        start = self.processorCycles.copy()
+        end = start + cycles if cycles is not None else None
+        count = np.zeros(self.lanes, np.int64)
+        reasons = [""] * self.lanes
+        running = np.ones(self.lanes, bool)
+
+        def why(index):
+            if self.stopped[index]:
+                return "stopped"
+            return "waiting" if self.waiting[index] else "cycles"
+
+        def finish(done, reason):
+            # reason is a string, or picks one for a lane by its index
+            for index in np.flatnonzero(done).tolist():
+                reasons[index] = (reason if isinstance(reason, str)
+                                  else reason(index))
+            running[done] = False
+
+        # each limit costs one vector compare per step, reasons are only
+        # looked up for the lanes finishing
+        finished = True
+        while True:
+            if instructions is not None:
+                done = running & (count == instructions)
+                if done.any():
+                    finish(done, "instructions")
+                    finished = True
+            if end is not None:
+                done = running & (self.processorCycles >= end)
+                if done.any():
+                    finish(done, why)
+                    finished = True
+            halted = running & (self.stopped | self.waiting)
+            if halted.any():
+                if end is not None:
+                    # nothing wakes a lane up, skip to the end of its budget
+                    self.processorCycles[halted] = np.maximum(
+                        self.processorCycles[halted], end[halted])
+                finish(halted, why)
+                finished = True
+            if finished:
+                lanes = np.flatnonzero(running)
+                if not len(lanes):
+                    break
+                finished = False
+            self._execute(lanes)
+            count += running
+            if until_pc is not None:
+                done = running & (self.pc == until_pc)
+                if done.any():
+                    finish(done & ~(self.stopped | self.waiting),
+                           "until_pc")
+                    finished = True
+
+        return BatchResult(self.processorCycles - start, count, reasons)
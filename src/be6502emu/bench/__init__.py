@@ -0,0 +1,166 @@
+"""Throughput benchmarks over canned 6502 workloads.
+
+``measure`` runs one workload on one engine for a fixed number of
+instructions and keeps the fastest of a few repeats; ``run_all`` does
+that for every workload and engine. Results are nested dicts, workload
+then engine, holding instructions per second and the emulated clock in
+MHz, and ``save``/``load`` keep them as a JSON baseline. ``compare``
+lists what got slower than the baseline by more than a threshold, which
+``python -m be6502emu.bench --baseline FILE`` turns into its exit code.
+"""
+
+import argparse
+import json
+import platform
+import time
+from collections import namedtuple
+
+from be6502emu.bench.workloads import WORKLOADS, Workload
+from be6502emu.mpu import MPU
+
+__all__ = ["WORKLOADS", "Workload", "Regression", "measure", "run_all",
+           "save", "load", "compare", "main"]
+
+VERSION = 1
+
+Regression = namedtuple("Regression",
+                        ["workload", "engine", "baseline", "current"])
+
+
+def measure(workload, engine, instructions=200000, repeat=3, warmup=1000,
+            timer=time.perf_counter):
+    """Best throughput of ``workload`` on ``engine``, as a dict.
+
+    Each repeat builds a fresh MPU and runs ``warmup`` instructions
+    untimed so caches and generated code are in place.
+    """
+    runs = []
+    for _ in range(repeat):
+        mpu = workload.build(engine)
+        mpu.run(instructions=warmup)
+        start = timer()
+        result = mpu.run(instructions=instructions)
+        runs.append((max(timer() - start, 1e-9), result.cycles))
+    elapsed, cycles = min(runs)
+    return {
+        "instructions_per_second": round(instructions / elapsed),
+        "mhz": round(cycles / elapsed / 1e6, 3),
+    }
+
+
+def run_all(workloads=WORKLOADS, engines=MPU.ENGINES, progress=None,
+            **options):
+    """``measure`` every workload on every engine.
+
+    ``progress`` is called with the workload name, engine and result
+    after each measurement.
+    """
+    results: dict[str, dict[str, dict[str, float]]] = {}
+    for workload in workloads:
+        for engine in engines:
+            result = measure(workload, engine, **options)
+            results.setdefault(workload.name, {})[engine] = result
+            if progress is not None:
+                progress(workload.name, engine, result)
+    return results
+
+
+def save(path, results):
+    """Write ``results`` to ``path`` as a baseline."""
+    document = {
+        "version": VERSION,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "results": results,
+    }
+    with open(path, "w") as file:
+        json.dump(document, file, indent=2, sort_keys=True)
+        file.write("\n")
+
+
+def load(path):
+    """The results stored in the baseline at ``path``."""
+    with open(path) as file:
+        document = json.load(file)
+    if document.get("version") != VERSION:
+        raise ValueError("unsupported baseline version %r"
+                         % (document.get("version"),))
+    return document["results"]
+
+
+def compare(results, baseline, threshold=0.1):
+    """The ``Regression``s of ``results`` against ``baseline``.
+
+    A workload regressed on an engine when its instructions per second
+    fell below ``1 - threshold`` of the baseline. Pairs missing from
+    either side are not compared.
+    """
+    regressions = []
+    for name, engines in results.items():
+        for engine, result in engines.items():
+            before = baseline.get(name, {}).get(engine)
+            if before is None:
+                continue
+            old = before["instructions_per_second"]
+            new = result["instructions_per_second"]
+            if new < old * (1 - threshold):
+                regressions.append(Regression(name, engine, old, new))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m be6502emu.bench",
+        description="Measure emulator throughput on canned workloads.")
+    names = [workload.name for workload in WORKLOADS]
+    parser.add_argument("-w", "--workload", action="append", choices=names,
+                        help="workload to run, repeatable (default all)")
+    parser.add_argument("-e", "--engine", action="append",
+                        choices=MPU.ENGINES,
+                        help="engine to run on, repeatable (default all)")
+    parser.add_argument("-n", "--instructions", type=int, default=200000,
+                        help="instructions per run (default %(default)d)")
+    parser.add_argument("-r", "--repeat", type=int, default=3,
+                        help="runs to take the best of (default %(default)d)")
+    parser.add_argument("--save", metavar="FILE",
+                        help="store the results as a baseline")
+    parser.add_argument("--baseline", metavar="FILE",
+                        help="fail if slower than this baseline")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="fraction of the baseline throughput that may"
+                             " be lost (default %(default)s)")
+    args = parser.parse_args(argv)
+    if args.instructions < 1 or args.repeat < 1:
+        parser.error("--instructions and --repeat must be positive")
+    if not 0 <= args.threshold < 1:
+        parser.error("--threshold must be in [0, 1)")
+
+    baseline = {}
+    if args.baseline is not None:
+        try:
+            baseline = load(args.baseline)
+        except (OSError, ValueError, KeyError) as e:
+            parser.error("%s: %s" % (args.baseline, e))
+    workloads = [workload for workload in WORKLOADS
+                 if args.workload is None or workload.name in args.workload]
+
+    def show(name, engine, result):
+        line = "%-10s %-10s %12d instructions/s %8.3f MHz" % (
+            name, engine, result["instructions_per_second"], result["mhz"])
+        before = baseline.get(name, {}).get(engine)
+        if before is not None:
+            line += " %+6.1f%%" % (
+                100 * result["instructions_per_second"]
+                / before["instructions_per_second"] - 100)
+        print(line)
+
+    results = run_all(workloads, args.engine or MPU.ENGINES, progress=show,
+                      instructions=args.instructions, repeat=args.repeat)
+    if args.save is not None:
+        save(args.save, results)
+    regressions = compare(results, baseline, args.threshold)
+    for regression in regressions:
+        print("regression: %s on %s, %d instructions/s down from %d"
+              % (regression.workload, regression.engine, regression.current,
+                 regression.baseline))
+    return 1 if regressions else 0
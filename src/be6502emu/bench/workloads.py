@@ -0,0 +1,155 @@
+"""Canned workloads, each a fixed byte image running forever.
+
+Every builder returns a fresh ``MPU`` for the given engine, ready to run
+from its entry point, so runs of a workload are reproducible.
+"""
+
+from collections import namedtuple
+
+from be6502emu.machine import Machine
+from be6502emu.mpu import MPU
+
+Workload = namedtuple("Workload", ["name", "description", "build"])
+
+# $0200 LDX #$00
+# $0202 loop: TXA; ADC #$13; EOR $10; STA $10; ROL A; AND #$7F; ADC $11;
+#       STA $11; DEX; BNE loop
+# $0213 JMP $0200
+ALU = bytes((
+    0xA2, 0x00,
+    0x8A, 0x69, 0x13, 0x45, 0x10, 0x85, 0x10, 0x2A, 0x29, 0x7F, 0x65, 0x11,
+    0x85, 0x11, 0xCA, 0xD0, 0xEF,
+    0x4C, 0x00, 0x02,
+))
+
+# $0200 SED
+# $0201 loop: CLC; LDA $10; ADC #$01; STA $10; LDA $11; ADC #$00; STA $11;
+#       SEC; LDA $12; SBC #$01; STA $12; JMP loop
+BCD = bytes((
+    0xF8,
+    0x18, 0xA5, 0x10, 0x69, 0x01, 0x85, 0x10, 0xA5, 0x11, 0x69, 0x00, 0x85,
+    0x11, 0x38, 0xA5, 0x12, 0xE9, 0x01, 0x85, 0x12, 0x4C, 0x01, 0x02,
+))
+
+# copies the 2K at $1000 to $2000 over and over
+# $0200 LDA #$00; STA $00; STA $02; LDA #$10; STA $01; LDA #$20; STA $03;
+#       LDX #$08
+# $0210 page: LDY #$00
+# $0212 copy: LDA ($00),Y; STA ($02),Y; INY; BNE copy
+#       INC $01; INC $03; DEX; BNE page
+# $0220 JMP $0200
+COPY = bytes((
+    0xA9, 0x00, 0x85, 0x00, 0x85, 0x02, 0xA9, 0x10, 0x85, 0x01, 0xA9, 0x20,
+    0x85, 0x03, 0xA2, 0x08,
+    0xA0, 0x00,
+    0xB1, 0x00, 0x91, 0x02, 0xC8, 0xD0, 0xF9,
+    0xE6, 0x01, 0xE6, 0x03, 0xCA, 0xD0, 0xF0,
+    0x4C, 0x00, 0x02,
+))
+
+# the call tree of a naive Fibonacci of 12
+# $0200 LDX #$FF; TXS; LDA #12; JSR fib; JMP $0200
+# $020B fib: CMP #2; BCC done; PHA; SEC; SBC #1; JSR fib; PLA; PHA; SEC;
+#       SBC #2; JSR fib; PLA
+# $021F done: RTS
+RECURSION = bytes((
+    0xA2, 0xFF, 0x9A, 0xA9, 0x0C, 0x20, 0x0B, 0x02, 0x4C, 0x00, 0x02,
+    0xC9, 0x02, 0x90, 0x10, 0x48, 0x38, 0xE9, 0x01, 0x20, 0x0B, 0x02, 0x68,
+    0x48, 0x38, 0xE9, 0x02, 0x20, 0x0B, 0x02, 0x68,
+    0x60,
+))
+
+# $0200 LDX #$FF; TXS; CLI
+# $0204 loop: INX; INY; JMP loop
+# $0300 INC $20; RTI
+STORM = bytes((0xA2, 0xFF, 0x9A, 0x58, 0xE8, 0xC8, 0x4C, 0x04, 0x02))
+HANDLER = bytes((0xE6, 0x20, 0x40))
+STORM_PERIOD = 100  # cycles between interrupts
+
+# Ben Eater's hello world waiting on the LCD busy flag, starting over
+# once printed
+HELLO = bytes((
+    # $8000 LDX #$FF; TXS; LDA #$FF; STA DDRB; LDA #$E0; STA DDRA
+    0xA2, 0xFF, 0x9A, 0xA9, 0xFF, 0x8D, 0x02, 0x60, 0xA9, 0xE0, 0x8D, 0x03,
+    0x60,
+    # $800D LDA #$38 / #$0E / #$06 / #$01; JSR lcd_instruction, each
+    0xA9, 0x38, 0x20, 0x63, 0x80, 0xA9, 0x0E, 0x20, 0x63, 0x80,
+    0xA9, 0x06, 0x20, 0x63, 0x80, 0xA9, 0x01, 0x20, 0x63, 0x80,
+    # $8021 LDX #0
+    # $8023 print: LDA message,X; BEQ again; JSR print_char; INX; JMP print
+    # $802F again: JMP $8000
+    0xA2, 0x00, 0xBD, 0x32, 0x80, 0xF0, 0x07, 0x20, 0x79, 0x80, 0xE8, 0x4C,
+    0x23, 0x80, 0x4C, 0x00, 0x80,
+    # $8032 message
+)) + b"Hello, world!\x00" + bytes((
+    # $8040 lcd_wait: PHA; LDA #0; STA DDRB
+    # $8046 busy: LDA #RW; STA PORTA; LDA #RW|E; STA PORTA; LDA PORTB;
+    #       AND #$80; BNE busy
+    #       LDA #RW; STA PORTA; LDA #$FF; STA DDRB; PLA; RTS
+    0x48, 0xA9, 0x00, 0x8D, 0x02, 0x60,
+    0xA9, 0x40, 0x8D, 0x01, 0x60, 0xA9, 0xC0, 0x8D, 0x01, 0x60,
+    0xAD, 0x00, 0x60, 0x29, 0x80, 0xD0, 0xEF,
+    0xA9, 0x40, 0x8D, 0x01, 0x60, 0xA9, 0xFF, 0x8D, 0x02, 0x60, 0x68, 0x60,
+    # $8063 lcd_instruction: JSR lcd_wait; STA PORTB; LDA #0; STA PORTA;
+    #       LDA #E; STA PORTA; LDA #0; STA PORTA; RTS
+    0x20, 0x40, 0x80, 0x8D, 0x00, 0x60, 0xA9, 0x00, 0x8D, 0x01, 0x60,
+    0xA9, 0x80, 0x8D, 0x01, 0x60, 0xA9, 0x00, 0x8D, 0x01, 0x60, 0x60,
+    # $8079 print_char: the same with RS set
+    0x20, 0x40, 0x80, 0x8D, 0x00, 0x60, 0xA9, 0x20, 0x8D, 0x01, 0x60,
+    0xA9, 0xA0, 0x8D, 0x01, 0x60, 0xA9, 0x20, 0x8D, 0x01, 0x60, 0x60,
+))
+HELLO_ROM = (HELLO + bytes(0x7FFC - len(HELLO)) + bytes((0x00, 0x80))
+             + bytes(2))
+
+
+def _program(code, engine):
+    mpu = MPU(engine=engine, pc=0x0200)
+    mpu.load(0x0200, code)
+    return mpu
+
+
+def alu(engine):
+    return _program(ALU, engine)
+
+
+def bcd(engine):
+    return _program(BCD, engine)
+
+
+def copy(engine):
+    mpu = _program(COPY, engine)
+    mpu.load(0x1000, bytes(range(256)) * 8)
+    return mpu
+
+
+def recursion(engine):
+    return _program(RECURSION, engine)
+
+
+def storm(engine):
+    mpu = _program(STORM, engine)
+    mpu.load(0x0300, HANDLER)
+    mpu.load(MPU.IRQ, (0x00, 0x03))
+
+    def interrupt(cycle):
+        mpu.irq()
+        mpu.scheduler.post(cycle + STORM_PERIOD, interrupt)
+
+    mpu.scheduler.post(STORM_PERIOD, interrupt)
+    return mpu
+
+
+def hello(engine):
+    return Machine(HELLO_ROM, engine=engine).mpu
+
+
+WORKLOADS = (
+    Workload("alu", "tight loop of ALU instructions", alu),
+    Workload("bcd", "decimal mode additions and subtractions", bcd),
+    Workload("copy", "memory copy through (zp),Y", copy),
+    Workload("recursion", "JSR/RTS call tree with stack traffic", recursion),
+    Workload("storm", "an IRQ through irq() every %d cycles" % STORM_PERIOD,
+             storm),
+    Workload("hello", "hello world on the LCD, polling its busy flag",
+             hello),
+)
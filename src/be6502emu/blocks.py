@@ -0,0 +1,269 @@
+"""Basic-block translation cache used by the ``"block"`` engine.
+
+Straight-line runs of code are decoded once into ``Block`` objects keyed by
+their start address. A block ends at the first instruction that transfers
+control or stores to memory, so a store that modifies code can never be
+followed by a stale instruction of the same block; the store itself drops
+every cached block covering the written address. Stores are seen through
+write hooks on the bus pages holding cached code, so stores anywhere else
+cost nothing extra. CLI and PLP end a block as well, so an IRQ held off
+by the I flag is taken right after them. Only plain RAM and ROM pages are
+decoded, code running from devices or unmapped space is single-stepped.
+
+``processorCycles`` is only brought up to date at the end of a block, so
+an instruction whose zero page or absolute operand lies on a device page
+gets a block of its own: the device sees the same clock as under the
+other engines and an IRQ it raises is taken right after the access.
+Devices reached through indirect addressing see the cycle the block
+started on.
+
+Blocks heading an idle loop (see ``be6502emu.idle``) carry the loop, and
+unless ``skip_idle`` is off the engine fast-forwards over its iterations;
+``skipped`` counts the cycles saved that way.
+
+Instructions with an operand known at decode time are bound through the
+``make_0xNN`` factories of ``be6502emu.codegen``, every other instruction
+calls its generated handler directly.
+"""
+
+from be6502emu.codegen import SIZES, handlers
+from be6502emu.idle import find_loop
+
+# instructions which leave the program counter somewhere else
+JUMPS = frozenset(("BRK", "JSR", "RTI", "RTS", "JMP", "WAI", "STP", "???"))
+
+# instructions which write memory (including the stack)
+STORES = frozenset((
+    "STA", "STX", "STY", "STZ", "TSB", "TRB", "PHA", "PHP", "PHX", "PHY",
+    "RMB0", "RMB1", "RMB2", "RMB3", "RMB4", "RMB5", "RMB6", "RMB7",
+    "SMB0", "SMB1", "SMB2", "SMB3", "SMB4", "SMB5", "SMB6", "SMB7",
+))
+MODIFIES = frozenset(("ASL", "LSR", "ROL", "ROR", "INC", "DEC"))
+
+# instructions which may clear I, after which a pending IRQ is taken
+UNMASKS = frozenset(("CLI", "PLP"))
+
+
+class Block:
+    """A decoded straight-line run of instructions."""
+
+    __slots__ = ("start", "end", "ops", "count", "cycles", "headcycles",
+                 "inner", "exit", "loop")
+
+    def __init__(self, start, end, ops, cycles, headcycles, inner, exit):
+        self.start = start
+        self.end = end
+        # (handler, operand address) per instruction
+        self.ops = ops
+        self.count = len(ops)
+        # summed base cycles and worst case cycles before the last opcode
+        self.cycles = cycles
+        self.headcycles = headcycles
+        # addresses of every instruction but the first
+        self.inner = inner
+        # fixed address after the block, None when the last handler jumps
+        # or otherwise sets the program counter itself
+        self.exit = exit
+        # the idle loop starting here, if any
+        self.loop = None
+
+
+class BlockCache:
+    """Decoded blocks of one MPU, invalidated by stores into their code."""
+
+    def __init__(self, mpu, max_length=32, skip_idle=True):
+        self.mpu = mpu
+        self.bus = mpu.bus
+        self.max_length = max_length
+        self.blocks = {}
+        self.pages = {}  # page -> start addresses of blocks touching it
+        self.factories = handlers(type(mpu))[1]
+        self.skip_idle = skip_idle
+        self.built = 0
+        self.invalidated = 0
+        self.skipped = 0  # cycles
+        self.runs = 0
+
+    def _written(self, addr, value):
+        self.invalidate(addr)
+
+    def invalidate(self, start, end=None):
+        """Drop the blocks overlapping ``start`` (up to ``end``)."""
+        if end is None:
+            end = start + 1
+        for page in range(start >> 8, ((end - 1) >> 8) + 1):
+            for pc in tuple(self.pages.get(page, ())):
+                block = self.blocks[pc]
+                if block.start < end and start < block.end:
+                    self._drop(block)
+
+    def clear(self):
+        for page in self.pages:
+            self.bus.remove_write_hook(page, self._written)
+        self.blocks.clear()
+        self.pages.clear()
+
+    def _drop(self, block):
+        del self.blocks[block.start]
+        for page in range(block.start >> 8, ((block.end - 1) >> 8) + 1):
+            starts = self.pages[page]
+            starts.discard(block.start)
+            if not starts:
+                del self.pages[page]
+                self.bus.remove_write_hook(page, self._written)
+        self.invalidated += 1
+
+    def build(self, start):
+        """Decode the block at ``start``, None if it cannot be cached."""
+        mpu = self.mpu
+        bus = self.bus
+        storage = bus.storage
+        ops: list[tuple[object, int]] = []
+        inner = []
+        cycles = 0
+        headcycles = 0
+        worst = 0
+        pc = start
+
+        def plain(addr):
+            page = addr >> 8
+            return bus.devices[page] is None and bus.mapped[page]
+
+        def memory(addr):
+            return storage[addr >> 8][addr & 0xFF]
+
+        def device(mode, operand):
+            devices = bus.devices
+            if mode in ("zpg", "zpx", "zpy"):
+                return devices[0] is not None
+            if mode not in ("abs", "abx", "aby"):
+                return False
+            target = memory(operand) + (memory(operand + 1) << 8)
+            if devices[target >> 8] is not None:
+                return True
+            return mode != "abs" and devices[((target + 0xFF) >> 8) & 0xFF] \
+                is not None
+
+        while len(ops) < self.max_length:
+            if not plain(pc):
+                break
+            opcode = memory(pc)
+            name, mode = mpu.disassemble[opcode]
+            size = SIZES[mode]
+            if pc + size >= mpu.addrMask:
+                break  # never wrap around the address space
+            if not plain(pc + size):
+                break
+            isolated = device(mode, pc + 1)
+            if isolated and ops:
+                break
+            if ops:
+                inner.append(pc)
+                headcycles += worst
+
+            operand = pc + 1
+            nxt = operand + size
+            jumps = name in JUMPS or mode == "rel"
+            factory = self.factories[opcode]
+            if factory is None:
+                handler = mpu.instruct[opcode]
+            elif mode == "rel":
+                offset = memory(operand)
+                if offset & mpu.NEGATIVE:
+                    target = nxt - (offset ^ mpu.byteMask) - 1
+                else:
+                    target = nxt + offset
+                extra = 2 if (nxt ^ target) & mpu.addrHighMask else 1
+                handler = factory(operand, target & mpu.addrMask, nxt, extra)
+            else:
+                if mode == "imm":
+                    addr = operand
+                elif mode == "zpg":
+                    addr = memory(operand)
+                else:
+                    addr = memory(operand) + (memory(operand + 1) << 8)
+                handler = factory(operand, addr, nxt, 0)
+            ops.append((handler, operand))
+            cycles += mpu.cycletime[opcode]
+            worst = mpu.cycletime[opcode]
+            if mpu.extracycles[opcode]:
+                worst += 1
+            pc = nxt
+
+            if jumps or isolated:
+                break
+            if name in STORES or (name in MODIFIES and mode != "acc"):
+                break
+            if name in UNMASKS:
+                break
+
+        if not ops:
+            return None
+
+        block = Block(start, pc, tuple(ops), cycles, headcycles,
+                      frozenset(inner), None if jumps else pc)
+        block.loop = find_loop(mpu, bus, start)
+        if block.loop is not None:
+            # stores into any part of the loop drop the block
+            pc = block.end = max(pc, block.loop.end)
+        self.blocks[start] = block
+        for page in range(start >> 8, ((pc - 1) >> 8) + 1):
+            if page not in self.pages:
+                self.pages[page] = set()
+                bus.add_write_hook(page, self._written)
+            self.pages[page].add(start)
+        self.built += 1
+        return block
+
+    def run(self, limit, stop):
+        """Block engine counterpart of ``MPU._run``."""
+        mpu = self.mpu
+        scheduler = mpu.scheduler
+        blocks = self.blocks
+        build = self.build
+        step = mpu._step
+        addrMask = mpu.addrMask
+        skip_idle = self.skip_idle
+        run = self.runs = self.runs + 1
+        count = 0
+
+        while True:
+            pc = mpu.pc
+            block = blocks.get(pc)
+            if block is None:
+                block = build(pc)
+            if skip_idle and block is not None and block.loop is not None:
+                skipped = block.loop.skip(mpu, count, limit, stop, run)
+                if skipped:
+                    count += skipped
+                    self.skipped += \
+                        skipped // block.loop.length * block.loop.period
+
+            if (block is None
+                    or 0 <= limit < count + block.count
+                    or stop in block.inner
+                    or mpu.processorCycles + block.headcycles
+                    >= scheduler.deadline):
+                # single step near a limit to stop exactly where run() would
+                step()
+                count += 1
+            else:
+                mpu.excycles = 0
+                for handler, operand in block.ops:
+                    mpu.pc = operand
+                    handler(mpu)
+                if block.exit is None:
+                    mpu.pc &= addrMask
+                else:
+                    mpu.pc = block.exit
+                mpu.processorCycles += block.cycles + mpu.excycles
+                count += block.count
+
+            if mpu.waiting or mpu.stopped:
+                return count, "halted"
+            if mpu.pc == stop:
+                return count, "until_pc"
+            if count == limit:
+                return count, "instructions"
+            if mpu.processorCycles >= scheduler.deadline:
+                return count, "deadline"
@@ -0,0 +1,505 @@
+"""Paged 64K address space with RAM, ROM and memory mapped devices.
+
+The address space is split into 256 pages of 256 bytes. ``readPages`` and
+``writePages`` hold one entry per page which the processor indexes as
+``readPages[addr >> 8][addr & 0xFF]``:
+
+* RAM and ROM pages are slices of a byte buffer, so plain memory is read
+  and written without any Python level call. Writes to ROM pages land in
+  a scratch page and are dropped.
+* Device pages dispatch to ``device.read(addr)`` and
+  ``device.write(addr, value)`` with the full 16-bit address; devices
+  decode (and mirror) their registers from it themselves.
+* Pages with hooks installed (see ``add_read_hook``/``add_write_hook``)
+  call every hook before falling through to their mapping, so tools like
+  the block cache or watchpoints only slow down the pages they watch.
+* Pages shared with a fork (see ``fork``) are read directly and copied on
+  the first write, after which they are plain memory again.
+
+While every page is RAM at its own address ``flat`` is the buffer itself,
+which the processor then indexes with the address alone; ``listeners``
+are called whenever that changes.
+"""
+
+import copy
+from typing import Any
+
+PAGE_SIZE = 0x100
+PAGES = 0x100
+
+
+class DevicePage:
+    """Page entry forwarding accesses to a device."""
+
+    __slots__ = ("device", "base")
+
+    def __init__(self, device, base):
+        self.device = device
+        self.base = base
+
+    def __getitem__(self, offset):
+        return self.device.read(self.base | offset)
+
+    def __setitem__(self, offset, value):
+        self.device.write(self.base | offset, value)
+
+
+class SequencePage:
+    """Page entry over a plain sequence (e.g. a list) used as memory."""
+
+    __slots__ = ("sequence", "base")
+
+    def __init__(self, sequence, base):
+        self.sequence = sequence
+        self.base = base
+
+    def __getitem__(self, offset):
+        return self.sequence[self.base + offset]
+
+    def __setitem__(self, offset, value):
+        self.sequence[self.base + offset] = value
+
+
+class CopyOnWritePage:
+    """Write entry of a page shared with a fork, copying it first."""
+
+    __slots__ = ("bus", "page")
+
+    def __init__(self, bus, page):
+        self.bus = bus
+        self.page = page
+
+    def __setitem__(self, offset, value):
+        self.bus.own(self.page)[offset] = value
+
+
+class PagedMemory:
+    """The backing store of a forked bus seen as one 64K buffer.
+
+    Stands in for the original buffer, which the pages have moved away
+    from; slices are copies.
+    """
+
+    __slots__ = ("bus",)
+
+    def __init__(self, bus):
+        self.bus = bus
+
+    def __len__(self):
+        return PAGES * PAGE_SIZE
+
+    def __bytes__(self):
+        return b"".join(bytes(_contents(page)) for page in self.bus.home)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            return bytes(self)[start:stop:step]
+        return self.bus.home[index >> 8][index & 0xFF]
+
+    def __setitem__(self, index, value):
+        bus = self.bus
+        if not isinstance(index, slice):
+            bus.own_home(index >> 8)[index & 0xFF] = value
+            return
+        start, stop, step = index.indices(len(self))
+        value = bytes(value)
+        if step != 1 or len(value) != stop - start:
+            raise ValueError("only contiguous slices of the same length"
+                             " can be assigned")
+        offset = 0
+        while start + offset < stop:
+            addr = start + offset
+            page = addr >> 8
+            first = addr & 0xFF
+            count = min(PAGE_SIZE - first, stop - addr)
+            data = value[offset:offset + count]
+            # pages already holding the data stay shared
+            if _contents(bus.home[page])[first:first + count] != data:
+                bus.own_home(page)[first:first + count] = data
+            offset += count
+
+
+def _contents(page):
+    if isinstance(page, SequencePage):
+        return bytes(page[offset] for offset in range(PAGE_SIZE))
+    return bytes(page)
+
+
+class HookedReadPage:
+    """Page entry calling ``hook(addr, value)`` after every read."""
+
+    __slots__ = ("bus", "page", "base", "hooks")
+
+    def __init__(self, bus, page, hooks):
+        self.bus = bus
+        self.page = page
+        self.base = page << 8
+        self.hooks = hooks
+
+    def __getitem__(self, offset):
+        value = self.bus.read_base(self.page)[offset]
+        for hook in tuple(self.hooks):
+            hook(self.base | offset, value)
+        return value
+
+
+class HookedWritePage:
+    """Page entry calling ``hook(addr, value)`` before every write."""
+
+    __slots__ = ("bus", "page", "base", "hooks")
+
+    def __init__(self, bus, page, hooks):
+        self.bus = bus
+        self.page = page
+        self.base = page << 8
+        self.hooks = hooks
+
+    def __setitem__(self, offset, value):
+        for hook in tuple(self.hooks):
+            hook(self.base | offset, value)
+        # the hooks may have remapped the page, look it up again
+        self.bus.write_base(self.page)[offset] = value
+
+
+def _check_range(start, end):
+    if start % PAGE_SIZE or end % PAGE_SIZE \
+            or not 0 <= start < end <= PAGES * PAGE_SIZE:
+        raise ValueError("range $%04X-$%04X is not page aligned"
+                         % (start, end))
+    return range(start >> 8, end >> 8)
+
+
+class Bus:
+    """The 64K address space of one processor."""
+
+    def __init__(self, memory=None):
+        # backing store, every page is RAM at its own address to begin with
+        size = PAGES * PAGE_SIZE
+        if memory is None:
+            memory = bytearray(size)
+        elif not isinstance(memory, bytearray):
+            try:
+                memory = memoryview(memory).cast("B")
+            except TypeError:
+                pass  # plain sequences such as lists are used as they are
+        if len(memory) < size:
+            raise ValueError("memory must hold at least %d bytes" % size)
+        self.memory = memory
+
+        if isinstance(memory, (bytearray, memoryview)):
+            view = memoryview(memory)
+            self.storage: list[Any] = [
+                view[page << 8:(page + 1) << 8] for page in range(PAGES)]
+        else:
+            self.storage = [SequencePage(memory, page << 8)
+                            for page in range(PAGES)]
+        self.home = list(self.storage)
+
+        self.devices: list[Any] = [None] * PAGES
+        self.readonly = bytearray(PAGES)
+        self.mapped = bytearray(b"\x01" * PAGES)
+        self.readHooks: dict[int, list[Any]] = {}
+        self.writeHooks: dict[int, list[Any]] = {}
+        # ids of pages shared with forks
+        self.shared: set[int] = set()
+
+        # dropped writes and unmapped reads
+        self.scratch = bytearray(PAGE_SIZE)
+        self.openBus = bytes(PAGE_SIZE)
+
+        self.readPages: list[Any] = list(self.storage)
+        self.writePages: list[Any] = list(self.storage)
+        # pages whose entries are not their own RAM, see flat
+        self.irregular: set[int] = set()
+        self.listeners: list[Any] = []
+
+    # mapping
+
+    def map_ram(self, start, end):
+        """Map ``start``-``end`` (exclusive, page aligned) to RAM."""
+        for page in _check_range(start, end):
+            self.storage[page] = self.home[page]
+            self._map(page, None, False)
+
+    def map_rom(self, start, end, data=None):
+        """Map ``start``-``end`` to read-only memory holding ``data``."""
+        pages = _check_range(start, end)
+        for page in pages:
+            self.storage[page] = self.home[page]
+            self._map(page, None, True)
+        if data is not None:
+            if len(data) > end - start:
+                raise ValueError("ROM image does not fit $%04X-$%04X"
+                                 % (start, end))
+            self.load(start, data)
+
+    def map_device(self, start, end, device):
+        """Route every access to ``start``-``end`` to ``device``."""
+        for page in _check_range(start, end):
+            self._map(page, device, False)
+
+    def unmap(self, start, end):
+        """Make ``start``-``end`` read as zero and ignore writes."""
+        for page in _check_range(start, end):
+            self._map(page, None, False, mapped=False)
+
+    def mirror(self, start, end, source, size=None):
+        """Repeat the mapping of ``source`` (``size`` bytes) over a range.
+
+        ``size`` defaults to the length of the mirrored range.
+        """
+        pages = _check_range(start, end)
+        if size is None:
+            size = end - start
+        sources = _check_range(source, source + size)
+        for index, page in enumerate(pages):
+            src = sources[index % len(sources)]
+            self.storage[page] = self.storage[src]
+            self._map(page, self.devices[src], bool(self.readonly[src]),
+                      mapped=bool(self.mapped[src]))
+
+    def _map(self, page, device, readonly, mapped=True):
+        self.devices[page] = device
+        self.readonly[page] = readonly
+        self.mapped[page] = mapped
+        self.refresh(page)
+
+    def read_base(self, page):
+        """Page entry serving reads of ``page``, ignoring hooks."""
+        device = self.devices[page]
+        if device is not None:
+            return DevicePage(device, page << 8)
+        if not self.mapped[page]:
+            return self.openBus
+        return self.storage[page]
+
+    def write_base(self, page):
+        """Page entry serving writes to ``page``, ignoring hooks."""
+        device = self.devices[page]
+        if device is not None:
+            return DevicePage(device, page << 8)
+        if self.readonly[page] or not self.mapped[page]:
+            return self.scratch
+        if id(self.storage[page]) in self.shared:
+            return CopyOnWritePage(self, page)
+        return self.storage[page]
+
+    def refresh(self, page):
+        """Recompute the entries of ``page`` after a mapping change."""
+        hooks = self.readHooks.get(page)
+        if hooks:
+            self.readPages[page] = HookedReadPage(self, page, hooks)
+        else:
+            self.readPages[page] = self.read_base(page)
+        hooks = self.writeHooks.get(page)
+        if hooks:
+            self.writePages[page] = HookedWritePage(self, page, hooks)
+        else:
+            self.writePages[page] = self.write_base(page)
+        irregular = self.irregular
+        was_flat = not irregular
+        home = self.home[page]
+        if self.readPages[page] is home and self.writePages[page] is home:
+            irregular.discard(page)
+        else:
+            irregular.add(page)
+        if was_flat != (not irregular):
+            self._changed()
+
+    @property
+    def flat(self):
+        """The buffer of all 64K while every page is plain RAM at its own
+        address, so ``flat[addr]`` is the byte at ``addr``, else None."""
+        if self.irregular or isinstance(self.memory, PagedMemory):
+            return None
+        return self.memory
+
+    def _changed(self):
+        for listener in self.listeners:
+            listener()
+
+    # forks
+
+    def fork(self):
+        """Return a copy of this bus sharing its memory copy-on-write.
+
+        Both buses keep reading the same pages until one of them writes
+        to a page, which then gets a private copy first, so forking costs
+        nothing per byte. ``memory`` of both becomes a ``PagedMemory``.
+        Hooks are not carried over and devices are shared, remap them on
+        the copy as needed.
+        """
+        # every storage entry is the home of some page
+        self.shared.update(map(id, self.home))
+        self.memory = PagedMemory(self)
+        storage = self.storage
+        writes = self.writePages
+        for page in range(PAGES):
+            if writes[page] is storage[page]:
+                writes[page] = CopyOnWritePage(self, page)
+
+        self._changed()  # no longer flat
+
+        child = copy.copy(self)
+        child.memory = PagedMemory(child)
+        child.irregular = set(self.irregular)
+        child.listeners = []
+        child.storage = list(storage)
+        child.home = list(self.home)
+        child.devices = list(self.devices)
+        child.readonly = bytearray(self.readonly)
+        child.mapped = bytearray(self.mapped)
+        child.readHooks = {}
+        child.writeHooks = {}
+        child.shared = set(self.shared)
+        # the entries of unhooked pages only depend on the mapping
+        child.readPages = list(self.readPages)
+        for page in self.readHooks:
+            child.readPages[page] = child.read_base(page)
+        child.writePages = writes = list(writes)
+        for page, entry in enumerate(writes):
+            if type(entry) is CopyOnWritePage:
+                writes[page] = CopyOnWritePage(child, page)
+            elif type(entry) is HookedWritePage:
+                writes[page] = child.write_base(page)
+        return child
+
+    def own(self, page):
+        """Give the storage of ``page`` a private copy if it is shared."""
+        shared = self.storage[page]
+        if id(shared) not in self.shared:
+            return shared
+        private = bytearray(_contents(shared))
+        self.shared.discard(id(shared))
+        for pages in (self.home, self.storage):
+            for index, entry in enumerate(pages):
+                if entry is shared:
+                    pages[index] = private
+        for index in range(PAGES):
+            if self.storage[index] is private:
+                self.refresh(index)
+        return private
+
+    def own_home(self, page):
+        """Like ``own`` for the backing store at ``page``'s address."""
+        shared = self.home[page]
+        if id(shared) not in self.shared:
+            return shared
+        for index in range(PAGES):
+            if self.storage[index] is shared:
+                return self.own(index)
+        private = bytearray(_contents(shared))
+        self.shared.discard(id(shared))
+        self.home[page] = private
+        return private
+
+    # hooks
+
+    def add_read_hook(self, page, hook):
+        self.readHooks.setdefault(page, []).append(hook)
+        self.refresh(page)
+
+    def remove_read_hook(self, page, hook):
+        self._remove(self.readHooks, page, hook)
+
+    def add_write_hook(self, page, hook):
+        self.writeHooks.setdefault(page, []).append(hook)
+        self.refresh(page)
+
+    def remove_write_hook(self, page, hook):
+        self._remove(self.writeHooks, page, hook)
+
+    def _remove(self, hooks, page, hook):
+        installed = hooks[page]
+        installed.remove(hook)
+        if not installed:
+            del hooks[page]
+        self.refresh(page)
+
+    # bulk access, bypassing devices, hooks and write protection
+
+    def load(self, address, data):
+        """Copy the bytes of ``data`` into the backing store at ``address``.
+
+        ROM pages are written too, which is how images get loaded.
+        """
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data)
+        data = memoryview(data).cast("B")
+        offset = 0
+        while offset < len(data):
+            addr = address + offset
+            page = self.own(addr >> 8)
+            start = addr & 0xFF
+            count = min(PAGE_SIZE - start, len(data) - offset)
+            if isinstance(page, SequencePage):
+                for index in range(count):
+                    page[start + index] = data[offset + index]
+            else:
+                page[start:start + count] = data[offset:offset + count]
+            offset += count
+
+    def dump(self, address=0, length=None):
+        """Return ``length`` bytes of backing store from ``address``.
+
+        While the range is backed by the original buffer at its own
+        addresses this is a zero-copy read-only view, otherwise a copy.
+        """
+        if length is None:
+            length = PAGES * PAGE_SIZE - address
+        end = address + length
+        pages = range(address >> 8, ((end - 1) >> 8) + 1) if length else ()
+        if isinstance(self.memory, (bytearray, memoryview)) and all(
+                self.storage[page] is self.home[page] for page in pages):
+            return memoryview(self.memory)[address:end].toreadonly()
+        data = bytearray()
+        for page in pages:
+            storage = self.storage[page]
+            data += bytes(storage[offset] for offset in range(PAGE_SIZE)) \
+                if isinstance(storage, SequencePage) else storage
+        start = address - ((address >> 8) << 8)
+        return memoryview(bytes(data[start:start + length]))
+
+    def __bytes__(self):
+        return bytes(self.dump())
+
+    def __len__(self):
+        return PAGES * PAGE_SIZE
+
+    # processor view, going through devices and hooks
+
+    def __getitem__(self, addr):
+        if isinstance(addr, slice):
+            return bytes(self[index]
+                         for index in range(*addr.indices(len(self))))
+        return self.readPages[addr >> 8][addr & 0xFF]
+
+    def __setitem__(self, addr, value):
+        if isinstance(addr, slice):
+            indices = range(*addr.indices(len(self)))
+            values = list(value)
+            if len(values) != len(indices):
+                raise ValueError("slice assignment cannot resize memory")
+            for index, byte in zip(indices, values):
+                self[index] = byte
+            return
+        self.writePages[addr >> 8][addr & 0xFF] = value
+
+
+def ben_eater(rom=None, via=None):
+    """Bus of Ben Eater's 6502 computer.
+
+    * $0000-$3FFF: 16K of RAM
+    * $4000-$5FFF: unmapped
+    * $6000-$7FFF: the 6522 VIA, its 16 registers mirrored over the range
+    * $8000-$FFFF: 32K of ROM, loaded from ``rom`` when given
+    """
+    bus = Bus()
+    bus.unmap(0x4000, 0x6000)
+    if via is None:
+        bus.unmap(0x6000, 0x8000)
+    else:
+        bus.map_device(0x6000, 0x8000, via)
+    bus.map_rom(0x8000, 0x10000, rom)
+    return bus
@@ -0,0 +1,421 @@
+"""Generate flat per-opcode handlers from the MPU instruction table.
+
+The reference handlers in ``mpu.py`` dispatch through ``op*`` helpers and
+addressing-mode methods, costing several Python frames per instruction.
+This module emits Python source for one self-contained function per opcode
+from the ``@instruction(name, mode, cycles)`` metadata, with the register
+masks and flag bits folded into literals, and compiles it on first use.
+Flag results come from the lookup tables of ``be6502emu.alu``.
+
+Two flavours are produced for every opcode:
+
+* ``inst_0xNN(self)`` with the same contract as the reference handler
+  (``self.pc`` points at the operand, the handler advances it);
+* ``make_0xNN(pc, addr, nxt, extra)`` for modes whose operand is known at
+  decode time (``imm``, ``zpg``, ``abs``, ``rel``). It returns a closure with
+  the operand address ``pc``, effective address or branch target ``addr``,
+  the address of the next instruction ``nxt`` and the taken-branch cycle
+  penalty ``extra`` bound, which the block engine caches per instruction.
+  These closures never advance ``self.pc`` unless the instruction jumps.
+"""
+
+from be6502emu import alu
+
+FACTORY_MODES = frozenset(("imm", "zpg", "abs", "rel"))
+ZERO_PAGE_MODES = frozenset(("zpg", "zpx", "zpy"))
+
+SIZES = {
+    "imp": 0, "acc": 0,
+    "imm": 1, "zpg": 1, "zpx": 1, "zpy": 1, "inx": 1, "iny": 1, "zpi": 1,
+    "rel": 1,
+    "abs": 2, "abx": 2, "aby": 2, "ind": 2, "iax": 2,
+}
+
+_handlers: dict[type, tuple[list[object], list[object]]] = {}
+
+
+def _constants(cls):
+    return {
+        "N": cls.NEGATIVE, "V": cls.OVERFLOW, "U": cls.UNUSED,
+        "B": cls.BREAK, "D": cls.DECIMAL, "I": cls.INTERRUPT,
+        "Z": cls.ZERO, "C": cls.CARRY,
+        "BYTE": (1 << cls.BYTE_WIDTH) - 1,
+        "ADDR": (1 << cls.ADDR_WIDTH) - 1,
+        "HIGH": ((1 << cls.BYTE_WIDTH) - 1) << cls.BYTE_WIDTH,
+        "SP": 1 << cls.BYTE_WIDTH,
+        "W": cls.BYTE_WIDTH,
+        "IRQ": cls.IRQ,
+    }
+
+
+class _Emitter:
+    """Builds the body of one handler from its mnemonic and mode."""
+
+    def __init__(self, k, name, mode, addcycles):
+        self.k = k
+        self.name = name
+        self.mode = mode
+        self.addcycles = addcycles
+        self.lines = []
+
+    def emit(self, *lines):
+        for line in lines:
+            self.lines.append(line.format(**self.k))
+
+    def nz(self, reg):
+        self.emit("self.p = (self.p & ~({Z} | {N})) | NZ[%s]" % reg)
+
+    def unmask(self):
+        # I may have been cleared under an asserted IRQ line, see MPU.run
+        self.emit("if self.irqSources:",
+                  "    self.scheduler.poll()")
+
+    # memory goes through the page tables of the bus, ``rd`` and ``wr``
+
+    def read(self, expr):
+        if expr == "addr" and self.mode in ZERO_PAGE_MODES:
+            return "rd[0][addr]"
+        if not expr.isidentifier():
+            expr = "(%s)" % expr
+        return "rd[%s >> {W}][%s & {BYTE}]" % (expr, expr)
+
+    def store(self, expr, value):
+        if expr == "addr" and self.mode in ZERO_PAGE_MODES:
+            self.emit("wr[0][addr] = %s" % value)
+        else:
+            self.emit("wr[%s >> {W}][%s & {BYTE}] = %s" % (expr, expr, value))
+
+    def word(self, expr):
+        return "%s + (%s << {W})" % (self.read(expr), self.read(expr + " + 1"))
+
+    # addressing modes, compute ``addr`` from the operand at ``pc``
+
+    def address(self):
+        mode = self.mode
+        if mode == "imm":
+            self.emit("addr = pc")
+        elif mode == "zpg":
+            self.emit("addr = " + self.read("pc"))
+        elif mode == "zpx":
+            self.emit("addr = (self.x + %s) & {BYTE}" % self.read("pc"))
+        elif mode == "zpy":
+            self.emit("addr = (self.y + %s) & {BYTE}" % self.read("pc"))
+        elif mode == "inx":
+            self.emit("zp = (%s + self.x) & {BYTE}" % self.read("pc"),
+                      "addr = rd[0][zp] + (rd[0][(zp + 1) & {BYTE}] << {W})")
+        elif mode == "iny":
+            self.emit("zp = " + self.read("pc"),
+                      "base = rd[0][zp] + (rd[0][(zp + 1) & {BYTE}] << {W})",
+                      "addr = (base + self.y) & {ADDR}")
+            self.page_cross()
+        elif mode == "abs":
+            self.emit("addr = " + self.word("pc"))
+        elif mode in ("abx", "aby"):
+            reg = "self.x" if mode == "abx" else "self.y"
+            self.emit("base = " + self.word("pc"),
+                      "addr = (base + %s) & {ADDR}" % reg)
+            self.page_cross()
+        elif mode == "zpi":
+            self.emit("zp = " + self.read("pc"),
+                      "addr = " + self.word("zp"))
+        elif mode == "iax":
+            self.emit("addr = (%s + self.x) & {ADDR}" % self.word("pc"))
+        elif mode == "ind":
+            self.emit("addr = " + self.word("pc"))
+
+    def page_cross(self):
+        if self.addcycles:
+            self.emit("if (base ^ addr) & {HIGH}:",
+                      "    self.excycles += 1")
+
+    # stack helpers
+
+    def push(self, expr):
+        self.emit("sp = self.sp",
+                  "wr[1][sp] = (%s) & {BYTE}" % expr,
+                  "self.sp = (sp - 1) & {BYTE}")
+
+    def push_word(self, expr):
+        self.emit("word = %s" % expr)
+        self.push("word >> {W}")
+        self.push("word")
+
+    def pop(self, target):
+        self.emit("sp = self.sp = (self.sp + 1) & {BYTE}",
+                  "%s = rd[1][sp]" % target)
+
+    # operations, ``addr`` holds the effective address
+
+    def operand(self):
+        if self.mode == "acc":
+            self.emit("t = self.a")
+        else:
+            self.emit("t = " + self.read("addr"))
+
+    def result(self):
+        if self.mode == "acc":
+            self.emit("self.a = t")
+        else:
+            self.store("addr", "t")
+
+    def body(self):
+        name = self.name
+        if name in ("ORA", "AND", "EOR"):
+            operator = {"ORA": "|", "AND": "&", "EOR": "^"}[name]
+            self.emit("self.a = a = self.a %s %s"
+                      % (operator, self.read("addr")))
+            self.nz("a")
+        elif name in ("LDA", "LDX", "LDY"):
+            reg = name[2].lower()
+            self.emit("self.%s = t = %s" % (reg, self.read("addr")))
+            self.nz("t")
+        elif name in ("STA", "STX", "STY"):
+            self.store("addr", "self." + name[2].lower())
+        elif name == "STZ":
+            self.store("addr", "0")
+        elif name in ("CMP", "CPX", "CPY"):
+            reg = {"CMP": "a", "CPX": "x", "CPY": "y"}[name]
+            self.emit("self.p = (self.p & ~({C} | {Z} | {N})) | "
+                      "CMP[(self.%s << 8) | %s]" % (reg, self.read("addr")))
+        elif name == "BIT":
+            self.emit("t = " + self.read("addr"))
+            if self.mode == "imm":
+                self.emit("p = self.p & ~{Z}")
+            else:
+                self.emit("p = (self.p & ~({Z} | {N} | {V})) | "
+                          "(t & ({N} | {V}))")
+            self.emit("if (self.a & t) == 0:",
+                      "    p |= {Z}",
+                      "self.p = p")
+        elif name in ("ADC", "SBC"):
+            # tables are indexed by decimal flag, carry, A and operand
+            self.emit("p = self.p",
+                      "v = %s[((p & {D}) << 14) | ((p & {C}) << 16) | "
+                      "(self.a << 8) | %s]" % (name, self.read("addr")),
+                      "self.a = v & {BYTE}",
+                      "self.p = (p & ~({C} | {V} | {N} | {Z})) | (v >> 8)")
+        elif name in ("ASL", "LSR", "ROL", "ROR"):
+            self.operand()
+            if name in ("ROL", "ROR"):
+                self.emit("v = %s[((self.p & {C}) << 8) | t]" % name)
+            else:
+                self.emit("v = %s[t]" % name)
+            self.emit("t = v & {BYTE}",
+                      "self.p = (self.p & ~({C} | {N} | {Z})) | (v >> 8)")
+            self.result()
+        elif name in ("INC", "DEC"):
+            self.operand()
+            op = "+" if name == "INC" else "-"
+            self.emit("t = (t %s 1) & {BYTE}" % op)
+            self.nz("t")
+            self.result()
+        elif name in ("TSB", "TRB"):
+            self.emit("m = " + self.read("addr"),
+                      "a = self.a",
+                      "self.p = (self.p & ~{Z}) | (0 if m & a else {Z})")
+            if name == "TSB":
+                self.store("addr", "m | a")
+            else:
+                self.store("addr", "m & ~a")
+        elif name[:3] in ("RMB", "SMB"):
+            bit = 1 << int(name[3])
+            if name[:3] == "RMB":
+                self.store("addr", "%s & %d" % (self.read("addr"), 0xFF ^ bit))
+            else:
+                self.store("addr", "%s | %d" % (self.read("addr"), bit))
+        elif name in ("CLC", "CLD", "CLI", "CLV"):
+            flag = {"C": "{C}", "D": "{D}", "I": "{I}", "V": "{V}"}[name[2]]
+            self.emit("self.p &= ~%s" % flag)
+            if name == "CLI":
+                self.unmask()
+        elif name in ("SEC", "SED", "SEI"):
+            flag = {"C": "{C}", "D": "{D}", "I": "{I}"}[name[2]]
+            self.emit("self.p |= %s" % flag)
+        elif name in ("TAX", "TAY", "TXA", "TYA", "TSX"):
+            src = {"A": "a", "X": "x", "Y": "y", "S": "sp"}[name[1]]
+            dst = name[2].lower()
+            self.emit("self.%s = t = self.%s" % (dst, src))
+            self.nz("t")
+        elif name == "TXS":
+            self.emit("self.sp = self.x")
+        elif name in ("INX", "INY", "DEX", "DEY"):
+            reg = name[2].lower()
+            op = "+" if name[0] == "I" else "-"
+            self.emit("self.%s = t = (self.%s %s 1) & {BYTE}"
+                      % (reg, reg, op))
+            self.nz("t")
+        elif name in ("PHA", "PHX", "PHY"):
+            self.push("self.%s" % name[2].lower())
+        elif name == "PHP":
+            self.push("self.p | {B} | {U}")
+        elif name in ("PLA", "PLX", "PLY"):
+            reg = name[2].lower()
+            self.pop("t")
+            self.emit("self.%s = t" % reg)
+            self.nz("t")
+        elif name == "PLP":
+            self.pop("t")
+            self.emit("self.p = t | {B} | {U}")
+            self.unmask()
+        elif name == "NOP":
+            self.emit("pass")
+        elif name == "WAI":
+            self.emit("self.waiting = True")
+        elif name == "STP":
+            self.emit("self.stopped = True")
+        else:
+            raise KeyError(name)
+
+    # control flow, these set ``self.pc`` themselves
+
+    def jump(self, factory):
+        name = self.name
+        if name == "JMP":
+            if self.mode == "abs":
+                self.emit("self.pc = addr")
+            else:
+                self.emit("self.pc = " + self.word("addr"))
+        elif name == "JSR":
+            self.push_word("(pc + 1) & {ADDR}")
+            self.emit("self.pc = addr")
+        elif name == "RTS":
+            self.pop("lo")
+            self.pop("hi")
+            self.emit("self.pc = lo + (hi << {W}) + 1")
+        elif name == "RTI":
+            self.pop("t")
+            self.emit("self.p = t | {B} | {U}")
+            self.pop("lo")
+            self.pop("hi")
+            self.emit("self.pc = lo + (hi << {W})")
+            self.unmask()
+        elif name == "BRK":
+            self.push_word("(pc + 1) & {ADDR}")
+            self.emit("self.p |= {B}")
+            self.push("self.p | {B} | {U}")
+            self.emit("self.p = (self.p | {I}) & ~{D}",
+                      "self.pc = " + self.word("{IRQ}"))
+        else:
+            self.branch(factory)
+
+    def branch(self, factory):
+        name = self.name
+        flag, taken = {
+            "BPL": ("{N}", False), "BMI": ("{N}", True),
+            "BVC": ("{V}", False), "BVS": ("{V}", True),
+            "BCC": ("{C}", False), "BCS": ("{C}", True),
+            "BNE": ("{Z}", False), "BEQ": ("{Z}", True),
+            "BRA": (None, True),
+        }[name]
+        if flag is None:
+            self.emit("if True:")
+        elif taken:
+            self.emit("if self.p & %s:" % flag)
+        else:
+            self.emit("if not self.p & %s:" % flag)
+        if factory:
+            self.emit("    self.excycles += extra",
+                      "    self.pc = addr",
+                      "else:",
+                      "    self.pc = nxt")
+        else:
+            self.emit("    offset = " + self.read("pc"),
+                      "    nxt = pc + 1",
+                      "    if offset & {N}:",
+                      "        addr = nxt - (offset ^ {BYTE}) - 1",
+                      "    else:",
+                      "        addr = nxt + offset",
+                      "    if (nxt ^ addr) & {HIGH}:",
+                      "        self.excycles += 2",
+                      "    else:",
+                      "        self.excycles += 1",
+                      "    self.pc = addr & {ADDR}",
+                      "else:",
+                      "    self.pc = pc + 1")
+
+
+JUMPS = frozenset(("JMP", "JSR", "RTS", "RTI", "BRK"))
+
+
+def _is_jump(name, mode):
+    return name in JUMPS or mode == "rel"
+
+
+def handler_source(cls, opcode, factory=False):
+    """Return the source of the generated handler for ``opcode``."""
+    name, mode = cls.disassemble[opcode]
+    emitter = _Emitter(_constants(cls), name, mode, cls.extracycles[opcode])
+    if not factory and mode not in ("imp", "acc", "rel"):
+        emitter.address()
+    if _is_jump(name, mode):
+        emitter.jump(factory)
+    else:
+        emitter.body()
+        size = SIZES[mode]
+        if size and not factory:
+            emitter.emit("self.pc = pc + %d" % size)
+
+    body = emitter.lines
+    text = "\n".join(body)
+    prologue = []
+    if "rd[" in text:
+        prologue.append("rd = self.readPages")
+    if "wr[" in text:
+        prologue.append("wr = self.writePages")
+    if "pc" in text.replace("self.pc", "") and not factory:
+        prologue.append("pc = self.pc")
+
+    func = "inst_0x%02x" % opcode
+    if factory:
+        lines = ["def make_0x%02x(pc, addr, nxt, extra):" % opcode,
+                 "    def %s(self):" % func]
+        lines += ["        " + line for line in prologue + body]
+        lines.append("    return %s" % func)
+    else:
+        lines = ["def %s(self):" % func]
+        lines += ["    " + line for line in prologue + body]
+    return "\n".join(lines) + "\n"
+
+
+def generate_source(cls):
+    """Return the module source with every generated handler."""
+    chunks = ['"""Handlers generated by be6502emu.codegen for %s."""\n'
+              % cls.__name__]
+    for opcode in range(256):
+        name, mode = cls.disassemble[opcode]
+        if name == "???":
+            continue
+        chunks.append(handler_source(cls, opcode))
+        if mode in FACTORY_MODES:
+            chunks.append(handler_source(cls, opcode, factory=True))
+    return "\n\n".join(chunks)
+
+
+def handlers(cls):
+    """Compile (once per class) and return ``(instruct, factories)``.
+
+    ``instruct`` is a 256 entry handler table interchangeable with
+    ``cls.instruct``; opcodes without metadata keep the reference handler.
+    ``factories`` holds ``make_0xNN`` or None per opcode.
+    """
+    tables = _handlers.get(cls)
+    if tables is None:
+        namespace: dict[str, object] = {}
+        for name in alu.BUILDERS:
+            namespace[name] = alu.LazyTable(name, namespace)
+        code = compile(generate_source(cls), "<be6502emu.codegen>", "exec")
+        exec(code, namespace)
+        instruct = list(cls.instruct)
+        factories: list[object] = [None] * 256
+        for opcode in range(256):
+            instruct[opcode] = namespace.get("inst_0x%02x" % opcode,
+                                             instruct[opcode])
+            factories[opcode] = namespace.get("make_0x%02x" % opcode)
+        tables = _handlers[cls] = (instruct, factories)
+    return tables
+
+
+if __name__ == "__main__":
+    from be6502emu.mpu import MPU
+
+    print(generate_source(MPU))
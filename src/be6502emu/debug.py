@@ -0,0 +1,140 @@
+"""Breakpoints and watchpoints for ``MPU.run``.
+
+Both cost nothing while none is set. ``Breakpoints`` is a bitmap over the
+64K address space which the run loop only consults while it holds at
+least one address: it then single-steps through ``MPU._run_checked``
+instead of the engine, stopping once the program counter lands on a
+breakpoint (after at least one instruction, like ``until_pc``), the
+entry of an interrupt handler included.
+
+``Watchpoints`` hooks the bus pages a watched range covers (see
+``Bus.add_read_hook``), so every other page keeps its plain entry. A hit
+is recorded and pulls the scheduler deadline forward to the current
+cycle, which makes the engine return after the accessing instruction;
+the block engine finishes the block first, which ends at the first
+store anyway, so only watched reads may stop a few instructions late.
+
+A run stopping on either returns the reason "breakpoint" or "watchpoint"
+and a ``Hit`` in ``RunResult.hit``.
+"""
+
+from collections import namedtuple
+
+# kind is "execute", "read" or "write", value the byte read or written
+Hit = namedtuple("Hit", ["kind", "address", "value"])
+
+
+class Breakpoints:
+    """A set of addresses, kept as one bit per address."""
+
+    def __init__(self):
+        self.bits = bytearray(0x2000)
+        self.count = 0
+
+    def __contains__(self, addr):
+        return bool(self.bits[addr >> 3] >> (addr & 7) & 1)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return (addr for addr in range(0x10000) if addr in self)
+
+    def add(self, addr):
+        if not 0 <= addr <= 0xFFFF:
+            raise ValueError("$%X is outside the address space" % addr)
+        if addr not in self:
+            self.bits[addr >> 3] |= 1 << (addr & 7)
+            self.count += 1
+
+    def discard(self, addr):
+        if 0 <= addr <= 0xFFFF and addr in self:
+            self.bits[addr >> 3] &= ~(1 << (addr & 7))
+            self.count -= 1
+
+    def clear(self):
+        self.bits[:] = bytes(len(self.bits))
+        self.count = 0
+
+
+class Watchpoints:
+    """Address ranges of ``mpu`` whose reads or writes stop the run."""
+
+    def __init__(self, mpu):
+        self.mpu = mpu
+        self.bus = mpu.bus
+        self.watches = []  # (start, end, read, write)
+        # page -> ranges watched on it, per kind of access
+        self.reads: dict[int, list[tuple[int, int]]] = {}
+        self.writes: dict[int, list[tuple[int, int]]] = {}
+        self.hit: Hit | None = None
+
+    def __len__(self):
+        return len(self.watches)
+
+    def add(self, start, end=None, read=False, write=True):
+        """Watch ``start`` up to ``end`` (exclusive, one byte if None)."""
+        if end is None:
+            end = start + 1
+        if not 0 <= start < end <= 0x10000:
+            raise ValueError("invalid range $%X-$%X" % (start, end))
+        if not (read or write):
+            raise ValueError("a watchpoint needs read or write set")
+        self.watches.append((start, end, read, write))
+        for page in range(start >> 8, ((end - 1) >> 8) + 1):
+            if read:
+                self._watch(self.reads, self.bus.add_read_hook, page,
+                            self._read, (start, end))
+            if write:
+                self._watch(self.writes, self.bus.add_write_hook, page,
+                            self._written, (start, end))
+
+    def remove(self, start, end=None, read=False, write=True):
+        """Drop a watchpoint set by ``add`` with the same arguments."""
+        if end is None:
+            end = start + 1
+        self.watches.remove((start, end, read, write))
+        for page in range(start >> 8, ((end - 1) >> 8) + 1):
+            if read:
+                self._unwatch(self.reads, self.bus.remove_read_hook, page,
+                              self._read, (start, end))
+            if write:
+                self._unwatch(self.writes, self.bus.remove_write_hook, page,
+                              self._written, (start, end))
+
+    def reset(self):
+        """Forget the last hit, done by each ``MPU.run``."""
+        self.hit = None
+
+    def clear(self):
+        for watch in list(self.watches):
+            self.remove(*watch)
+
+    def _watch(self, ranges, add_hook, page, hook, watched):
+        if page not in ranges:
+            ranges[page] = []
+            add_hook(page, hook)
+        ranges[page].append(watched)
+
+    def _unwatch(self, ranges, remove_hook, page, hook, watched):
+        ranges[page].remove(watched)
+        if not ranges[page]:
+            del ranges[page]
+            remove_hook(page, hook)
+
+    def _read(self, addr, value):
+        self._check(self.reads, "read", addr, value)
+
+    def _written(self, addr, value):
+        self._check(self.writes, "write", addr, value)
+
+    def _check(self, ranges, kind, addr, value):
+        if self.hit is not None:
+            return  # the first access of an instruction wins
+        for start, end in ranges[addr >> 8]:
+            if start <= addr < end:
+                self.hit = Hit(kind, addr, value)
+                # the engines return at the next deadline check
+                mpu = self.mpu
+                mpu.scheduler.deadline = mpu.processorCycles
+                return
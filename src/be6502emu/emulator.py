@@ -0,0 +1,151 @@
+"""Command line front end running ROM images on the Ben Eater machine.
+
+    be6502emu a.out --cycles 5000000 --fast
+
+loads a 32K image as assembled with ``vasm -Fbin -dotdir`` into
+$8000-$FFFF, resets through the vector at $FFFC and runs it, in real
+time at ``--clock`` or as fast as possible, until a limit is reached or
+the processor executes STP. The LCD contents and the speed achieved are
+printed at exit.
+"""
+
+import argparse
+import time
+
+from be6502emu import gdbstub
+from be6502emu.machine import Machine
+from be6502emu.mpu import MPU, RunResult
+from be6502emu.throttle import Throttle
+
+ROM_SIZE = 0x8000
+CLOCK = 1000000
+STRIDE = 10000  # cycles per slice when unthrottled
+
+
+def load_rom(path):
+    """Read a raw image of the $8000-$FFFF window."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) != ROM_SIZE:
+        raise ValueError("%s: ROM image must be %d bytes, not %d"
+                         % (path, ROM_SIZE, len(data)))
+    return data
+
+
+def run(machine, cycles=None, instructions=None, throttle=None):
+    """Run ``machine`` until a limit, STP or a hit, paced by ``throttle``.
+
+    Without a ``Throttle`` the machine runs unthrottled. Returns the
+    total ``RunResult``, with the reason "interrupted" after Ctrl-C, and
+    the seconds it took. Breakpoints and watchpoints set on ``mpu`` stop
+    the run with their ``hit``.
+    """
+    mpu = machine.mpu
+    stride = throttle.stride if throttle is not None else STRIDE
+    start = mpu.processorCycles
+    started = time.perf_counter()
+    count = 0
+    result = None
+    if throttle is not None:
+        throttle.start(start)
+    while True:
+        done = mpu.processorCycles - start
+        budget = stride if cycles is None else min(stride, cycles - done)
+        left = None if instructions is None else instructions - count
+        try:
+            result = mpu.run(cycles=budget, instructions=left)
+        except KeyboardInterrupt:
+            reason = "interrupted"
+            break
+        count += result.instructions
+        reason = result.reason
+        if reason in ("instructions", "stopped", "breakpoint", "watchpoint"):
+            break
+        if reason == "waiting" and not len(machine.scheduler):
+            break  # nothing left that could wake it up
+        done += result.cycles
+        if throttle is not None:
+            throttle.pace(mpu.processorCycles)
+        if cycles is not None and done >= cycles:
+            reason = "cycles"
+            break
+    seconds = time.perf_counter() - started
+    hit = result.hit if result is not None else None
+    return RunResult(mpu.processorCycles - start, count, reason,
+                     hit), seconds
+
+
+def report(result, seconds, throttle=None, out=None):
+    seconds = max(seconds, 1e-9)
+    print("%d instructions, %d cycles in %.3fs (%s)"
+          % (result.instructions, result.cycles, seconds, result.reason),
+          file=out)
+    print("%.0f instructions/s, %.3f MHz"
+          % (result.instructions / seconds, result.cycles / seconds / 1e6),
+          file=out)
+    if throttle is not None:
+        stats = throttle.stats
+        print("drift over %d slices: mean %.3fms, rms %.3fms, worst %.3fms,"
+              " %d slips dropping %.3fs"
+              % (stats.slices, stats.mean * 1e3, stats.rms * 1e3,
+                 stats.worst * 1e3, stats.slips, stats.dropped), file=out)
+
+
+def _show(machine):
+    if machine.lcd is not None and machine.lcd.version:
+        for row in machine.lcd.text():
+            print("|%s|" % row)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="be6502emu", description="Run a ROM image on Ben Eater's 6502.")
+    parser.add_argument("rom", help="32K image of $8000-$FFFF")
+    parser.add_argument("-c", "--cycles", type=int,
+                        help="stop after this many cycles")
+    parser.add_argument("-n", "--instructions", type=int,
+                        help="stop after this many instructions")
+    parser.add_argument("--clock", type=float, default=CLOCK,
+                        help="clock in Hz to run at (default %(default)d)")
+    parser.add_argument("--fast", action="store_true",
+                        help="run as fast as possible")
+    parser.add_argument("--slice", type=float, default=0.01,
+                        help="seconds between throttle checks"
+                             " (default %(default)s)")
+    parser.add_argument("--catch-up", type=float, default=0.1,
+                        help="seconds of lag made up before dropping it"
+                             " (default %(default)s)")
+    parser.add_argument("--engine", choices=MPU.ENGINES, default="block",
+                        help="execution engine (default %(default)s)")
+    parser.add_argument("--lcd", choices=("8-bit", "4-bit", "none"),
+                        default="8-bit",
+                        help="LCD wiring (default %(default)s)")
+    parser.add_argument("--gdb", type=int, metavar="PORT",
+                        help="run under a GDB remote debugger attaching on"
+                             " localhost PORT instead, at full speed")
+    args = parser.parse_args(argv)
+    if args.clock <= 0 or args.slice <= 0:
+        parser.error("--clock and --slice must be positive")
+
+    try:
+        rom = load_rom(args.rom)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    lcd = None if args.lcd == "none" else args.lcd
+    machine = Machine(rom, engine=args.engine, lcd=lcd)
+    if machine.lcd is not None:
+        machine.lcd.clock = int(args.clock)
+
+    if args.gdb is not None:
+        print("waiting for a debugger on localhost:%d" % args.gdb)
+        gdbstub.serve(machine, args.gdb)
+        _show(machine)
+        return 0
+
+    throttle = None
+    if not args.fast:
+        throttle = Throttle(args.clock, args.slice, args.catch_up)
+    result, seconds = run(machine, args.cycles, args.instructions, throttle)
+    _show(machine)
+    report(result, seconds, throttle)
+    return 130 if result.reason == "interrupted" else 0
@@ -0,0 +1,263 @@
+"""GDB remote serial protocol stub.
+
+``GDBStub`` serves one debugger connection at a time on a localhost TCP
+port, on asyncio: a paused target just awaits the next packet, and a
+running one executes ``slice`` cycles between looks at the socket, where
+a Ctrl-C from the debugger interrupts it.
+
+Supported packets: ``?``, ``g``/``G`` (registers), ``m``/``M`` (memory),
+``c`` and ``s`` (continue and single step, optionally from an address),
+``Z0``/``z0`` breakpoints, ``Z2``/``Z3``/``Z4`` write, read and access
+watchpoints (see ``be6502emu.debug``), ``D`` and ``k``. Anything else is
+answered with an empty packet, which GDB takes as "not supported".
+
+GDB has no 6502 target description; registers are sent in the order A,
+X, Y, P, SP as a byte each and PC as a little endian word. Memory is read
+and written on the backing store (see ``Bus.dump`` and ``Bus.load``), so
+the debugger never triggers device side effects.
+"""
+
+import asyncio
+
+HOST = "127.0.0.1"
+LOCALHOST = ("127.0.0.1", "::1", "localhost")
+INTERRUPT = 0x03
+
+# stop replies
+TRAP = "S05"
+SIGINT = "S02"
+# Z type of a watchpoint: (read, write) and the name its stop reply uses
+ACCESSES = {"2": (False, True), "3": (True, False), "4": (True, True)}
+WATCHES = {"2": "watch", "3": "rwatch", "4": "awatch"}
+
+
+def checksum(data):
+    return sum(data) & 0xFF
+
+
+def packet(payload):
+    """Frame ``payload`` (str) as ``$payload#checksum``."""
+    data = payload.encode("latin-1")
+    return b"$%s#%02x" % (data, checksum(data))
+
+
+class GDBStub:
+    """Debugger front end of ``target``, an ``MPU`` or a ``Machine``."""
+
+    def __init__(self, target, slice=10000):
+        self.target = target
+        self.mpu = getattr(target, "mpu", target)
+        self.slice = slice
+        self.server = None
+        self.interrupted = False
+        self.detached = asyncio.Event()
+        # (start, end) -> Z types of the watchpoints set on the range
+        self.watches: dict[tuple[int, int], list[str]] = {}
+
+    async def start(self, port=0, host=HOST):
+        """Listen on ``host``:``port``, 0 for any free port.
+
+        Returns the port listened on.
+        """
+        if host not in LOCALHOST:
+            raise ValueError("the stub only listens on localhost")
+        self.server = await asyncio.start_server(self._session, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def serve(self, port=0, host=HOST):
+        """Serve until a debugger detaches or kills the target."""
+        await self.start(port, host)
+        try:
+            await self.detached.wait()
+        finally:
+            await self.close()
+
+    # connection
+
+    async def _session(self, reader, writer):
+        packets: asyncio.Queue[str | None] = asyncio.Queue()
+        receiving = asyncio.ensure_future(
+            self._receive(reader, writer, packets))
+        try:
+            while True:
+                payload = await packets.get()
+                if payload is None:
+                    break
+                reply = await self._dispatch(payload)
+                if reply is not None:
+                    writer.write(packet(reply))
+                    await writer.drain()
+                if payload[:1] in ("D", "k"):
+                    self.detached.set()
+                    break
+        finally:
+            receiving.cancel()
+            writer.close()
+
+    async def _receive(self, reader, writer, packets):
+        """Split the byte stream into packets, acknowledging each."""
+        buffer = bytearray()
+        while True:
+            data = await reader.read(4096)
+            if not data:
+                await packets.put(None)
+                return
+            buffer += data
+            while buffer:
+                if buffer[0] == INTERRUPT:
+                    self.interrupted = True
+                    del buffer[0]
+                elif buffer[0] != ord("$"):
+                    del buffer[0]  # acknowledgements and line noise
+                else:
+                    end = buffer.find(b"#")
+                    if end < 0 or len(buffer) < end + 3:
+                        break  # wait for the rest
+                    body = bytes(buffer[1:end])
+                    sent = buffer[end + 1:end + 3]
+                    del buffer[:end + 3]
+                    try:
+                        valid = int(sent, 16) == checksum(body)
+                    except ValueError:
+                        valid = False
+                    writer.write(b"+" if valid else b"-")
+                    if valid:
+                        await packets.put(body.decode("latin-1"))
+
+    # commands
+
+    async def _dispatch(self, payload):
+        command, args = payload[:1], payload[1:]
+        try:
+            if command == "?":
+                return TRAP
+            if command == "g":
+                return self._registers()
+            if command == "G":
+                return self._set_registers(args)
+            if command == "m":
+                return self._read(args)
+            if command == "M":
+                return self._write(args)
+            if command == "c":
+                return await self._continue(args)
+            if command == "s":
+                return self._step(args)
+            if command in ("Z", "z"):
+                return self._point(command == "Z", args)
+            if command == "D":
+                return "OK"
+            if command == "k":
+                return None
+            if command == "H":
+                return "OK"
+            if payload == "qAttached":
+                return "1"
+        except ValueError:
+            return "E01"
+        return ""
+
+    def _registers(self):
+        mpu = self.mpu
+        return bytes((mpu.a, mpu.x, mpu.y, mpu.p, mpu.sp, mpu.pc & 0xFF,
+                      mpu.pc >> 8)).hex()
+
+    def _set_registers(self, args):
+        values = bytes.fromhex(args)
+        if len(values) != 7:
+            raise ValueError("expected 7 register bytes")
+        mpu = self.mpu
+        mpu.a, mpu.x, mpu.y, mpu.p, mpu.sp = values[:5]
+        mpu.pc = values[5] | values[6] << 8
+        return "OK"
+
+    def _range(self, text):
+        addr, length = (int(part, 16) for part in text.split(","))
+        if not (0 <= addr and 0 <= length and addr + length <= 0x10000):
+            raise ValueError("range outside the address space")
+        return addr, length
+
+    def _read(self, args):
+        addr, length = self._range(args)
+        return bytes(self.mpu.bus.dump(addr, length)).hex()
+
+    def _write(self, args):
+        where, _, data = args.partition(":")
+        addr, length = self._range(where)
+        data = bytes.fromhex(data)
+        if len(data) != length:
+            raise ValueError("length does not match the data")
+        self.mpu.load(addr, data)
+        return "OK"
+
+    def _resume_at(self, args):
+        if args:
+            self.mpu.pc = int(args, 16) & 0xFFFF
+
+    def _step(self, args):
+        self._resume_at(args)
+        self.mpu.step()
+        return TRAP
+
+    async def _continue(self, args):
+        self._resume_at(args)
+        mpu = self.mpu
+        self.interrupted = False
+        while True:
+            result = mpu.run(cycles=self.slice)
+            if result.reason in ("breakpoint", "stopped"):
+                return TRAP
+            if result.reason == "watchpoint":
+                hit = result.hit
+                return "T05%s:%x;" % (self._watch_kind(hit), hit.address)
+            # let the debugger get a word in
+            await asyncio.sleep(0)
+            if self.interrupted:
+                return SIGINT
+
+    def _point(self, insert, args):
+        kind, addr, size = args.split(",")[:3]
+        addr, size = int(addr, 16), int(size, 16)
+        mpu = self.mpu
+        if kind in ("0", "1"):
+            if insert:
+                mpu.breakpoints.add(addr)
+            else:
+                mpu.breakpoints.discard(addr)
+            return "OK"
+        if kind in ACCESSES:
+            read, write = ACCESSES[kind]
+            end = min(addr + max(size, 1), 0x10000)
+            if insert:
+                mpu.watchpoints.add(addr, end, read=read, write=write)
+                self.watches.setdefault((addr, end), []).append(kind)
+            else:
+                mpu.watchpoints.remove(addr, end, read=read, write=write)
+                kinds = self.watches.get((addr, end), [])
+                if kind in kinds:
+                    kinds.remove(kind)
+                if not kinds:
+                    self.watches.pop((addr, end), None)
+            return "OK"
+        return ""
+
+    def _watch_kind(self, hit):
+        """The stop reply name of the watchpoint ``hit`` stopped on."""
+        read = hit.kind == "read"
+        for (start, end), kinds in self.watches.items():
+            if start <= hit.address < end:
+                for kind in kinds:
+                    if ACCESSES[kind][0 if read else 1]:
+                        return WATCHES[kind]
+        return "rwatch" if read else "watch"
+
+
+def serve(target, port, slice=10000):
+    """Serve ``target`` on localhost ``port`` until the debugger leaves."""
+    asyncio.run(GDBStub(target, slice).serve(port))
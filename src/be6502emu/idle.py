@@ -0,0 +1,162 @@
+"""Idle loop detection for the block engine.
+
+Firmware spends much of its time in loops waiting for something to
+happen: ``JMP *``, countdown loops such as ``DEX; BNE *-1`` or loops
+polling a device status register. ``find_loop`` recognises loops which
+store nothing and only read memory that cannot change before the next
+scheduler event, and ``Loop.skip`` advances the processor over whole
+iterations at once. Skipping stops short of the next deadline and of the
+run limits, so the result is identical to executing every iteration.
+
+Devices take part by implementing ``stable(addr)``, true when reading
+``addr`` again returns the same value without further side effects until
+the device's next scheduled event.
+"""
+
+from be6502emu.codegen import SIZES
+from be6502emu.scheduler import NEVER
+
+# instructions whose effect depends only on registers and memory reads
+PURE = frozenset((
+    "LDA", "LDX", "LDY", "AND", "ORA", "EOR", "CMP", "CPX", "CPY", "BIT",
+    "ADC", "SBC", "INX", "INY", "DEX", "DEY", "TAX", "TAY", "TXA", "TYA",
+    "TSX", "CLC", "SEC", "CLV", "CLD", "SED", "NOP",
+    "ASL", "LSR", "ROL", "ROR",
+))
+# modes with fixed cycle counts and addresses
+MODES = frozenset(("imp", "acc", "imm", "zpg", "abs"))
+SHIFTS = frozenset(("ASL", "LSR", "ROL", "ROR"))
+COUNTERS = {"INX": ("x", 1), "DEX": ("x", -1),
+            "INY": ("y", 1), "DEY": ("y", -1)}
+
+MAX_LENGTH = 8
+
+
+class Loop:
+    """A straight run of pure instructions branching back to ``start``."""
+
+    __slots__ = ("start", "end", "length", "period", "addresses", "counter",
+                 "mark")
+
+    def __init__(self, start, end, length, period, addresses, counter):
+        self.start = start
+        self.end = end
+        # instructions and cycles per iteration
+        self.length = length
+        self.period = period
+        self.addresses = addresses
+        # (register, step) of a DEX/DEY/INX/INY; BNE countdown, else None
+        self.counter = counter
+        # state at the head the last time round, see skip()
+        self.mark = None
+
+    def skip(self, mpu, count, limit, stop, run):
+        """Advance ``mpu``, standing at the loop head, by whole iterations.
+
+        ``count``, ``limit`` and ``stop`` are those of the running engine
+        loop, ``run`` identifies its invocation. Returns the number of
+        instructions skipped.
+        """
+        if stop in self.addresses:
+            return 0
+        counter = self.counter
+        if counter is None:
+            # registers repeat and nothing read can change before the next
+            # event: every further iteration is the same
+            mark = self.mark
+            state = self.mark = (run, count, mpu.a, mpu.x, mpu.y, mpu.p)
+            if (mark is None or mark[0] != run
+                    or mark[1] + self.length != count
+                    or mark[2:] != state[2:]):
+                return 0
+            iterations = NEVER
+        else:
+            # the last iteration, falling through the branch, is left to
+            # the engine
+            register, step = counter
+            value = getattr(mpu, register)
+            iterations = ((value if step < 0 else -value & 0xFF) or 256) - 1
+
+        deadline = mpu.scheduler.deadline
+        if deadline < NEVER:
+            room = deadline - mpu.processorCycles - 1
+            iterations = min(iterations, room // self.period)
+        if limit >= 0:
+            iterations = min(iterations, (limit - count - 1) // self.length)
+        if iterations <= 0 or iterations >= NEVER:
+            return 0
+
+        if counter is not None:
+            value = (value + step * iterations) & 0xFF
+            setattr(mpu, register, value)
+            mpu.p = (mpu.p & ~(mpu.ZERO | mpu.NEGATIVE)) | \
+                (value & mpu.NEGATIVE)
+        mpu.processorCycles += iterations * self.period
+        self.mark = None
+        return iterations * self.length
+
+
+def find_loop(mpu, bus, start):
+    """Return the idle ``Loop`` at ``start``, None if there is none."""
+    storage = bus.storage
+    devices = bus.devices
+    addresses: list[int] = []
+    period = 0
+    pc = start
+
+    def plain(addr):
+        page = addr >> 8
+        return devices[page] is None and bus.mapped[page]
+
+    def memory(addr):
+        return storage[addr >> 8][addr & 0xFF]
+
+    while len(addresses) < MAX_LENGTH:
+        if not plain(pc):
+            return None
+        opcode = memory(pc)
+        name, mode = mpu.disassemble[opcode]
+        size = SIZES[mode]
+        if pc + size >= mpu.addrMask or not plain(pc + size):
+            return None
+        operand = pc + 1
+        nxt = operand + size
+        addresses.append(pc)
+        period += mpu.cycletime[opcode]
+
+        if mode == "rel" or (name == "JMP" and mode == "abs"):
+            if mode == "rel":
+                offset = memory(operand)
+                if offset & mpu.NEGATIVE:
+                    target = nxt - (offset ^ mpu.byteMask) - 1
+                else:
+                    target = nxt + offset
+                period += 2 if (nxt ^ target) & mpu.addrHighMask else 1
+            else:
+                target = memory(operand) + (memory(operand + 1) << 8)
+            if target != start:
+                return None
+            counter = None
+            if name == "BNE":
+                body = [mpu.disassemble[memory(addr)][0]
+                        for addr in addresses[:-1]]
+                body = [other for other in body if other != "NOP"]
+                if len(body) == 1 and body[0] in COUNTERS:
+                    counter = COUNTERS[body[0]]
+            return Loop(start, nxt, len(addresses), period,
+                        frozenset(addresses), counter)
+
+        if name not in PURE or mode not in MODES:
+            return None
+        if name in SHIFTS and mode != "acc":
+            return None
+        if mode in ("zpg", "abs"):
+            addr = memory(operand)
+            if mode == "abs":
+                addr += memory(operand + 1) << 8
+            device = devices[addr >> 8]
+            if device is not None and not (
+                    hasattr(device, "stable") and device.stable(addr)):
+                return None
+        pc = nxt
+    return None
@@ -0,0 +1,114 @@
+"""Sampled per-opcode measurements of the emulator itself.
+
+Set ``mpu.instruments`` to an ``Instruments`` and ``MPU.run`` executes
+all but every ``interval``-th instruction through its engine as usual;
+that one instruction is single-stepped between two reads of a
+nanosecond timer. Per opcode, the samples taken, the host nanoseconds
+they spent (less the cost of reading the timer) and the emulated cycles
+they took are summed. Instruction counts are estimated as samples times
+``interval``, a prime by default so that sampling does not lock onto the
+period of a loop. With ``mpu.instruments`` None nothing is measured.
+
+``summary()`` aggregates the counters per opcode, per mnemonic and per
+addressing mode, using the ``MPU.disassemble`` table, and ``to_json()``
+exports that for comparing releases.
+"""
+
+import json
+import time
+from array import array
+
+VERSION = 1
+
+
+def _timer_overhead(timer, rounds=1000):
+    """Nanoseconds a pair of ``timer`` calls adds to a measurement."""
+    best = None
+    for _ in range(rounds):
+        start = timer()
+        elapsed = timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best or 0
+
+
+class Instruments:
+    """Counters per opcode, filled by sampling ``MPU.run``."""
+
+    def __init__(self, interval=101, timer=time.perf_counter_ns):
+        if interval < 1:
+            raise ValueError("interval must be at least 1")
+        self.interval = interval
+        self.timer = timer
+        self.overhead = _timer_overhead(timer)
+        self.disassemble = None
+        self.clear()
+
+    def clear(self):
+        self.samples = array("Q", bytes(8 * 256))
+        self.nanoseconds = array("Q", bytes(8 * 256))
+        self.cycles = array("Q", bytes(8 * 256))
+        self.instructions = 0  # executed in total while attached
+        self.countdown = self.interval - 1  # until the next sample
+
+    def sample(self, mpu):
+        """Single-step ``mpu``, measuring the instruction."""
+        if self.disassemble is None:
+            self.disassemble = mpu.disassemble
+        pc = mpu.pc
+        opcode = mpu.bus.storage[pc >> 8][pc & 0xFF]
+        cycles = mpu.processorCycles
+        timer = self.timer
+        start = timer()
+        mpu._step()
+        elapsed = timer() - start
+        self.samples[opcode] += 1
+        self.nanoseconds[opcode] += max(elapsed - self.overhead, 0)
+        self.cycles[opcode] += mpu.processorCycles - cycles
+        self.instructions += 1
+        self.countdown = self.interval - 1
+
+    def summary(self, disassemble=None):
+        """The counters as a dict, aggregated three ways.
+
+        ``disassemble`` defaults to the table of the MPU sampled.
+        """
+        disassemble = disassemble or self.disassemble
+        if disassemble is None:
+            raise ValueError("nothing sampled yet, pass disassemble")
+        opcodes = {}
+        mnemonics: dict[str, dict[str, float]] = {}
+        modes: dict[str, dict[str, float]] = {}
+        for opcode in range(256):
+            samples = self.samples[opcode]
+            if not samples:
+                continue
+            name, mode = disassemble[opcode]
+            counters = {
+                "samples": samples,
+                "instructions": samples * self.interval,
+                "nanoseconds": self.nanoseconds[opcode],
+                "cycles": self.cycles[opcode],
+            }
+            opcodes["0x%02X" % opcode] = dict(counters, mnemonic=name,
+                                              mode=mode)
+            for totals, key in ((mnemonics, name), (modes, mode)):
+                total = totals.setdefault(key, dict.fromkeys(counters, 0))
+                for counter, value in counters.items():
+                    total[counter] += value
+        for table in (opcodes, mnemonics, modes):
+            for counters in table.values():
+                counters["ns_per_instruction"] = round(
+                    counters["nanoseconds"] / counters["samples"], 1)
+        return {
+            "version": VERSION,
+            "interval": self.interval,
+            "instructions": self.instructions,
+            "samples": sum(self.samples),
+            "opcodes": opcodes,
+            "mnemonics": dict(sorted(mnemonics.items())),
+            "modes": dict(sorted(modes.items())),
+        }
+
+    def to_json(self, disassemble=None, **options):
+        """``summary()`` as JSON, ``options`` go to ``json.dumps``."""
+        return json.dumps(self.summary(disassemble), **options)
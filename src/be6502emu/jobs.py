@@ -0,0 +1,235 @@
+"""Large batches of independent emulation jobs on a pool of processes.
+
+A ``Job`` is a 32K ROM image for the ``Machine``, an input script and a
+cycle budget. ``JobRunner.run(jobs)`` spreads jobs over a
+``ProcessPoolExecutor`` and yields a ``JobResult`` for every job as it
+completes: the final registers, SHA-256 hashes of RAM and of all
+memory, the transcript of the LCD and the cycles and instructions run.
+
+Workers stay warm. Each keeps a ``Machine`` for every ROM it has seen,
+up to ``machines`` of them, together with a snapshot taken at power on.
+A job restores that snapshot instead of building a machine, so the
+generated handlers and the blocks decoded from ROM carry over from job
+to job. ROM images travel through one block of shared memory per
+``run()``: jobs carry its name, a slot and a digest, and a worker only
+reads a ROM the first time it meets its digest.
+
+A script is a sequence of ``(cycle, action, *arguments)`` acted on once
+the machine reaches ``cycle``:
+
+* ``("port_a", value)`` and ``("port_b", value)`` drive VIA port pins;
+* ``("ca1", level)``, likewise ``ca2``, ``cb1`` and ``cb2``, set a VIA
+  control line;
+* ``("poke", address, value)`` stores a byte through the bus;
+* ``("nmi",)`` and ``("reset",)`` pulse those inputs.
+"""
+
+import hashlib
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait
+from multiprocessing import shared_memory
+
+from be6502emu.emulator import ROM_SIZE
+from be6502emu.machine import Machine
+
+Job = namedtuple("Job", ["rom", "script", "cycles", "name"],
+                 defaults=((), 1000000, None))
+
+# ``registers`` maps pc, a, x, y, sp and p to their values, ``hashes``
+# "ram" and "memory" to SHA-256 hex digests of $0000-$3FFF and of all
+# 64K, ``transcript`` holds (cycle, text) for every change of the LCD.
+# A job that raised only has ``index``, ``name`` and ``error`` set.
+JobResult = namedtuple("JobResult", [
+    "index", "name", "registers", "cycles", "instructions", "reason",
+    "hashes", "transcript", "error"],
+    defaults=(None, None, None, None, None, None, None))
+
+RAM_SIZE = 0x4000
+
+
+def _action(machine, action, arguments):
+    """The scheduler callback performing one script entry."""
+    via = machine.via
+    if action in ("port_a", "port_b"):
+        port = via.port_a if action == "port_a" else via.port_b
+        (value,) = arguments
+        return lambda cycle: port.drive(value)
+    if action in ("ca1", "ca2", "cb1", "cb2"):
+        line = getattr(via, action)
+        (level,) = arguments
+        return lambda cycle: line(level)
+    if action == "poke":
+        address, value = arguments
+
+        def poke(cycle):
+            machine.mpu.memory[address] = value
+        return poke
+    if action == "nmi" and not arguments:
+        return lambda cycle: machine.mpu.nmi()
+    if action == "reset" and not arguments:
+        return lambda cycle: machine.reset()
+    raise ValueError("bad script entry %r" % ((action,) + tuple(arguments),))
+
+
+class _Warm:
+    """A machine kept for one ROM, with its state at power on."""
+
+    def __init__(self, rom, engine):
+        self.machine = machine = Machine(rom, engine=engine)
+        self.power_on = machine.snapshot()
+        self.transcript: list[tuple[int, str]] = []
+        lcd = machine.lcd
+        if lcd is not None:
+            lcd.connect(lambda frame, cells: self.transcript.append(
+                (machine.mpu.processorCycles, "\n".join(lcd.text()))))
+
+    def run(self, job, index):
+        machine = self.machine
+        machine.restore(self.power_on)
+        del self.transcript[:]
+        for cycle, action, *arguments in job.script:
+            machine.scheduler.post(cycle, _action(machine, action,
+                                                  arguments))
+        result = machine.run(cycles=job.cycles)
+        mpu = machine.mpu
+        return JobResult(
+            index, job.name,
+            {"pc": mpu.pc, "a": mpu.a, "x": mpu.x, "y": mpu.y,
+             "sp": mpu.sp, "p": mpu.p},
+            result.cycles, result.instructions, result.reason,
+            {"ram": hashlib.sha256(mpu.dump(0, RAM_SIZE)).hexdigest(),
+             "memory": hashlib.sha256(mpu.dump()).hexdigest()},
+            tuple(self.transcript))
+
+
+class Worker:
+    """Runs jobs on warm machines, the most recent ``machines`` ROMs."""
+
+    def __init__(self, engine="block", machines=4):
+        self.engine = engine
+        self.size = machines
+        self.machines: OrderedDict[str, _Warm] = OrderedDict()
+        # shared memory of the current run()
+        self.segment: shared_memory.SharedMemory | None = None
+
+    def warm(self, digest, rom):
+        """The machine for the ROM ``digest``, built from ``rom()``."""
+        warm = self.machines.pop(digest, None)
+        if warm is None:
+            warm = _Warm(rom(), self.engine)
+            if len(self.machines) >= self.size:
+                self.machines.popitem(last=False)
+        self.machines[digest] = warm
+        return warm
+
+    def run(self, job, index=0, digest=None, rom=None):
+        """Run ``job`` into a ``JobResult``.
+
+        ``digest`` identifies the ROM and ``rom()`` returns it, by default
+        the SHA-256 and the contents of ``job.rom``.
+        """
+        try:
+            if digest is None:
+                digest = hashlib.sha256(job.rom).hexdigest()
+            if rom is None:
+                rom = lambda: bytes(job.rom)  # NOQA
+            return self.warm(digest, rom).run(job, index)
+        except Exception as e:
+            return JobResult(index, job.name,
+                             error="%s: %s" % (type(e).__name__, e))
+
+    def run_shared(self, job, index, name, slot, digest):
+        """``run()`` with the ROM in ``slot`` of the shared memory ``name``."""
+        def rom():
+            segment = self.segment
+            if segment is None or segment.name != name:
+                if segment is not None:
+                    segment.close()
+                # pool workers share the resource tracker of the runner,
+                # which unlinks the segment once the run is over
+                segment = self.segment = shared_memory.SharedMemory(name)
+            buffer = segment.buf
+            assert buffer is not None
+            start = slot * ROM_SIZE
+            return bytes(buffer[start:start + ROM_SIZE])
+        return self.run(job, index, digest, rom)
+
+
+_worker = None  # of this process, when it is a pool worker
+
+
+def _start_worker(engine, machines):
+    global _worker
+    _worker = Worker(engine, machines)
+
+
+def _run_job(job, index, name, slot, digest):
+    assert _worker is not None
+    return _worker.run_shared(job, index, name, slot, digest)
+
+
+class JobRunner:
+    """A pool of ``workers`` processes (default one per CPU) running jobs.
+
+    ``engine`` and ``machines`` configure every ``Worker``.
+    """
+
+    def __init__(self, workers=None, engine="block", machines=4,
+                 mp_context=None):
+        self.executor = ProcessPoolExecutor(
+            workers, mp_context=mp_context, initializer=_start_worker,
+            initargs=(engine, machines))
+
+    def run(self, jobs):
+        """Yield a ``JobResult`` for each of ``jobs`` as they complete.
+
+        Results carry the position of their job in ``jobs`` as ``index``.
+        Closing the generator early cancels the jobs not yet started.
+        """
+        jobs = list(jobs)
+        slots: dict[str, int] = {}
+        digests = []
+        for job in jobs:
+            if len(job.rom) != ROM_SIZE:
+                raise ValueError("ROM image must be %d bytes, not %d"
+                                 % (ROM_SIZE, len(job.rom)))
+            digest = hashlib.sha256(job.rom).hexdigest()
+            slots.setdefault(digest, len(slots))
+            digests.append(digest)
+        if not jobs:
+            return
+
+        segment = shared_memory.SharedMemory(create=True,
+                                             size=len(slots) * ROM_SIZE)
+        buffer = segment.buf
+        assert buffer is not None
+        futures = []
+        try:
+            for job, digest in zip(jobs, digests):
+                slot = slots[digest]
+                buffer[slot * ROM_SIZE:(slot + 1) * ROM_SIZE] = job.rom
+            for index, (job, digest) in enumerate(zip(jobs, digests)):
+                futures.append(self.executor.submit(
+                    _run_job, job._replace(rom=b""), index, segment.name,
+                    slots[digest], digest))
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+            wait(futures)
+            segment.close()
+            segment.unlink()
+
+    def map(self, jobs):
+        """Every ``JobResult`` of ``jobs``, in their order."""
+        return sorted(self.run(jobs), key=lambda result: result.index)
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,377 @@
+"""HD44780 character LCD driven through VIA ports.
+
+The controller sits on the pins of one or two ``Port``s: a data bus of
+eight lines (or four, D4-D7, once switched to the 4-bit interface) and
+the E, RW and RS strobes. Transfers are decoded from pin changes alone,
+so firmware talks to it exactly as on the board: writes are latched on
+the falling edge of E, reads put the busy flag and address counter or
+RAM contents on the data lines while E is high.
+
+Instructions take effect immediately but keep the busy flag set for
+their execution time, computed lazily from the scheduler clock.
+
+The visible characters are recomputed after every transfer that can
+change them and listeners (see ``connect``) are only called when they
+actually did, together with the cells that changed, so a front end can
+redraw just those at its own refresh rate.
+"""
+
+import struct
+from typing import Any
+
+CLEAR = 0x01
+HOME = 0x02
+ENTRY_MODE = 0x04
+DISPLAY = 0x08
+SHIFT = 0x10
+FUNCTION = 0x20
+SET_CGRAM = 0x40
+SET_DDRAM = 0x80
+
+# ENTRY_MODE
+INCREMENT = 0x02
+SHIFT_DISPLAY = 0x01
+# DISPLAY
+DISPLAY_ON = 0x04
+CURSOR_ON = 0x02
+BLINK_ON = 0x01
+# SHIFT
+MOVE_DISPLAY = 0x08
+RIGHT = 0x04
+# FUNCTION
+EIGHT_BIT = 0x10
+TWO_LINES = 0x08
+
+BUSY = 0x80
+LINE = 40  # characters per line in two line mode
+
+# execution times in microseconds at the nominal 270 kHz oscillator
+SLOW = 1520
+FAST = 37
+
+# snapshot(): address counter, CGRAM selected, entry mode, display
+# control, function set, display shift, busy until, second half pending,
+# high half written, byte being read (-1 for none), E level, strobe seen;
+# then DDRAM and CGRAM
+STATE = struct.Struct("<6BqBBh2B")
+
+
+def _charset():
+    table = ["?"] * 256
+    for code in range(0x20, 0x80):
+        table[code] = chr(code)
+    table[0x5C] = "¥"
+    table[0x7E] = "→"
+    table[0x7F] = "←"
+    table[0xA0] = " "
+    for code in range(0xA1, 0xE0):
+        table[code] = chr(0xFF61 + code - 0xA1)
+    return "".join(table)
+
+
+# character generator ROM A00 (Japanese), as Unicode
+A00 = _charset()
+
+
+class HD44780:
+    """A ``rows`` x ``columns`` display with an HD44780 controller.
+
+    ``clock`` is the processor clock in Hz, used to turn execution times
+    into cycles of ``scheduler``.
+    """
+
+    def __init__(self, scheduler, rows=2, columns=16, clock=1000000):
+        self.scheduler = scheduler
+        self.rows = rows
+        self.columns = columns
+        self.clock = clock
+        self.listeners = []
+        # ports and strobe state, see attach()
+        self.data: Any = None
+        self.control: Any = None
+        self.enabled = self.strobe = False
+        self.frame = tuple(b" " * columns for _ in range(rows))
+        # bumped whenever the visible characters change
+        self.version = 0
+        # transfers started while the busy flag was set
+        self.overruns = 0
+        self.reset()
+
+    def reset(self):
+        """Power on: 8-bit interface, one line, display off."""
+        self.ddram = bytearray(b" " * 0x80)
+        self.cgram = bytearray(0x40)
+        self.address = 0
+        self.cgramSelected = False
+        self.entry = INCREMENT
+        self.display = 0
+        self.function = EIGHT_BIT
+        self.shift = 0
+        self.busyUntil = 0
+        # 4-bit interface: the second half of a transfer is next and the
+        # high half written; the byte being read
+        self.second = False
+        self.latched = 0
+        self.reading = None
+        self._refresh()
+
+    def attach(self, data, control=None, e=0x80, rw=0x40, rs=0x20,
+               data_mask=0xFF):
+        """Wire the display to ``Port`` objects.
+
+        ``data_mask`` selects the data lines on ``data``: all eight for
+        D0-D7 or four consecutive pins for D4-D7. ``e``, ``rw`` and
+        ``rs`` are the strobe pins on ``control``, which may be ``data``
+        itself. The defaults are Ben Eater's 8-bit wiring with the data
+        bus on port B and the strobes on PA7-PA5.
+        """
+        control = data if control is None else control
+        self.data = data
+        self.control = control
+        self.e, self.rw, self.rs = e, rw, rs
+        self.dataMask = data_mask
+        self.dataShift = (data_mask & -data_mask).bit_length() - 1
+        self.strobe = False
+        self.enabled = bool(control.pins & e)
+        control.connect(self._control)
+
+    def connect(self, listener):
+        """Call ``listener(frame, cells)`` when the visible text changes.
+
+        ``frame`` holds one ``bytes`` of character codes per row, see
+        ``text()``, and ``cells`` the (row, column) pairs that changed.
+        """
+        self.listeners.append(listener)
+
+    def snapshot(self):
+        """Serialise the controller state."""
+        return STATE.pack(
+            self.address, self.cgramSelected, self.entry, self.display,
+            self.function, self.shift, self.busyUntil, self.second,
+            self.latched, -1 if self.reading is None else self.reading,
+            self.enabled, self.strobe) + self.ddram + self.cgram
+
+    def restore(self, data):
+        """Return to a ``snapshot()``, telling listeners what changed."""
+        (self.address, selected, self.entry, self.display, self.function,
+         self.shift, self.busyUntil, second, self.latched, reading,
+         enabled, strobe) = STATE.unpack_from(data)
+        self.cgramSelected, self.second = bool(selected), bool(second)
+        self.reading = None if reading < 0 else reading
+        self.enabled, self.strobe = bool(enabled), bool(strobe)
+        self.ddram[:] = data[STATE.size:STATE.size + 0x80]
+        self.cgram[:] = data[STATE.size + 0x80:]
+        self._refresh()
+
+    # state as seen on the glass
+
+    def text(self, charset=A00):
+        """The visible rows as strings, custom characters as ``?``."""
+        return ["".join(charset[code] for code in row) for row in self.frame]
+
+    @property
+    def cursor(self):
+        """(row, column) of a visible cursor, None when off or hidden."""
+        if not self.display & DISPLAY_ON \
+                or not self.display & (CURSOR_ON | BLINK_ON) \
+                or self.cgramSelected:
+            return None
+        for row in range(self.rows):
+            for column in range(self.columns):
+                if self._cell(row, column) == self.address:
+                    return row, column
+        return None
+
+    @property
+    def busy(self):
+        return self.scheduler.now < self.busyUntil
+
+    def _cell(self, row, column):
+        """DDRAM address shown at ``row``, ``column``."""
+        if not self.function & TWO_LINES:
+            if row:
+                return None
+            return (column + self.shift) % (2 * LINE)
+        line, offset = row & 1, (row >> 1) * self.columns
+        return (line << 6) | (offset + column + self.shift) % LINE
+
+    def _refresh(self, glyph=None):
+        """Recompute the frame, telling listeners what changed.
+
+        ``glyph`` is a character generator RAM slot that was rewritten,
+        making every cell showing it change too.
+        """
+        on = self.display & DISPLAY_ON
+        frame = []
+        for row in range(self.rows):
+            codes = bytearray(b" " * self.columns)
+            if on:
+                for column in range(self.columns):
+                    addr = self._cell(row, column)
+                    if addr is not None:
+                        codes[column] = self.ddram[addr]
+            frame.append(bytes(codes))
+        cells = []
+        for row, (old, new) in enumerate(zip(self.frame, frame)):
+            if old == new and glyph is None:
+                continue
+            for column in range(self.columns):
+                code = new[column]
+                if old[column] != code or (
+                        glyph is not None and code < 0x10
+                        and code & 0x07 == glyph):
+                    cells.append((row, column))
+        if cells:
+            self.frame = tuple(frame)
+            self.version += 1
+            for listener in tuple(self.listeners):
+                listener(self.frame, cells)
+
+    # bus interface
+
+    def _control(self, pins):
+        enabled = bool(pins & self.e)
+        if enabled == self.enabled:
+            return
+        self.enabled = enabled
+        rs = bool(pins & self.rs)
+        if enabled:
+            self.strobe = True
+            if pins & self.rw:
+                self._start_read(rs)
+            return
+        if not self.strobe:
+            return  # E was already high when attached
+        self.strobe = False
+        if pins & self.rw:
+            self._end_read(rs)
+            return
+        value = (self.data.pins & self.dataMask) >> self.dataShift
+        if self.dataMask != 0xFF:
+            # D4-D7 only, D0-D3 read as low in 8-bit mode
+            value <<= 4
+            if self._four_bit():
+                self.second = not self.second
+                if self.second:
+                    self.latched = value
+                    return
+                value = self.latched | (value >> 4)
+        if self.busy:
+            self.overruns += 1
+        if rs:
+            self._write_data(value)
+        else:
+            self._instruction(value)
+
+    def _start_read(self, rs):
+        if self.reading is None:
+            if rs:
+                self.reading = self._ram()[self._ram_address()]
+            else:
+                self.reading = (BUSY if self.busy else 0) | self.address
+        value = self.reading
+        if self.dataMask != 0xFF:
+            value = value & 0x0F if self.second else value >> 4
+        self._drive(value)
+
+    def _end_read(self, rs):
+        self._release()
+        if self._four_bit():
+            self.second = not self.second
+            if self.second:
+                return
+        self.reading = None
+        if rs:
+            self._advance(self.entry & INCREMENT)
+
+    def _four_bit(self):
+        return self.dataMask != 0xFF and not self.function & EIGHT_BIT
+
+    def _drive(self, value):
+        mask = self.dataMask
+        port = self.data
+        port.drive((port.input & ~mask) | ((value << self.dataShift) & mask))
+
+    def _release(self):
+        port = self.data
+        port.drive(port.input | self.dataMask)
+
+    # instructions
+
+    def _execute(self, microseconds):
+        cycles = -(-microseconds * self.clock // 1000000)
+        self.busyUntil = self.scheduler.now + cycles
+
+    def _ram(self):
+        return self.cgram if self.cgramSelected else self.ddram
+
+    def _ram_address(self):
+        return self.address & (0x3F if self.cgramSelected else 0x7F)
+
+    def _advance(self, increment):
+        """Move the address counter one place."""
+        step = 1 if increment else -1
+        if self.cgramSelected:
+            self.address = (self.address + step) & 0x3F
+        elif self.function & TWO_LINES:
+            # 0x00-0x27 and 0x40-0x67, wrapping from one to the other
+            line, column = self.address & 0x40, (self.address & 0x3F) + step
+            if column == LINE:
+                line, column = line ^ 0x40, 0
+            elif column < 0:
+                line, column = line ^ 0x40, LINE - 1
+            self.address = line | column
+        else:
+            self.address = (self.address + step) % (2 * LINE)
+
+    def _write_data(self, value):
+        glyph = None
+        if self.cgramSelected:
+            self.cgram[self.address] = value
+            glyph = self.address >> 3
+        else:
+            self.ddram[self.address] = value
+            if self.entry & SHIFT_DISPLAY:
+                self._shift(self.entry & INCREMENT)
+        self._advance(self.entry & INCREMENT)
+        self._execute(FAST)
+        self._refresh(glyph)
+
+    def _shift(self, left):
+        width = LINE if self.function & TWO_LINES else 2 * LINE
+        self.shift = (self.shift + (1 if left else -1)) % width
+
+    def _instruction(self, value):
+        if value & SET_DDRAM:
+            self.address = value & 0x7F
+            self.cgramSelected = False
+        elif value & SET_CGRAM:
+            self.address = value & 0x3F
+            self.cgramSelected = True
+        elif value & FUNCTION:
+            self.function = value
+            if value & EIGHT_BIT:
+                self.second = False
+        elif value & SHIFT:
+            if value & MOVE_DISPLAY:
+                self._shift(not value & RIGHT)
+            else:
+                self._advance(value & RIGHT)
+        elif value & DISPLAY:
+            self.display = value
+        elif value & ENTRY_MODE:
+            self.entry = value & (INCREMENT | SHIFT_DISPLAY)
+        elif value & (CLEAR | HOME):
+            if value & CLEAR:
+                self.ddram[:] = b" " * 0x80
+                self.entry |= INCREMENT
+            self.address = 0
+            self.cgramSelected = False
+            self.shift = 0
+            self._execute(SLOW)
+            self._refresh()
+            return
+        else:
+            return
+        self._execute(FAST)
+        self._refresh()
@@ -0,0 +1,80 @@
+"""Ben Eater's 6502 computer assembled from its parts."""
+
+from functools import partial
+
+from be6502emu.bus import ben_eater
+from be6502emu.lcd import HD44780
+from be6502emu.mpu import MPU
+from be6502emu.via import VIA
+
+
+class Machine:
+    """65C02, 16K of RAM, a 6522 VIA at $6000 and 32K of ROM at $8000.
+
+    Every part shares the scheduler of the MPU and the VIA drives the
+    processor's IRQ line, so ``run()`` alone keeps the whole machine going.
+
+    A 16x2 LCD hangs off the VIA, wired as in the videos: ``lcd="8-bit"``
+    puts its data bus on port B and E, RW and RS on PA7-PA5, ``"4-bit"``
+    puts D4-D7 on PB0-PB3 and E, RW and RS on PB6-PB4. ``None`` leaves
+    the ports free.
+    """
+
+    def __init__(self, rom=None, engine="reference", lcd="8-bit"):
+        if lcd not in ("8-bit", "4-bit", None):
+            raise ValueError("unknown LCD wiring %r" % (lcd,))
+        bus = ben_eater(rom)
+        # what memory looks like at power on, snapshots only hold changes
+        self.image = bytes(bus.memory)
+        self._assemble(MPU(memory=bus, pc=None, engine=engine), lcd)
+
+    def _assemble(self, mpu, lcd):
+        self.mpu = mpu
+        self.bus = mpu.bus
+        self.scheduler = mpu.scheduler
+        self.via = VIA(self.scheduler, irq=partial(mpu.set_irq, "via"))
+        self.bus.map_device(0x6000, 0x8000, self.via)
+        self.wiring = lcd
+        self.lcd = None
+        if lcd == "8-bit":
+            self.lcd = HD44780(self.scheduler)
+            self.lcd.attach(self.via.port_b, self.via.port_a)
+        elif lcd == "4-bit":
+            self.lcd = HD44780(self.scheduler)
+            self.lcd.attach(self.via.port_b, e=0x40, rw=0x20, rs=0x10,
+                            data_mask=0x0F)
+
+    def reset(self):
+        self.via.reset()
+        self.mpu.reset()
+
+    def fork(self):
+        """An independent copy of the running machine, see ``MPU.fork``.
+
+        Memory is shared copy-on-write, the VIA and the LCD are rebuilt
+        from snapshots of their state. Listeners are not carried over.
+        """
+        child = Machine.__new__(Machine)
+        child.image = self.image
+        child._assemble(self.mpu.fork(), self.wiring)
+        for device, copy in zip(self._devices(), child._devices()):
+            copy.restore(device.snapshot())
+        if self.lcd is not None and child.lcd is not None:
+            child.lcd.clock = self.lcd.clock
+        return child
+
+    def snapshot(self):
+        """The state of every part, see ``MPU.snapshot``."""
+        return self.mpu.snapshot(self.image, self._devices())
+
+    def restore(self, data):
+        """Return to a ``snapshot()`` of this machine."""
+        self.mpu.restore(data, self.image, self._devices())
+
+    def _devices(self):
+        return [device for device in (self.via, self.lcd)
+                if device is not None]
+
+    def run(self, cycles=None, instructions=None, until_pc=None):
+        """Run the processor, see ``MPU.run``."""
+        return self.mpu.run(cycles, instructions, until_pc)
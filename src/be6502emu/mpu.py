@@ -1,5 +1,26 @@
+import copy
+from collections import namedtuple
+from typing import Any
+
 from py65.utils.conversions import itoa
 
+from be6502emu import codegen, snapshot
+from be6502emu.blocks import BlockCache
+from be6502emu.bus import Bus
+from be6502emu.debug import Breakpoints, Hit, Watchpoints
+from be6502emu.scheduler import NEVER, Scheduler
+
+# Outcome of MPU.run(): cycles and instructions executed by the call and
+# why it returned ("cycles", "instructions", "until_pc", "breakpoint" and
+# "watchpoint" with the debug.Hit in hit, or "waiting" and "stopped" when
+# WAI or STP left nothing to run until the budget ran out).
+RunResult = namedtuple("RunResult", ["cycles", "instructions", "reason",
+                                     "hit"], defaults=(None,))
+
+
+def _budget(cycle):
+    pass  # only ends the run loop's current stretch
+
 
 def make_instruction_decorator(instruct, disasm, allcycles, allextras):
     def instruction(name, mode, cycles, extracycles=0):
@@ -36,9 +57,30 @@ class MPU:
     ADDR_WIDTH = 16
     ADDR_FORMAT = "%04x"
 
-    def __init__(self, memory=None, pc=0x0000):
+    # "reference" runs the decorated handlers below, "generated" the flat
+    # handlers emitted by be6502emu.codegen and "block" caches decoded
+    # blocks of generated handlers
+    ENGINES = ("reference", "generated", "block")
+
+    name = "65C02"
+
+    # Attributes left at their class default until used, which keeps the
+    # instance under the 30 attributes CPython shares the keys of, beyond
+    # which every attribute access of the handlers gets slower.
+    blocks: BlockCache | None = None  # the cache of the block engine
+    # records what run() executes when set, see be6502emu.trace
+    trace: Any = None
+    # counts where run() spends cycles when set, see be6502emu.profiler
+    profiler: Any = None
+    # samples the cost of opcodes when set, see be6502emu.instruments
+    instruments: Any = None
+
+    def __init__(self, memory=None, pc=0x0000, engine="reference"):
+        if engine not in self.ENGINES:
+            raise ValueError("unknown engine %r" % (engine,))
+
         # config
-        self.name = "65C02"
+        self.engine = engine
         self.byteMask = (1 << self.BYTE_WIDTH) - 1
         self.addrMask = (1 << self.ADDR_WIDTH) - 1
         self.addrHighMask = self.byteMask << self.BYTE_WIDTH
@@ -49,9 +91,7 @@ class MPU:
         self.addcycles = False
         self.processorCycles = 0
 
-        if memory is None:
-            memory = 0x10000 * [0x00]
-        self.memory = memory
+        self._attach(memory)
         self.start_pc = pc  # if None, reset vector is used
 
         # registers
@@ -66,7 +106,56 @@ class MPU:
         self.processorCycles = 0
 
         # init
-        self.waiting = False
+        self.waiting = False  # WAI, until an interrupt
+        self.stopped = False  # STP, until a reset
+        # devices post events on the scheduler and assert the IRQ line
+        # through set_irq(); the line is the wired-OR of every source
+        self.scheduler = Scheduler(self)
+        self.irqSources = set()
+        if engine != "reference":
+            self.instruct = codegen.handlers(type(self))[0]
+        if engine == "block":
+            self.blocks = BlockCache(self)
+        # see be6502emu.debug
+        self.breakpoints = Breakpoints()
+        self.watchpoints = Watchpoints(self)
+
+    @property
+    def memory(self):
+        """The ``Bus``, by its original name.
+
+        Assigning a ``Bus`` or a buffer moves the processor onto it as the
+        constructor would, carrying the watchpoints over and starting an
+        empty block cache.
+        """
+        return self.bus
+
+    @memory.setter
+    def memory(self, memory):
+        self.bus.listeners.remove(self._bind_memory)
+        watches = list(self.watchpoints.watches)
+        self.watchpoints.clear()
+        if self.blocks is not None:
+            self.blocks.clear()
+        self._attach(memory)
+        self.watchpoints = Watchpoints(self)
+        for watch in watches:
+            self.watchpoints.add(*watch)
+        if self.blocks is not None:
+            self.blocks = BlockCache(
+                self, self.blocks.max_length, self.blocks.skip_idle)
+
+    def _attach(self, memory):
+        # memory is a Bus; a buffer (or None for fresh RAM) is wrapped in a
+        # bus mapping all of it as RAM. The handlers index the page tables
+        # directly, memory[addr] is the slower subscript API on top of them.
+        if not isinstance(memory, Bus):
+            memory = Bus(memory)
+        self.bus = memory
+        self.readPages = memory.readPages
+        self.writePages = memory.writePages
+        memory.listeners.append(self._bind_memory)
+        self._bind_memory()
 
     @staticmethod
     def reprformat():
@@ -91,7 +180,7 @@ class MPU:
         )
 
     def _step(self):
-        instruct_code = self.memory[self.pc]
+        instruct_code = self.readPages[self.pc >> 8][self.pc & 0xFF]
         self.pc = (self.pc + 1) & self.addrMask
         self.excycles = 0
         self.addcycles = self.extracycles[instruct_code]
@@ -101,13 +190,217 @@ class MPU:
         return self
 
     def step(self):
-        if self.waiting:
-            self.processorCycles += 1
+        if self.irqSources or self.waiting or self.stopped:
+            self._step_interrupted()
         else:
             self._step()
+        if self.processorCycles >= self.scheduler.deadline:
+            self.scheduler.run_due()
         return self
 
+    def _step_interrupted(self):
+        # the slow side of step(): an IRQ line asserted, WAI or STP
+        if self.irqSources and not self.stopped:
+            self.waiting = False
+        if self.irqSources and not self.p & self.INTERRUPT:
+            self.irq()
+        elif self.waiting or self.stopped:
+            # skip straight to whatever happens next
+            deadline = self.scheduler.next_deadline()
+            if deadline is None:
+                self.processorCycles += 1
+            else:
+                self.processorCycles = max(self.processorCycles, deadline)
+        else:
+            self._step()
+
+    def run(self, cycles=None, instructions=None, until_pc=None):
+        """Execute instructions until a budget or stop address is reached.
+
+        ``cycles`` and ``instructions`` bound the work done by this call,
+        ``until_pc`` stops as soon as the program counter lands on that
+        address (after at least one instruction or interrupt). Scheduler
+        events fire as they fall due and an asserted IRQ line is taken
+        between instructions. Returns a ``RunResult``.
+
+        With breakpoints set, ``trace`` or ``profiler`` attached, the run
+        single-steps through ``_run_checked`` instead of the engine, and
+        with ``instruments`` attached it samples through
+        ``_run_sampled``; with none of them it runs the plain engine.
+        """
+        if cycles is None and instructions is None and until_pc is None:
+            raise ValueError("run() needs a cycle, instruction or pc limit")
+
+        scheduler = self.scheduler
+        start = self.processorCycles
+        end = start + cycles if cycles is not None else NEVER
+        limit = instructions if instructions is not None else -1
+        stop = until_pc if until_pc is not None else -1
+        # the budget is an event too, so the loop only watches the deadline
+        budget = scheduler.post(end, _budget) if end < NEVER else None
+        engine = self.blocks.run if self.blocks is not None else self._run
+        if (self.breakpoints or self.trace is not None
+                or self.profiler is not None):
+            engine = self._run_checked
+        elif self.instruments is not None:
+            engine = self._run_sampled
+        watchpoints = self.watchpoints
+        watching = bool(watchpoints)
+        watchpoints.reset()
+        hit = None
+        count = 0
+
+        while True:
+            if self.processorCycles >= scheduler.deadline:
+                scheduler.run_due()
+            if count == limit:
+                reason = "instructions"
+                break
+            if self.processorCycles >= end:
+                reason = self._halted() or "cycles"
+                break
+            if self.irqSources and not self.stopped:
+                self.waiting = False
+                if not self.p & self.INTERRUPT:
+                    self.irq()
+                    if self.pc == stop:
+                        reason = "until_pc"
+                        break
+                    if self.pc in self.breakpoints:
+                        reason = "breakpoint"
+                        hit = Hit("execute", self.pc, None)
+                        break
+                    continue
+            reason = self._halted()
+            if reason:
+                # fast forward to the next event, which may wake it up
+                deadline = scheduler.next_deadline()
+                if deadline is None or (self.stopped and end == NEVER):
+                    break
+                self.processorCycles = max(self.processorCycles, deadline)
+                continue
+
+            done, reason = engine(limit - count if limit >= 0 else -1, stop)
+            count += done
+            if watching and watchpoints.hit is not None:
+                reason, hit = "watchpoint", watchpoints.hit
+                break
+            if reason == "breakpoint":
+                hit = Hit("execute", self.pc, None)
+                break
+            if reason not in ("deadline", "halted"):
+                break
+
+        scheduler.cancel(budget)
+        return RunResult(self.processorCycles - start, count, reason, hit)
+
+    def _halted(self):
+        if self.stopped:
+            return "stopped"
+        return "waiting" if self.waiting else None
+
+    def _run(self, limit, stop):
+        pages = self.readPages
+        instruct = self.instruct
+        cycletime = self.cycletime
+        extracycles = self.extracycles
+        addrMask = self.addrMask
+        scheduler = self.scheduler
+        count = 0
+
+        while True:
+            instruct_code = pages[self.pc >> 8][self.pc & 0xFF]
+            self.pc = (self.pc + 1) & addrMask
+            self.excycles = 0
+            self.addcycles = extracycles[instruct_code]
+            instruct[instruct_code](self)  # NOQA
+            self.pc &= addrMask
+            self.processorCycles += cycletime[instruct_code] + self.excycles
+            count += 1
+
+            if instruct_code == 0xCB or instruct_code == 0xDB:  # WAI, STP
+                return count, "halted"
+            if self.pc == stop:
+                return count, "until_pc"
+            if count == limit:
+                return count, "instructions"
+            if self.processorCycles >= scheduler.deadline:
+                return count, "deadline"
+
+    def _run_checked(self, limit, stop):
+        """``_run`` stopping at breakpoints, recording the trace and
+        profiling, used while any of them is on."""
+        bits = self.breakpoints.bits
+        record = self.trace.record if self.trace is not None else None
+        profile = self.profiler.count if self.profiler is not None else None
+        storage = self.bus.storage
+        scheduler = self.scheduler
+        count = 0
+
+        while True:
+            if record is not None:
+                record(self)
+            if profile is not None:
+                pc = self.pc
+                opcode = storage[pc >> 8][pc & 0xFF]
+                cycles = self.processorCycles
+                self._step()
+                profile(self, pc, opcode, self.processorCycles - cycles)
+            else:
+                self._step()
+            count += 1
+            pc = self.pc
+
+            if self.waiting or self.stopped:
+                return count, "halted"
+            if pc == stop:
+                return count, "until_pc"
+            if bits[pc >> 3] >> (pc & 7) & 1:
+                return count, "breakpoint"
+            if count == limit:
+                return count, "instructions"
+            if self.processorCycles >= scheduler.deadline:
+                return count, "deadline"
+
+    def _run_sampled(self, limit, stop):
+        """The engine, but single-stepping every ``interval``-th
+        instruction for the instruments."""
+        instruments = self.instruments
+        assert instruments is not None
+        engine = self.blocks.run if self.blocks is not None else self._run
+        scheduler = self.scheduler
+        count = 0
+
+        while True:
+            stretch = instruments.countdown
+            if limit >= 0:
+                stretch = min(stretch, limit - count)
+            if stretch:
+                done, reason = engine(stretch, stop)
+                count += done
+                instruments.countdown -= done
+                instruments.instructions += done
+                if reason != "instructions" or count == limit:
+                    return count, reason
+                continue
+
+            instruments.sample(self)
+            count += 1
+            if self.waiting or self.stopped:
+                return count, "halted"
+            if self.pc == stop:
+                return count, "until_pc"
+            if count == limit:
+                return count, "instructions"
+            if self.processorCycles >= scheduler.deadline:
+                return count, "deadline"
+
     def reset(self):
+        """Return the registers to their reset state.
+
+        ``processorCycles`` keeps counting through a reset, as scheduled
+        events are on absolute cycles.
+        """
         self.pc = self.start_pc
         if self.pc is None:
             self.pc = self.WordAt(self.RESET)
@@ -116,34 +409,140 @@ class MPU:
         self.x = 0
         self.y = 0
         self.p = self.BREAK | self.UNUSED
-        self.processorCycles = 0
+        self.waiting = False
+        self.stopped = False
+
+    def fork(self):
+        """Return an independent copy of the processor and its memory.
+
+        Memory is shared copy-on-write a page at a time (see
+        ``Bus.fork``), so a fork costs the same whatever the program and
+        each copy only pays for the pages it writes. Devices mapped on
+        the bus are shared rather than copied and the copy starts with an
+        empty scheduler and without breakpoints, watchpoints, trace,
+        profiler or instruments;
+        ``Machine.fork`` rebuilds its devices around the copy.
+        """
+        child = copy.copy(self)
+        child.bus = self.bus.fork()
+        child.readPages = child.bus.readPages
+        child.writePages = child.bus.writePages
+        child.bus.listeners.append(child._bind_memory)
+        child._bind_memory()
+        child.scheduler = Scheduler(child)
+        child.irqSources = set(self.irqSources)
+        child.breakpoints = Breakpoints()
+        child.watchpoints = Watchpoints(child)
+        for name in ("trace", "profiler", "instruments"):
+            if getattr(child, name) is not None:
+                delattr(child, name)  # back to the class default
+        if self.blocks is not None:
+            child.blocks = BlockCache(
+                child, self.blocks.max_length, self.blocks.skip_idle)
+        return child
+
+    def snapshot(self, base=None, devices=None):
+        """Serialise the machine state, see ``be6502emu.snapshot``.
+
+        ``devices`` defaults to the devices mapped on the bus which
+        implement ``snapshot()``, in address order; memory is stored as
+        its difference from the 64K ``base`` image.
+        """
+        if devices is None:
+            devices = self._snapshot_devices()
+        return snapshot.save(self, devices, base)
+
+    def restore(self, data, base=None, devices=None):
+        """Return to the state saved by ``snapshot()``."""
+        if devices is None:
+            devices = self._snapshot_devices()
+        snapshot.load(self, data, devices, base)
+
+    def _snapshot_devices(self):
+        devices = []
+        for device in self.bus.devices:
+            if device is not None and hasattr(device, "snapshot") \
+                    and device not in devices:
+                devices.append(device)
+        return devices
+
+    def set_irq(self, source, asserted):
+        """Drive the IRQ input from ``source`` (any hashable).
+
+        The processor takes the interrupt between instructions for as long
+        as any source holds the line asserted and I is clear.
+        """
+        if asserted:
+            self.irqSources.add(source)
+            self.scheduler.poll()
+        else:
+            self.irqSources.discard(source)
 
     def irq(self):
         # triggers a normal IRQ
         # this is very similar to the BRK instruction
+        # it ends WAI even when masked, execution then just carries on
+        if self.stopped:
+            return
+        self.waiting = False
         if self.p & self.INTERRUPT:
             return
         self.stPushWord(self.pc)
         self.p &= ~self.BREAK
         self.stPush(self.p | self.UNUSED)
         self.p |= self.INTERRUPT
+        self.p &= ~self.DECIMAL
         self.pc = self.WordAt(self.IRQ)
         self.processorCycles += 7
 
     def nmi(self):
         # triggers a NMI IRQ in the processor
         # this is very similar to the BRK instruction
+        if self.stopped:
+            return
+        self.waiting = False
         self.stPushWord(self.pc)
         self.p &= ~self.BREAK
         self.stPush(self.p | self.UNUSED)
         self.p |= self.INTERRUPT
+        self.p &= ~self.DECIMAL
         self.pc = self.WordAt(self.NMI)
         self.processorCycles += 7
 
+    def load(self, address, data):
+        """Copy the bytes of ``data`` into memory starting at ``address``.
+
+        Cached blocks decoded from the range are dropped.
+        """
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data)
+        self.bus.load(address, data)
+        length = memoryview(data).nbytes
+        if self.blocks is not None and length:
+            self.blocks.invalidate(address, address + length)
+
+    def dump(self, address=0, length=None):
+        """Return ``length`` bytes from ``address``, see ``Bus.dump``."""
+        return self.bus.dump(address, length)
+
+    def _bind_memory(self):
+        """Have ``ByteAt`` and ``StoreByte`` index the buffer directly
+        while the bus is plain RAM (see ``Bus.flat``), sparing the page
+        tables on the reference engine's every access."""
+        memory = self.bus.flat
+        if memory is not None:
+            setattr(self, "ByteAt", memory.__getitem__)
+            setattr(self, "StoreByte", memory.__setitem__)
+        elif getattr(self.ByteAt, "__self__", None) is not self:
+            del self.ByteAt, self.StoreByte  # back to the page tables
+
     # Helpers for addressing modes
 
     def ByteAt(self, addr):
-        return self.memory[addr]
+        return self.readPages[addr >> 8][addr & 0xFF]
+
+    def StoreByte(self, addr, value):
+        self.writePages[addr >> 8][addr & 0xFF] = value
 
     def WordAt(self, addr):
         return self.ByteAt(addr) + (self.ByteAt(addr + 1) << self.BYTE_WIDTH)
@@ -229,7 +628,7 @@ class MPU:
     # stack
 
     def stPush(self, z):
-        self.memory[self.sp + self.spBase] = z & self.byteMask
+        self.StoreByte(self.sp + self.spBase, z & self.byteMask)
         self.sp -= 1
         self.sp &= self.byteMask
 
@@ -281,7 +680,7 @@ class MPU:
         if x is None:
             self.a = tbyte
         else:
-            self.memory[addr] = tbyte  # NOQA
+            self.StoreByte(addr, tbyte)  # NOQA
 
     def opLSR(self, x):
         if x is None:
@@ -302,7 +701,7 @@ class MPU:
         if x is None:
             self.a = tbyte
         else:
-            self.memory[addr] = tbyte  # NOQA
+            self.StoreByte(addr, tbyte)  # NOQA
 
     def opBCL(self, x):
         if self.p & x:
@@ -356,7 +755,7 @@ class MPU:
         if x is None:
             self.a = tbyte
         else:
-            self.memory[addr] = tbyte  # NOQA
+            self.StoreByte(addr, tbyte)  # NOQA
 
     def opEOR(self, x):
         self.a ^= self.ByteAt(x())
@@ -438,16 +837,16 @@ class MPU:
         if x is None:
             self.a = tbyte
         else:
-            self.memory[addr] = tbyte  # NOQA
+            self.StoreByte(addr, tbyte)  # NOQA
 
     def opSTA(self, x):
-        self.memory[x()] = self.a
+        self.StoreByte(x(), self.a)
 
     def opSTY(self, x):
-        self.memory[x()] = self.y
+        self.StoreByte(x(), self.y)
 
     def opSTX(self, y):
-        self.memory[y()] = self.x
+        self.StoreByte(y(), self.x)
 
     def opCMPR(self, get_address, register_value):
         tbyte = self.ByteAt(get_address())
@@ -529,7 +928,7 @@ class MPU:
         if x is None:
             self.a = tbyte
         else:
-            self.memory[addr] = tbyte  # NOQA
+            self.StoreByte(addr, tbyte)  # NOQA
 
     def opINCR(self, x):
         if x is None:
@@ -548,7 +947,7 @@ class MPU:
         if x is None:
             self.a = tbyte
         else:
-            self.memory[addr] = tbyte  # NOQA
+            self.StoreByte(addr, tbyte)  # NOQA
 
     def opLDA(self, x):
         self.a = self.ByteAt(x())
@@ -564,32 +963,32 @@ class MPU:
 
     def opRMB(self, x, mask):
         address = x()
-        self.memory[address] &= mask
+        self.StoreByte(address, self.ByteAt(address) & mask)
 
     def opSMB(self, x, mask):
         address = x()
-        self.memory[address] |= mask
+        self.StoreByte(address, self.ByteAt(address) | mask)
 
     def opSTZ(self, x):
-        self.memory[x()] = 0x00
+        self.StoreByte(x(), 0x00)
 
     def opTSB(self, x):
         address = x()
-        m = self.memory[address]
+        m = self.ByteAt(address)
         self.p &= ~self.ZERO
         z = m & self.a
         if z == 0:
             self.p |= self.ZERO
-        self.memory[address] = m | self.a
+        self.StoreByte(address, m | self.a)
 
     def opTRB(self, x):
         address = x()
-        m = self.memory[address]
+        m = self.ByteAt(address)
         self.p &= ~self.ZERO
         z = m & self.a
         if z == 0:
             self.p |= self.ZERO
-        self.memory[address] = m & ~self.a
+        self.StoreByte(address, m & ~self.a)
 
     #def get_
 
@@ -721,6 +1120,8 @@ class MPU:
     @instruction(name="PLP", mode="imp", cycles=4)
     def inst_0x28(self):
         self.p = self.stPop() | self.BREAK | self.UNUSED
+        if self.irqSources:
+            self.scheduler.poll()  # it may be unmasked now, see run()
 
     @instruction(name="AND", mode="imm", cycles=2)
     def inst_0x29(self):
@@ -788,6 +1189,8 @@ class MPU:
     def inst_0x40(self):
         self.p = self.stPop() | self.BREAK | self.UNUSED
         self.pc = self.stPopWord()
+        if self.irqSources:
+            self.scheduler.poll()  # it may be unmasked now, see run()
 
     @instruction(name="EOR", mode="inx", cycles=6)
     def inst_0x41(self):
@@ -853,6 +1256,8 @@ class MPU:
     @instruction(name="CLI", mode="imp", cycles=2)
     def inst_0x58(self):
         self.opCLR(self.INTERRUPT)
+        if self.irqSources:
+            self.scheduler.poll()  # it may be unmasked now, see run()
 
     @instruction(name="EOR", mode="aby", cycles=4, extracycles=1)
     def inst_0x59(self):
@@ -1535,6 +1940,10 @@ class MPU:
     def inst_0xcb(self):
         self.waiting = True
 
+    @instruction(name="STP", mode='imp', cycles=3)
+    def inst_0xdb(self):
+        self.stopped = True
+
     @instruction(name="CMP", mode='zpi', cycles=5)
     def inst_0xd2(self):
         self.opCMPR(self.ZeroPageIndirectAddr, self.a)
@@ -0,0 +1,112 @@
+"""Where firmware spends its cycles.
+
+Set ``mpu.profiler`` to a ``Profiler`` and ``MPU.run`` counts, per
+address, the instructions executed there, the cycles they took and how
+many of those were extra cycles for crossing a page or taking a branch.
+``MPU.run`` describes what profiling costs.
+
+A shadow call stack follows JSR and RTS, as well as interrupts (the
+program counter moving between instructions while three bytes were
+pushed) and RTI. A frame is popped once the stack pointer is back above
+where it was pushed, so firmware dropping a return address itself only
+confuses the stack until its next return. Cycles are summed per stack
+as well and ``collapsed()`` writes them in the collapsed stack format
+read by flame graph tools, ``report()`` lists the hottest addresses.
+"""
+
+from array import array
+
+JSR = 0x20
+RTS = 0x60
+RTI = 0x40
+BRK = 0x00
+
+SIZE = 0x10000
+
+
+class Profiler:
+    """Counters of the instructions executed while attached to an MPU."""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.counts = array("Q", bytes(8 * SIZE))
+        self.cycles = array("Q", bytes(8 * SIZE))
+        self.extra = array("Q", bytes(8 * SIZE))
+        # cycles per call stack, a tuple of entry addresses
+        self.stacks: dict[tuple[int, ...], int] = {}
+        self.frames: list[tuple[int, int]] = []  # (entry address, sp)
+        self.stack: tuple[int, ...] = ()
+        self.resume: int | None = None  # pc after the last instruction
+        self.sp = 0
+
+    @property
+    def total(self):
+        """Cycles profiled."""
+        return sum(self.stacks.values())
+
+    def count(self, mpu, pc, opcode, cycles):
+        """Account for the instruction at ``pc`` taking ``cycles``."""
+        if not self.stack:
+            self.stack = (pc,)  # the root frame, where profiling began
+        elif pc != self.resume and mpu.sp == (self.sp - 3) & 0xFF:
+            # an interrupt was taken since the last instruction
+            self._push(pc, self.sp)
+        self.counts[pc] += 1
+        self.cycles[pc] += cycles
+        self.extra[pc] += mpu.excycles
+        stacks = self.stacks
+        stacks[self.stack] = stacks.get(self.stack, 0) + cycles
+
+        if opcode == JSR or opcode == BRK:
+            self._push(mpu.pc, (mpu.sp + (2 if opcode == JSR else 3))
+                       & 0xFF)
+        elif (opcode == RTS or opcode == RTI) and self.frames:
+            frames = self.frames
+            while frames and frames[-1][1] <= mpu.sp:
+                frames.pop()
+            self.stack = self.stack[:len(frames) + 1]
+        self.resume = mpu.pc
+        self.sp = mpu.sp
+
+    def _push(self, entry, sp):
+        self.frames.append((entry, sp))
+        self.stack += (entry,)
+
+    def hot(self, n=20):
+        """The ``n`` addresses taking the most cycles, as (address, count,
+        cycles, extra cycles) tuples."""
+        cycles = self.cycles
+        addresses = sorted((addr for addr in range(SIZE) if cycles[addr]),
+                           key=lambda addr: (-cycles[addr], addr))
+        return [(addr, self.counts[addr], cycles[addr], self.extra[addr])
+                for addr in addresses[:n]]
+
+    def report(self, n=20, symbols=None):
+        """Return the ``n`` hottest addresses as text."""
+        total = self.total or 1
+        lines = ["address   count       cycles        %   extra"]
+        for addr, count, cycles, extra in self.hot(n):
+            lines.append("%-8s %6d %12d %7.2f%% %7d"
+                         % (_name(addr, symbols), count, cycles,
+                            100.0 * cycles / total, extra))
+        return "\n".join(lines)
+
+    def collapsed(self, symbols=None):
+        """Return the cycles per call stack as collapsed stack lines.
+
+        ``symbols`` maps addresses to names for the frames, the rest are
+        shown as $XXXX.
+        """
+        lines = []
+        for stack, cycles in sorted(self.stacks.items()):
+            frames = ";".join(_name(addr, symbols) for addr in stack)
+            lines.append("%s %d" % (frames, cycles))
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+def _name(addr, symbols):
+    if symbols is not None and addr in symbols:
+        return symbols[addr]
+    return "$%04X" % addr
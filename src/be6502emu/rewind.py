@@ -0,0 +1,394 @@
+"""Stepping back through recorded execution.
+
+A ``Rewind`` executes instructions for its target, an ``MPU`` or a
+``Machine``, one ``step()`` at a time and records what it needs to go
+back: a keyframe (see ``snapshot()``) every ``interval`` instructions and
+in between, per instruction, the registers before it and the old value of
+every byte it stored.
+
+Registers are journaled as deltas. An instruction's record holds a mask
+of the registers that differ from the previous instruction's (or the
+keyframe's), their new values, how many bytes it stored and the cycles
+elapsed, the counts as variable length integers. A typical instruction
+changes PC and one or two other registers, so its record takes five to
+seven bytes, plus one for the device flag and four per byte stored.
+Records are only decoded forward from the keyframe, so going back costs
+up to ``interval`` decoded records.
+
+``step_back(n)`` undoes the journal directly as long as none of the
+instructions being undone touched a device page or let a scheduler event
+fire, since device state cannot be put back a byte at a time. Otherwise
+it restores the newest keyframe before the target and executes forward
+from there, which reproduces the recorded run exactly.
+
+History lives in a ring of segments, a keyframe each with its journal,
+and the oldest segments are dropped once ``limit`` bytes are in use. A
+single keyframe has to fit in ``limit``, the newest segment is kept
+whatever its size and replaced by a fresh keyframe when it outgrows the
+limit by itself.
+Nothing is installed on the bus until a ``Rewind`` is created and
+``close()`` removes all of it, so processors not being recorded run at
+full speed.
+"""
+
+from array import array
+from collections import deque
+
+from be6502emu.mpu import RunResult
+
+WRITE_SIZE = 4
+
+# registers as a list [pc, a, x, y, sp, p, waiting | stopped << 1,
+# processorCycles]; a record's mask has bit i set when item i changed
+PC = 0
+CYCLES = 7
+
+
+class Segment:
+    """A keyframe and the instructions recorded since."""
+
+    __slots__ = ("start", "keyframe", "base", "deltas", "touched",
+                 "writes")
+
+    def __init__(self, start, keyframe, base):
+        self.start = start
+        self.keyframe = keyframe
+        self.base = base  # registers at the keyframe
+        self.deltas = bytearray()  # a record per instruction
+        self.touched = bytearray()
+        self.writes = array("I")  # address << 8 | old value
+
+    def __len__(self):
+        return len(self.touched)
+
+    @property
+    def size(self):
+        return (len(self.keyframe) + len(self.deltas) + len(self.touched)
+                + WRITE_SIZE * len(self.writes))
+
+    def record(self, previous, registers, writes, touched):
+        """Append an instruction, ``registers`` before it and ``writes``
+        bytes stored by it, to a segment whose last one had
+        ``previous``."""
+        deltas = self.deltas
+        mark = len(deltas)
+        deltas.append(0)
+        mask = 0
+        if registers[PC] != previous[PC]:
+            mask = 1
+            deltas += registers[PC].to_bytes(2, "little")
+        for item in range(1, CYCLES):
+            if registers[item] != previous[item]:
+                mask |= 1 << item
+                deltas.append(registers[item])
+        deltas[mark] = mask
+        _put(deltas, writes)
+        _put(deltas, registers[CYCLES] - previous[CYCLES])
+        self.touched.append(touched)
+
+    def seek(self, count):
+        """Decode the first ``count`` records.
+
+        Returns the registers before the ``count``-th instruction (the
+        keyframe's for 0), the offset of its record and of its first
+        write.
+        """
+        registers = list(self.base)
+        offset = mark = 0
+        for _ in range(count):
+            offset, writes = _decode(self.deltas, offset, registers)
+            mark += writes
+        return registers, offset, mark
+
+    def truncate(self, count, offset, mark):
+        """Forget everything from the ``count``-th instruction on, whose
+        record starts at ``offset`` and first write at ``mark``."""
+        del self.deltas[offset:]
+        del self.touched[count:]
+        del self.writes[mark:]
+
+
+def _put(deltas, value):
+    while value >= 0x80:
+        deltas.append(value & 0x7F | 0x80)
+        value >>= 7
+    deltas.append(value)
+
+
+def _get(deltas, offset):
+    value = shift = 0
+    while True:
+        byte = deltas[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def _decode(deltas, offset, registers):
+    """Apply the record at ``offset`` to ``registers``.
+
+    Returns the offset of the next record and the bytes stored.
+    """
+    mask = deltas[offset]
+    offset += 1
+    if mask & 1:
+        registers[PC] = deltas[offset] | deltas[offset + 1] << 8
+        offset += 2
+    for item in range(1, CYCLES):
+        if mask >> item & 1:
+            registers[item] = deltas[offset]
+            offset += 1
+    writes, offset = _get(deltas, offset)
+    cycles, offset = _get(deltas, offset)
+    registers[CYCLES] += cycles
+    return offset, writes
+
+
+def _registers(mpu):
+    return [mpu.pc, mpu.a, mpu.x, mpu.y, mpu.sp, mpu.p,
+            mpu.waiting | mpu.stopped << 1, mpu.processorCycles]
+
+
+def _restore(mpu, registers):
+    (mpu.pc, mpu.a, mpu.x, mpu.y, mpu.sp, mpu.p, halted,
+     mpu.processorCycles) = registers
+    mpu.waiting = bool(halted & 1)
+    mpu.stopped = bool(halted & 2)
+
+
+class Rewind:
+    """Records ``target`` for stepping back, see the module docstring.
+
+    ``target`` is anything with ``snapshot()`` and ``restore(data)`` and
+    an ``mpu`` (a ``Machine``), or an ``MPU`` itself.
+    """
+
+    def __init__(self, target, interval=10000, limit=16 << 20):
+        self.target = target
+        self.mpu = mpu = getattr(target, "mpu", target)
+        self.bus = mpu.bus
+        self.interval = interval
+        self.limit = limit
+        self.segments: deque[Segment] = deque()
+        self.size = 0
+        self.position = 0
+        self.touched = False
+        self.recording = False
+        self.writes = array("I")
+        self.previous: list[int] = []  # registers of the last record
+        self.hooks = []
+        self._keyframe()
+        if self.size > limit:
+            raise ValueError("a keyframe takes %d bytes, more than the"
+                             " limit of %d" % (self.size, limit))
+        bus = self.bus
+        for page in range(0x100):
+            if bus.devices[page] is not None:
+                self._hook(bus.add_read_hook, page, self._touch)
+                self._hook(bus.add_write_hook, page, self._touch)
+            elif bus.mapped[page] and not bus.readonly[page]:
+                self._hook(bus.add_write_hook, page, self._journal)
+        self.cycle = mpu.processorCycles
+
+    def _hook(self, add, page, hook):
+        add(page, hook)
+        self.hooks.append((add, page, hook))
+
+    def close(self):
+        """Remove the bus hooks and drop the history."""
+        bus = self.bus
+        remove = {bus.add_read_hook: bus.remove_read_hook,
+                  bus.add_write_hook: bus.remove_write_hook}
+        for add, page, hook in self.hooks:
+            remove[add](page, hook)
+        self.hooks = []
+        self.segments.clear()
+        self.size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def history(self):
+        """How many instructions ``step_back`` can undo."""
+        return self.position - self.segments[0].start
+
+    # recording
+
+    def _touch(self, addr, value):
+        self.touched = True
+
+    def _journal(self, addr, value):
+        if not self.recording:
+            return
+        old = self.bus.storage[addr >> 8][addr & 0xFF]
+        self.writes.append((addr << 8) | old)
+
+    def _keyframe(self):
+        segment = Segment(self.position, self.target.snapshot(),
+                          _registers(self.mpu))
+        self.previous = segment.base
+        self.segments.append(segment)
+        self.size += segment.size
+        self._trim()
+
+    def _trim(self):
+        segments = self.segments
+        while self.size > self.limit and len(segments) > 1:
+            self.size -= segments.popleft().size
+
+    def _restart(self):
+        """Drop the history, the processor ran without being recorded."""
+        self.segments.clear()
+        self.size = 0
+        self._keyframe()
+
+    def step(self):
+        """Execute one instruction (see ``MPU.step``), recording it."""
+        mpu = self.mpu
+        if mpu.processorCycles != self.cycle:
+            self._restart()
+        segment = self.segments[-1]
+        if len(segment) >= self.interval:
+            self._keyframe()
+            segment = self.segments[-1]
+        registers = _registers(mpu)
+        size = segment.size
+        writes = len(segment.writes)
+        deadline = mpu.scheduler.deadline
+        self.writes = segment.writes
+        self.touched = False
+        self.recording = True
+        try:
+            mpu.step()
+        except BaseException:
+            del segment.writes[writes:]
+            raise
+        finally:
+            self.recording = False
+        segment.record(self.previous, registers, len(segment.writes) - writes,
+                       self.touched or mpu.processorCycles >= deadline)
+        self.previous = registers
+        self.position += 1
+        self.cycle = mpu.processorCycles
+        self.size += segment.size - size
+        if self.size > self.limit:
+            if len(self.segments) == 1:
+                self._keyframe()
+            self._trim()
+
+    def run(self, cycles=None, instructions=None, until_pc=None):
+        """Step until a limit, like ``MPU.run`` but recording."""
+        if cycles is None and instructions is None and until_pc is None:
+            raise ValueError("run() needs a cycle, instruction or pc limit")
+        mpu = self.mpu
+        start = mpu.processorCycles
+        end = start + cycles if cycles is not None else None
+        count = 0
+        reason = "cycles"
+        while True:
+            if count == instructions:
+                reason = "instructions"
+                break
+            if end is not None and mpu.processorCycles >= end:
+                break
+            self.step()
+            count += 1
+            if mpu.pc == until_pc:
+                reason = "until_pc"
+                break
+        return RunResult(mpu.processorCycles - start, count, reason)
+
+    # going back
+
+    def step_back(self, count=1):
+        """Return to the state ``count`` recorded instructions ago."""
+        if count < 0:
+            raise ValueError("cannot step back a negative count")
+        if count > self.history:
+            raise ValueError("history only reaches back %d instructions"
+                             % self.history)
+        if self.mpu.processorCycles != self.cycle:
+            raise ValueError("the processor ran on without being recorded")
+        target = self.position - count
+        if self._touched_since(target):
+            self._replay(target)
+        else:
+            self._undo(target)
+        return count
+
+    def run_back_to(self, pc):
+        """Step back to the latest recorded state with ``pc`` at ``pc``.
+
+        Returns how many instructions were undone.
+        """
+        for segment in reversed(self.segments):
+            registers = list(segment.base)
+            offset = 0
+            latest = None
+            for index in range(len(segment)):
+                offset = _decode(segment.deltas, offset, registers)[0]
+                if registers[PC] == pc:
+                    latest = index
+            if latest is not None:
+                return self.step_back(self.position - segment.start - latest)
+        raise ValueError("$%04X is not in the recorded history" % pc)
+
+    def _touched_since(self, target):
+        for segment in reversed(self.segments):
+            first = max(target - segment.start, 0)
+            if any(segment.touched[first:]):
+                return True
+            if segment.start <= target:
+                return False
+        return False
+
+    def _undo(self, target):
+        mpu = self.mpu
+        bus = self.bus
+        blocks = mpu.blocks
+        while True:
+            segment = self.segments[-1]
+            index = max(target - segment.start, 0)
+            if index < len(segment):
+                previous, offset, mark = segment.seek(index)
+                registers = list(previous)
+                _decode(segment.deltas, offset, registers)
+                for word in reversed(segment.writes[mark:]):
+                    addr = word >> 8
+                    bus.own(addr >> 8)[addr & 0xFF] = word & 0xFF
+                    if blocks is not None:
+                        blocks.invalidate(addr)
+                _restore(mpu, registers)
+                if segment.start <= target:
+                    self._forget(segment, index, offset, mark)
+                    self.previous = previous
+            if segment.start <= target:
+                break
+            self.size -= self.segments.pop().size
+        self.position = target
+        self.cycle = mpu.processorCycles
+
+    def _replay(self, target):
+        while self.segments[-1].start > target:
+            self.size -= self.segments.pop().size
+        segment = self.segments[-1]
+        self._forget(segment, 0)
+        self.previous = segment.base
+        self.target.restore(segment.keyframe)
+        self.position = segment.start
+        self.cycle = self.mpu.processorCycles
+        while self.position < target:
+            self.step()
+
+    def _forget(self, segment, count, offset=0, mark=0):
+        """Drop ``segment`` from its ``count``-th instruction on, see
+        ``Segment.truncate``."""
+        self.size -= segment.size
+        segment.truncate(count, offset, mark)
+        self.size += segment.size
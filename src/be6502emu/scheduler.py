@@ -0,0 +1,105 @@
+"""Events at absolute processor cycles.
+
+Devices post callbacks for the cycle something happens (a timer running
+out, a shift completing) instead of being ticked every instruction, and
+compute anything in between, such as a counter value, from the current
+cycle when it is read.
+
+The MPU owns a scheduler and its run loop executes instructions
+uninterrupted until ``deadline``, the earliest pending event, then fires
+what is due. Events may be posted from inside an instruction (a register
+write starting a timer); the loop notices at the next instruction.
+"""
+
+import heapq
+import itertools
+
+NEVER = 1 << 63
+
+
+class Event:
+    """A callback posted for ``cycle``, see ``Scheduler.post``."""
+
+    __slots__ = ("cycle", "callback", "pending")
+
+    def __init__(self, cycle, callback):
+        self.cycle = cycle
+        self.callback = callback
+        self.pending = True
+
+    def __repr__(self):
+        state = "" if self.pending else " done"
+        return "<Event at cycle %d%s>" % (self.cycle, state)
+
+
+class Scheduler:
+    """Min-heap of events on the ``processorCycles`` clock of ``mpu``."""
+
+    def __init__(self, mpu):
+        self.mpu = mpu
+        self.heap: list[tuple[int, int, Event]] = []
+        self.sequence = itertools.count()
+        # never later than the earliest pending event, may be earlier
+        # while cancelled events are still queued
+        self.deadline = NEVER
+
+    @property
+    def now(self):
+        return self.mpu.processorCycles
+
+    def post(self, cycle, callback):
+        """Call ``callback(cycle)`` once the clock reaches ``cycle``.
+
+        Events due on the same cycle run in the order they were posted.
+        """
+        event = Event(cycle, callback)
+        heapq.heappush(self.heap, (cycle, next(self.sequence), event))
+        if cycle < self.deadline:
+            self.deadline = cycle
+        return event
+
+    def post_in(self, delay, callback):
+        """Post ``callback`` ``delay`` cycles from now."""
+        return self.post(self.now + delay, callback)
+
+    def cancel(self, event):
+        """Drop a pending event; cancelling a fired event is a no-op."""
+        if event is not None:
+            event.pending = False
+
+    def clear(self):
+        """Drop every pending event."""
+        for entry in self.heap:
+            entry[2].pending = False
+        self.heap = []
+        self.deadline = NEVER
+
+    def next_deadline(self):
+        """Cycle of the earliest pending event, None without any."""
+        heap = self.heap
+        while heap and not heap[0][2].pending:
+            heapq.heappop(heap)
+        self.deadline = heap[0][0] if heap else NEVER
+        return heap[0][0] if heap else None
+
+    def poll(self):
+        """Have the run loop come back after the current instruction."""
+        self.deadline = self.mpu.processorCycles
+
+    def run_due(self):
+        """Fire every event due by now, returning how many fired."""
+        heap = self.heap
+        now = self.mpu.processorCycles
+        fired = 0
+        while heap and heap[0][0] <= now:
+            event = heapq.heappop(heap)[2]
+            if not event.pending:
+                continue
+            event.pending = False
+            event.callback(event.cycle)
+            fired += 1
+        self.deadline = heap[0][0] if heap else NEVER
+        return fired
+
+    def __len__(self):
+        return sum(entry[2].pending for entry in self.heap)
@@ -0,0 +1,143 @@
+"""Checkpoints of a whole machine as compact binary blobs.
+
+``save`` serialises the processor registers and flags, the asserted IRQ
+sources, the backing store of the bus and the state of every device
+passed in. Memory is stored as the pages differing from a base image,
+typically the freshly loaded ROM and cleared RAM, so a checkpoint costs a
+few kilobytes instead of 64K. ``load`` puts all of it back.
+
+Devices take part by implementing ``snapshot()``, returning bytes, and
+``restore(data)``. Scheduler events belong to the devices that posted
+them: ``load`` empties the scheduler and each device posts its pending
+events again from its own state. Events posted by anything else are
+dropped. The bus mapping and the device wiring are configuration, not
+state: a snapshot is restored into a machine built the same way.
+
+Layout, little endian, version 1::
+
+    "65SN", version (u16), CRC-32 of the base image (u32)
+    pc (u16), sp, a, x, y, p (u8), processorCycles (u64),
+        waiting, stopped (u8)
+    IRQ source count (u8), then length (u8) and UTF-8 name of each
+    length (u32) of the zlib compressed list of page number (u8) and
+        contents (256 bytes) of the pages differing from the base image
+    device count (u8), then length (u32) and state of each
+"""
+
+import struct
+import zlib
+
+MAGIC = b"65SN"
+VERSION = 1
+SIZE = 0x10000
+PAGE = 0x100
+
+HEADER = struct.Struct("<4sHI")
+CPU = struct.Struct("<HBBBBBQBB")
+LENGTH = struct.Struct("<I")
+
+ZEROS = bytes(SIZE)
+
+
+def save(mpu, devices=(), base=None):
+    """Return the state of ``mpu`` and ``devices`` as bytes.
+
+    ``base`` is the 64K image memory is diffed against, zeros if None.
+    """
+    # bytes compare by memcmp, far quicker than memoryviews
+    base = ZEROS if base is None else bytes(base)
+    if len(base) != SIZE:
+        raise ValueError("base image must be %d bytes" % SIZE)
+    out = [HEADER.pack(MAGIC, VERSION, zlib.crc32(base)),
+           CPU.pack(mpu.pc, mpu.sp, mpu.a, mpu.x, mpu.y, mpu.p,
+                    mpu.processorCycles, mpu.waiting, mpu.stopped)]
+
+    sources = sorted(mpu.irqSources)
+    if not all(isinstance(source, str) for source in sources):
+        raise ValueError("only IRQ sources named by strings can be saved")
+    out.append(bytes((len(sources),)))
+    for source in sources:
+        name = source.encode()
+        out += [bytes((len(name),)), name]
+
+    memory = bytes(mpu.bus.memory[:SIZE])
+    pages = bytearray()
+    for page in range(SIZE // PAGE):
+        start = page * PAGE
+        data = memory[start:start + PAGE]
+        if data != base[start:start + PAGE]:
+            pages.append(page)
+            pages += data
+    packed = zlib.compress(pages, 1)
+    out += [LENGTH.pack(len(packed)), packed]
+
+    out.append(bytes((len(devices),)))
+    for device in devices:
+        state = device.snapshot()
+        out += [LENGTH.pack(len(state)), state]
+    return b"".join(out)
+
+
+def load(mpu, data, devices=(), base=None):
+    """Restore ``mpu`` and ``devices`` from bytes returned by ``save``."""
+    base = ZEROS if base is None else base
+    data = memoryview(data)
+    magic, version, crc = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("not a snapshot")
+    if version != VERSION:
+        raise ValueError("unsupported snapshot version %d" % version)
+    if crc != zlib.crc32(base):
+        raise ValueError("snapshot was taken against another base image")
+    offset = HEADER.size
+    (pc, sp, a, x, y, p, cycles, waiting,
+     stopped) = CPU.unpack_from(data, offset)
+    offset += CPU.size
+
+    sources = set()
+    count = data[offset]
+    offset += 1
+    for _ in range(count):
+        length = data[offset]
+        sources.add(bytes(data[offset + 1:offset + 1 + length]).decode())
+        offset += 1 + length
+
+    (length,) = LENGTH.unpack_from(data, offset)
+    offset += LENGTH.size
+    pages = zlib.decompress(data[offset:offset + length])
+    offset += length
+    image = bytearray(base)
+    for start in range(0, len(pages), PAGE + 1):
+        addr = pages[start] * PAGE
+        image[addr:addr + PAGE] = pages[start + 1:start + 1 + PAGE]
+
+    count = data[offset]
+    offset += 1
+    if count != len(devices):
+        raise ValueError("snapshot holds %d devices, not %d"
+                         % (count, len(devices)))
+    states = []
+    for _ in range(count):
+        (length,) = LENGTH.unpack_from(data, offset)
+        offset += LENGTH.size
+        states.append(bytes(data[offset:offset + length]))
+        offset += length
+
+    memory = mpu.bus.memory
+    if mpu.blocks is not None:
+        # the stores bypass the invalidation hooks, so drop the blocks of
+        # the pages about to change and keep those of the ROM warm
+        current = bytes(memory[0:SIZE])
+        for start in range(0, SIZE, PAGE):
+            if current[start:start + PAGE] != image[start:start + PAGE]:
+                mpu.blocks.invalidate(start, start + PAGE)
+    memory[0:SIZE] = image
+    mpu.pc, mpu.sp, mpu.a, mpu.x, mpu.y, mpu.p = pc, sp, a, x, y, p
+    mpu.processorCycles = cycles
+    mpu.waiting = bool(waiting)
+    mpu.stopped = bool(stopped)
+    mpu.irqSources.clear()
+    mpu.irqSources.update(sources)
+    mpu.scheduler.clear()
+    for device, state in zip(devices, states):
+        device.restore(state)
@@ -0,0 +1,94 @@
+"""Keeping emulated time in step with wall time.
+
+A ``Throttle`` paces a processor running in slices: after each slice the
+caller hands it ``processorCycles`` and it sleeps until the wall clock
+reaches the time that cycle is due at. The clock is only consulted once
+per slice, so pacing costs the same at 1 Hz as at several MHz.
+
+Sleeping overshoots by the scheduling latency of the host; the last
+``spin`` seconds before a deadline are busy-waited to keep that jitter
+low. When the host falls behind, the following slices run back to back
+until the emulation has caught up, unless the lag exceeds ``catch_up``:
+then the backlog is dropped and pacing starts afresh, so a stall does
+not turn into a burst of full speed emulation.
+"""
+
+import time
+from collections import namedtuple
+
+# slices paced, mean and root mean square lateness and the worst seen,
+# in seconds, how often the backlog was dropped and how much time that was
+DriftStats = namedtuple(
+    "DriftStats", ["slices", "mean", "rms", "worst", "slips", "dropped"])
+
+
+class Throttle:
+    """Paces cycles of a processor running at ``clock`` Hz.
+
+    ``slice`` is the wall time between checks, in seconds. ``timer`` must
+    be monotonic.
+    """
+
+    def __init__(self, clock, slice=0.01, catch_up=0.1, spin=0.0005,
+                 timer=time.perf_counter, sleep=time.sleep):
+        if clock <= 0:
+            raise ValueError("clock must be positive")
+        self.clock = clock
+        self.slice = slice
+        self.catch_up = catch_up
+        self.spin = spin
+        self.timer = timer
+        self.sleep = sleep
+        self.origin = None
+        self.base = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.slices = 0
+        self.total = 0.0
+        self.squares = 0.0
+        self.worst = 0.0
+        self.slips = 0
+        self.dropped = 0.0
+
+    @property
+    def stride(self):
+        """Cycles per slice, at least one."""
+        return max(1, int(self.clock * self.slice))
+
+    def start(self, cycle):
+        """Anchor ``cycle`` to now, e.g. after the emulation was paused."""
+        self.origin = self.timer()
+        self.base = cycle
+
+    def pace(self, cycle):
+        """Wait until ``cycle`` is due, returning how late it is now."""
+        if self.origin is None:
+            self.start(cycle)
+            return 0.0
+        due = self.origin + (cycle - self.base) / self.clock
+        now = self.timer()
+        ahead = due - now
+        if ahead > self.spin:
+            self.sleep(ahead - self.spin)
+        if ahead > 0:
+            now = self.timer()
+            while now < due:
+                now = self.timer()
+        late = now - due
+        if late > self.catch_up:
+            self.slips += 1
+            self.dropped += late
+            self.origin, self.base = now, cycle
+        self.slices += 1
+        self.total += late
+        self.squares += late * late
+        self.worst = max(self.worst, late)
+        return late
+
+    @property
+    def stats(self):
+        slices = self.slices or 1
+        return DriftStats(self.slices, self.total / slices,
+                          (self.squares / slices) ** 0.5, self.worst,
+                          self.slips, self.dropped)
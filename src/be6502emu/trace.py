@@ -0,0 +1,143 @@
+"""Ring buffer of the last instructions executed, for post-mortems.
+
+Set ``mpu.trace`` to a ``Trace`` and ``MPU.run`` records, before each
+instruction, the cycle, the program counter, the opcode and the two bytes
+following it and the registers into a preallocated ``bytearray`` of fixed
+size records, overwriting the oldest once full. See ``MPU.run`` for the
+cost of tracing.
+
+Nothing is decoded while recording. ``entries()`` unpacks the records
+and ``lines()`` renders them with the ``MPU.disassemble`` table only when
+asked; ``dump()`` and ``load()`` move the raw records in and out of a
+file. For traces too long to keep, see ``be6502emu.tracefile``.
+
+Dump layout, little endian, version 1::
+
+    "65TR", version (u16), record count (u32), total recorded (u64)
+    records, oldest first: cycle (u64), pc (u16), opcode, two operand
+        bytes, a, x, y, sp, p (u8)
+"""
+
+import struct
+from collections import namedtuple
+
+from be6502emu.codegen import SIZES
+
+MAGIC = b"65TR"
+VERSION = 1
+
+HEADER = struct.Struct("<4sHIQ")
+RECORD = struct.Struct("<QH8B")
+
+Entry = namedtuple("Entry", ["cycle", "pc", "opcode", "operand", "a", "x",
+                             "y", "sp", "p"])
+
+FLAGS = "NV-BDIZC"
+
+FORMATS = {
+    "imp": "", "acc": " A", "imm": " #$%02X", "zpg": " $%02X",
+    "zpx": " $%02X,X", "zpy": " $%02X,Y", "inx": " ($%02X,X)",
+    "iny": " ($%02X),Y", "zpi": " ($%02X)", "rel": " $%04X",
+    "abs": " $%04X", "abx": " $%04X,X", "aby": " $%04X,Y",
+    "ind": " ($%04X)", "iax": " ($%04X,X)",
+}
+
+
+def pack_into(buffer, offset, mpu):
+    """Write the record of the instruction ``mpu`` is about to execute."""
+    pc = mpu.pc
+    storage = mpu.bus.storage
+    RECORD.pack_into(
+        buffer, offset, mpu.processorCycles, pc,
+        storage[pc >> 8][pc & 0xFF],
+        storage[((pc + 1) >> 8) & 0xFF][(pc + 1) & 0xFF],
+        storage[((pc + 2) >> 8) & 0xFF][(pc + 2) & 0xFF],
+        mpu.a, mpu.x, mpu.y, mpu.sp, mpu.p)
+
+
+class Trace:
+    """The last ``size`` instructions, see the module docstring."""
+
+    def __init__(self, size=4096):
+        if size < 1:
+            raise ValueError("a trace holds at least one instruction")
+        self.size = size
+        self.buffer = bytearray(size * RECORD.size)
+        self.offset = 0  # of the next record
+        self.recorded = 0
+
+    def __len__(self):
+        return min(self.recorded, self.size)
+
+    def clear(self):
+        self.offset = 0
+        self.recorded = 0
+
+    def record(self, mpu):
+        """Append the instruction ``mpu`` is about to execute."""
+        pack_into(self.buffer, self.offset, mpu)
+        self.offset += RECORD.size
+        if self.offset == len(self.buffer):
+            self.offset = 0
+        self.recorded += 1
+
+    def _records(self):
+        """The used part of the buffer, oldest record first."""
+        if self.recorded < self.size:
+            return memoryview(self.buffer)[:self.offset]
+        return self.buffer[self.offset:] + self.buffer[:self.offset]
+
+    def entries(self):
+        """Yield an ``Entry`` per record, oldest first."""
+        for (cycle, pc, opcode, low, high, a, x, y, sp,
+             p) in RECORD.iter_unpack(self._records()):
+            yield Entry(cycle, pc, opcode, low | high << 8, a, x, y, sp, p)
+
+    def lines(self, disassemble):
+        """Yield a line of text per record, see ``format_entry``."""
+        for entry in self.entries():
+            yield format_entry(entry, disassemble)
+
+    def dump(self):
+        """Return the records as bytes, see the module docstring."""
+        return HEADER.pack(MAGIC, VERSION, len(self),
+                           self.recorded) + bytes(self._records())
+
+    @classmethod
+    def load(cls, data):
+        """Return a full ``Trace`` holding the records of ``dump()``."""
+        magic, version, count, recorded = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("not a trace")
+        if version != VERSION:
+            raise ValueError("unsupported trace version %d" % version)
+        records = data[HEADER.size:]
+        if len(records) != count * RECORD.size:
+            raise ValueError("trace holds %d bytes of records, not %d"
+                             % (len(records), count * RECORD.size))
+        trace = cls(max(count, 1))
+        trace.buffer[:len(records)] = records
+        trace.offset = len(records) % len(trace.buffer)
+        trace.recorded = recorded if count else 0
+        return trace
+
+
+def format_entry(entry, disassemble):
+    """Render an ``Entry`` as a line of text.
+
+    ``disassemble`` is the ``MPU.disassemble`` table.
+    """
+    name, mode = disassemble[entry.opcode]
+    size = SIZES[mode]
+    operand = entry.operand & (0xFF if size == 1 else 0xFFFF)
+    if mode == "rel":
+        offset = operand - 0x100 if operand & 0x80 else operand
+        operand = (entry.pc + 2 + offset) & 0xFFFF
+    text = name + (FORMATS[mode] % operand if size else FORMATS[mode])
+    code = (entry.opcode, entry.operand & 0xFF, entry.operand >> 8)
+    flags = "".join(flag if entry.p & (0x80 >> bit) else "."
+                    for bit, flag in enumerate(FLAGS))
+    return ("%10d  %04X  %-8s  %-13s  A=%02X X=%02X Y=%02X SP=%02X %s"
+            % (entry.cycle, entry.pc,
+               " ".join("%02X" % byte for byte in code[:1 + size]), text,
+               entry.a, entry.x, entry.y, entry.sp, flags))
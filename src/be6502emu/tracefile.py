@@ -0,0 +1,212 @@
+"""Complete instruction traces streamed to disk.
+
+A ``TraceWriter`` takes the place of a ``Trace`` as ``mpu.trace`` (see
+``be6502emu.trace``) and keeps every record instead of the last few. The
+emulation thread only packs records into a preallocated batch; full
+batches go through a bounded queue to a background thread, which encodes
+and writes them, so emulation waits on the disk only when it gets more
+than ``queue_size`` batches ahead.
+
+Each batch becomes a chunk of fixed width records. With ``delta`` on,
+every record is stored XORed with the one before it, which leaves mostly
+zero bytes as registers and the program counter change little from one
+instruction to the next, and the chunk is deflated. Chunks are decoded
+independently, so a ``TraceReader`` indexes a file by the first cycle of
+each chunk and starts reading at the chunk holding the cycle asked for.
+
+File layout, little endian, version 1::
+
+    "65TS", version (u16), flags (u8, 1 for delta)
+    chunks: first cycle (u64), record count (u32), payload length (u32),
+        payload (the records, see ``trace.RECORD``)
+"""
+
+import bisect
+import os
+import queue
+import struct
+import threading
+import zlib
+
+from be6502emu.trace import RECORD, Entry, pack_into
+
+MAGIC = b"65TS"
+VERSION = 1
+DELTA = 1
+
+HEADER = struct.Struct("<4sHB")
+CHUNK = struct.Struct("<QII")
+
+
+def _open(file, mode):
+    if isinstance(file, (str, bytes, os.PathLike)):
+        return open(file, mode), True
+    return file, False
+
+
+def delta_encode(records):
+    """XOR every record of ``records`` with the one before it."""
+    bits = len(records) * 8
+    value = int.from_bytes(records, "little")
+    value ^= (value << RECORD.size * 8) & ((1 << bits) - 1)
+    return value.to_bytes(len(records), "little")
+
+
+def delta_decode(data):
+    """Undo ``delta_encode``: a prefix XOR over the records."""
+    bits = len(data) * 8
+    mask = (1 << bits) - 1
+    value = int.from_bytes(data, "little")
+    shift = RECORD.size * 8
+    while shift < bits:
+        value ^= (value << shift) & mask
+        shift <<= 1
+    return value.to_bytes(len(data), "little")
+
+
+class TraceWriter:
+    """Streams the records of ``mpu.trace`` to ``file``.
+
+    ``file`` is a path or a binary file opened for writing. Records are
+    handed to the writer thread ``batch`` at a time. Call ``close()``, or
+    use the writer as a context manager, to write the last batch.
+    """
+
+    def __init__(self, file, batch=65536, delta=True, queue_size=4):
+        self.file, self.owned = _open(file, "wb")
+        self.delta = delta
+        self.batch = batch
+        self.buffer = bytearray(batch * RECORD.size)
+        self.offset = 0
+        self.recorded = 0
+        self.error: Exception | None = None
+        self.file.write(HEADER.pack(MAGIC, VERSION, DELTA if delta else 0))
+        self.pending: queue.Queue[bytes | None] = queue.Queue(queue_size)
+        self.thread: threading.Thread | None = threading.Thread(
+            target=self._writer, name="trace writer", daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, mpu):
+        """Append the instruction ``mpu`` is about to execute."""
+        pack_into(self.buffer, self.offset, mpu)
+        self.offset += RECORD.size
+        self.recorded += 1
+        if self.offset == len(self.buffer):
+            self._hand_over()
+
+    def _hand_over(self):
+        if self.error is not None:
+            raise self.error
+        if self.offset:
+            self.pending.put(bytes(memoryview(self.buffer)[:self.offset]))
+            self.offset = 0
+
+    def flush(self):
+        """Queue the records so far, even if the batch is not full."""
+        self._hand_over()
+
+    def close(self):
+        """Write out everything recorded and wait for the thread."""
+        if self.thread is None:
+            return
+        try:
+            self._hand_over()
+        finally:
+            self.pending.put(None)
+            self.thread.join()
+            self.thread = None
+            self.file.flush()
+            if self.owned:
+                self.file.close()
+        if self.error is not None:
+            raise self.error
+
+    def _writer(self):
+        while True:
+            records = self.pending.get()
+            if records is None:
+                return
+            if self.error is not None:
+                continue  # keep draining so record() never blocks
+            try:
+                self._write_chunk(records)
+            except Exception as e:
+                self.error = e
+
+    def _write_chunk(self, records):
+        (first,) = struct.unpack_from("<Q", records)
+        payload = records
+        if self.delta:
+            payload = zlib.compress(delta_encode(records), 1)
+        self.file.write(CHUNK.pack(first, len(records) // RECORD.size,
+                                   len(payload)))
+        self.file.write(payload)
+
+
+class TraceReader:
+    """Reads a file written by ``TraceWriter``.
+
+    The sparse index, the first cycle and offset of every chunk, is built
+    when opening by walking the chunk headers.
+    """
+
+    def __init__(self, file):
+        self.file, self.owned = _open(file, "rb")
+        magic, version, flags = HEADER.unpack(
+            self.file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError("not a trace stream")
+        if version != VERSION:
+            raise ValueError("unsupported trace stream version %d" % version)
+        self.delta = bool(flags & DELTA)
+        self.cycles: list[int] = []
+        # offset of the payload, records and payload length per chunk
+        self.chunks: list[tuple[int, int, int]] = []
+        end = self.file.seek(0, os.SEEK_END)
+        offset = HEADER.size
+        while offset + CHUNK.size <= end:
+            self.file.seek(offset)
+            first, count, length = CHUNK.unpack(self.file.read(CHUNK.size))
+            offset += CHUNK.size
+            if offset + length > end:
+                break  # cut short by a crash
+            self.cycles.append(first)
+            self.chunks.append((offset, count, length))
+            offset += length
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.owned:
+            self.file.close()
+
+    def __len__(self):
+        return sum(count for _, count, _ in self.chunks)
+
+    def _records(self, index):
+        offset, _, length = self.chunks[index]
+        self.file.seek(offset)
+        payload = self.file.read(length)
+        if self.delta:
+            return delta_decode(zlib.decompress(payload))
+        return payload
+
+    def entries(self, start=0):
+        """Yield an ``Entry`` per record from cycle ``start`` on."""
+        index = max(bisect.bisect_right(self.cycles, start) - 1, 0)
+        for index in range(index, len(self.chunks)):
+            for (cycle, pc, opcode, low, high, a, x, y, sp,
+                 p) in RECORD.iter_unpack(self._records(index)):
+                if cycle >= start:
+                    yield Entry(cycle, pc, opcode, low | high << 8, a, x,
+                                y, sp, p)
@@ -0,0 +1,466 @@
+"""W65C22 versatile interface adapter, as used by Ben Eater's computer.
+
+The timers and the shift register are never ticked. Starting one posts an
+event for the cycle it runs out on a ``Scheduler`` and counter values are
+computed from the current cycle when they are read, so a timer costs
+nothing between events.
+
+Devices are wired to ``port_a``/``port_b`` and to the CA1, CA2, CB1 and
+CB2 control line inputs. The IRQ output calls ``irq(asserted)`` whenever
+its level changes, typically bound to ``MPU.set_irq``.
+"""
+
+import struct
+
+# registers, decoded from the low four address bits
+(ORB, ORA, DDRB, DDRA, T1CL, T1CH, T1LL, T1LH,
+ T2CL, T2CH, SR, ACR, PCR, IFR, IER, ORA_NH) = range(16)
+
+# interrupt flag and enable bits
+IRQ = 0x80
+T1 = 0x40
+T2 = 0x20
+CB1 = 0x10
+CB2 = 0x08
+SHIFT = 0x04
+CA1 = 0x02
+CA2 = 0x01
+
+# auxiliary control register
+PB7_OUTPUT = 0x80
+T1_FREE_RUN = 0x40
+T2_COUNT_PULSES = 0x20
+
+# snapshot(): ACR, PCR, IFR, IER, SR, shift count, PB7; output, DDR,
+# input, mask and forced of both ports; latch, count, start, armed and
+# pending event (-1 for none) of both timers; the shift register event;
+# CA1, CA2, CB1, CB2 and IRQ levels
+STATE = struct.Struct("<7B10B" + "HHqBq" * 2 + "q5B")
+
+
+class Port:
+    """One 8-bit port: output register, data direction register and pins.
+
+    ``input`` is the level devices drive onto the pins (undriven pins
+    float high); bits set in ``mask`` are driven by the VIA itself with
+    the value in ``forced`` regardless of the direction register.
+    """
+
+    def __init__(self):
+        self.output = 0x00
+        self.ddr = 0x00
+        self.input = 0xFF
+        self.mask = 0x00
+        self.forced = 0x00
+        self.listeners = []
+        self.driven = None
+
+    @property
+    def pins(self):
+        pins = (self.output & self.ddr) | (self.input & ~self.ddr & 0xFF)
+        return (pins & ~self.mask) | (self.forced & self.mask)
+
+    def connect(self, listener):
+        """Call ``listener(pins)`` whenever the pin levels change."""
+        self.listeners.append(listener)
+
+    def drive(self, value):
+        """Set the level devices drive onto the pins."""
+        old = self.input
+        self.update(input=value & 0xFF)
+        if self.driven is not None:
+            self.driven(old, self.input)
+
+    def update(self, **fields):
+        before = self.pins
+        for name, value in fields.items():
+            setattr(self, name, value)
+        pins = self.pins
+        if pins != before:
+            for listener in tuple(self.listeners):
+                listener(pins)
+
+
+def _cycle(event):
+    return event.cycle if event is not None and event.pending else -1
+
+
+def _edge(old, new, positive):
+    return (new and not old) if positive else (old and not new)
+
+
+class VIA:
+    """The 6522 with its 16 registers mirrored across its address range."""
+
+    def __init__(self, scheduler, irq=None):
+        self.scheduler = scheduler
+        self.irq = irq
+        self.port_a = Port()
+        self.port_b = Port()
+        self.port_b.driven = self._port_b_driven
+        # called with every byte shifted out, asked for every byte
+        # shifted in under timer or clock control
+        self.shift_out = None
+        self.shift_in = None
+
+        self.t1_event = None
+        self.t2_event = None
+        self.sr_event = None
+        self.irq_line = False
+        self.reset()
+
+    def reset(self):
+        """The RESB line: clears every register but the timers."""
+        cancel = self.scheduler.cancel
+        cancel(self.sr_event)
+        self.sr_event = None
+        self.acr = 0
+        self.pcr = 0
+        self.ifr = 0
+        self.ier = 0
+        self.sr = 0
+        self.sr_bits = 0
+        self._update_irq()
+        self.pb7 = 0x80
+        for port in (self.port_a, self.port_b):
+            port.update(output=0x00, ddr=0x00, mask=0x00)
+
+        if self.t1_event is None:
+            self.t1_latch = 0
+            self.t1_count = 0
+            self.t1_start = 0
+            self.t1_armed = False
+        if self.t2_event is None:
+            self.t2_latch = 0
+            self.t2_count = 0
+            self.t2_start = 0
+            self.t2_armed = False
+        self.ca1_level = self.ca2_level = True
+        self.cb1_level = self.cb2_level = True
+
+    def snapshot(self):
+        """Serialise the register, timer and pin state."""
+        fields = [self.acr, self.pcr, self.ifr, self.ier, self.sr,
+                  self.sr_bits, self.pb7]
+        for port in (self.port_a, self.port_b):
+            fields += [port.output, port.ddr, port.input, port.mask,
+                       port.forced]
+        fields += [self.t1_latch, self.t1_count, self.t1_start,
+                   self.t1_armed, _cycle(self.t1_event),
+                   self.t2_latch, self.t2_count, self.t2_start,
+                   self.t2_armed, _cycle(self.t2_event),
+                   _cycle(self.sr_event),
+                   self.ca1_level, self.ca2_level, self.cb1_level,
+                   self.cb2_level, self.irq_line]
+        return STATE.pack(*fields)
+
+    def restore(self, data):
+        """Return to a ``snapshot()``, posting its pending events again.
+
+        Port listeners and the IRQ output are not called, the state they
+        reflect is restored along with this.
+        """
+        fields = list(STATE.unpack(data))
+        (self.acr, self.pcr, self.ifr, self.ier, self.sr, self.sr_bits,
+         self.pb7) = fields[:7]
+        for index, port in enumerate((self.port_a, self.port_b)):
+            (port.output, port.ddr, port.input, port.mask,
+             port.forced) = fields[7 + 5 * index:12 + 5 * index]
+        (self.t1_latch, self.t1_count, self.t1_start, t1_armed, t1_event,
+         self.t2_latch, self.t2_count, self.t2_start, t2_armed, t2_event,
+         sr_event, ca1, ca2, cb1, cb2, irq_line) = fields[17:]
+        self.t1_armed, self.t2_armed = bool(t1_armed), bool(t2_armed)
+        self.ca1_level, self.ca2_level = bool(ca1), bool(ca2)
+        self.cb1_level, self.cb2_level = bool(cb1), bool(cb2)
+        self.irq_line = bool(irq_line)
+        post = self.scheduler.post
+        for name in ("t1_event", "t2_event", "sr_event"):
+            self.scheduler.cancel(getattr(self, name))
+        self.t1_event = None if t1_event < 0 else post(
+            t1_event, self._t1_expired)
+        self.t2_event = None if t2_event < 0 else post(
+            t2_event, self._t2_expired)
+        self.sr_event = None if sr_event < 0 else post(
+            sr_event, self._shifted)
+
+    # processor interface
+
+    def read(self, addr):
+        reg = addr & 0x0F
+        if reg == ORB:
+            self._clear(CB1 | (0 if self.pcr & 0xA0 == 0x20 else CB2))
+            return self.port_b.pins
+        if reg == ORA:
+            self._clear(CA1 | (0 if self.pcr & 0x0A == 0x02 else CA2))
+            return self.port_a.pins
+        if reg == ORA_NH:
+            return self.port_a.pins
+        if reg == DDRB:
+            return self.port_b.ddr
+        if reg == DDRA:
+            return self.port_a.ddr
+        if reg == T1CL:
+            self._clear(T1)
+            return self.t1_counter() & 0xFF
+        if reg == T1CH:
+            return self.t1_counter() >> 8
+        if reg == T1LL:
+            return self.t1_latch & 0xFF
+        if reg == T1LH:
+            return self.t1_latch >> 8
+        if reg == T2CL:
+            self._clear(T2)
+            return self.t2_counter() & 0xFF
+        if reg == T2CH:
+            return self.t2_counter() >> 8
+        if reg == SR:
+            self._clear(SHIFT)
+            self._start_shift()
+            return self.sr
+        if reg == ACR:
+            return self.acr
+        if reg == PCR:
+            return self.pcr
+        if reg == IFR:
+            return self.ifr | (IRQ if self.ifr & self.ier else 0)
+        return self.ier | 0x80
+
+    def stable(self, addr):
+        """True when rereading ``addr`` gives the same value until an event.
+
+        Port and flag reads only change through events or processor
+        writes; the counters and the shift register do not qualify.
+        """
+        return addr & 0x0F not in (T1CL, T1CH, T2CL, T2CH, SR)
+
+    def write(self, addr, value):
+        reg = addr & 0x0F
+        if reg == ORB:
+            self._clear(CB1 | (0 if self.pcr & 0xA0 == 0x20 else CB2))
+            self.port_b.update(output=value)
+        elif reg == ORA:
+            self._clear(CA1 | (0 if self.pcr & 0x0A == 0x02 else CA2))
+            self.port_a.update(output=value)
+        elif reg == ORA_NH:
+            self.port_a.update(output=value)
+        elif reg == DDRB:
+            self.port_b.update(ddr=value)
+        elif reg == DDRA:
+            self.port_a.update(ddr=value)
+        elif reg in (T1CL, T1LL):
+            self.t1_latch = (self.t1_latch & 0xFF00) | value
+        elif reg == T1CH:
+            self.t1_latch = (self.t1_latch & 0x00FF) | (value << 8)
+            self._clear(T1)
+            self._start_t1()
+        elif reg == T1LH:
+            self.t1_latch = (self.t1_latch & 0x00FF) | (value << 8)
+            self._clear(T1)
+        elif reg == T2CL:
+            self.t2_latch = value
+        elif reg == T2CH:
+            self._clear(T2)
+            self._start_t2(self.t2_latch | (value << 8))
+        elif reg == SR:
+            self._clear(SHIFT)
+            self.sr = value
+            self._start_shift()
+        elif reg == ACR:
+            self._write_acr(value)
+        elif reg == PCR:
+            self.pcr = value
+        elif reg == IFR:
+            self._clear(value & 0x7F)
+        elif value & 0x80:
+            self.ier |= value & 0x7F
+            self._update_irq()
+        else:
+            self.ier &= ~value
+            self._update_irq()
+
+    def _write_acr(self, value):
+        changed = value ^ self.acr
+        t2 = self.t2_counter()
+        self.acr = value
+        if changed & T2_COUNT_PULSES:
+            self.scheduler.cancel(self.t2_event)
+            self.t2_event = None
+            self.t2_count = t2
+            if not value & T2_COUNT_PULSES:
+                self._start_t2(t2, delay=1)
+        if changed & T1_FREE_RUN and value & T1_FREE_RUN \
+                and self.t1_event is None:
+            # picks up at the next time the counter runs out
+            self.t1_event = self.scheduler.post_in(
+                self.t1_counter() + 1, self._t1_expired)
+        if changed & PB7_OUTPUT:
+            self.port_b.update(mask=value & PB7_OUTPUT, forced=self.pb7)
+
+    # timers, counters run down from the cycle after they are loaded
+
+    def t1_counter(self):
+        elapsed = self.scheduler.now - self.t1_start - 1
+        if elapsed < 0:
+            return self.t1_count
+        return (self.t1_count - elapsed) & 0xFFFF
+
+    def t2_counter(self):
+        if self.acr & T2_COUNT_PULSES:
+            return self.t2_count
+        elapsed = self.scheduler.now - self.t2_start - 1
+        if elapsed < 0:
+            return self.t2_count
+        return (self.t2_count - elapsed) & 0xFFFF
+
+    def _start_t1(self):
+        scheduler = self.scheduler
+        scheduler.cancel(self.t1_event)
+        self.t1_start = scheduler.now
+        self.t1_count = self.t1_latch
+        self.t1_armed = True
+        # the flag rises on the cycle after the counter passes zero
+        self.t1_event = scheduler.post(
+            self.t1_start + self.t1_count + 2, self._t1_expired)
+        if self.acr & PB7_OUTPUT:
+            self._set_pb7(0x00)
+
+    def _t1_expired(self, cycle):
+        self.t1_event = None
+        if self.acr & T1_FREE_RUN:
+            # reloads from the latch, the period is latch + 2 cycles
+            self.t1_start = cycle
+            self.t1_count = self.t1_latch
+            self.t1_event = self.scheduler.post(
+                cycle + self.t1_latch + 2, self._t1_expired)
+            self.t1_armed = False
+            self._set_pb7(self.pb7 ^ 0x80)
+            self._flag(T1)
+        elif self.t1_armed:
+            self.t1_armed = False
+            self._set_pb7(0x80)
+            self._flag(T1)
+
+    def _set_pb7(self, level):
+        self.pb7 = level
+        self.port_b.update(forced=level)
+
+    def _start_t2(self, count, delay=0):
+        scheduler = self.scheduler
+        scheduler.cancel(self.t2_event)
+        self.t2_event = None
+        self.t2_count = count
+        self.t2_armed = delay == 0 or self.t2_armed
+        if self.acr & T2_COUNT_PULSES:
+            return
+        self.t2_start = scheduler.now - delay
+        if self.t2_armed:
+            self.t2_event = scheduler.post(
+                self.t2_start + count + 2, self._t2_expired)
+
+    def _t2_expired(self, cycle):
+        self.t2_event = None
+        if self.t2_armed:
+            self.t2_armed = False
+            self._flag(T2)
+
+    def _port_b_driven(self, old, new):
+        # pulse counting mode counts falling edges on PB6
+        if self.acr & T2_COUNT_PULSES and old & ~new & 0x40:
+            self.t2_count = (self.t2_count - 1) & 0xFFFF
+            if self.t2_count == 0 and self.t2_armed:
+                self.t2_armed = False
+                self._flag(T2)
+
+    # shift register
+
+    def _start_shift(self):
+        self.scheduler.cancel(self.sr_event)
+        self.sr_event = None
+        mode = (self.acr >> 2) & 7
+        if mode == 0:
+            return
+        self.sr_bits = 8
+        if mode in (3, 7):
+            return  # clocked by CB1
+        if mode in (2, 6):
+            period = 2
+        else:
+            period = 2 * ((self.t2_latch & 0xFF) + 2)
+        self.sr_event = self.scheduler.post_in(8 * period, self._shifted)
+
+    def _shifted(self, cycle):
+        self.sr_event = None
+        self.sr_bits = 0
+        mode = (self.acr >> 2) & 7
+        if mode & 4:
+            if self.shift_out is not None:
+                self.shift_out(self.sr)
+        elif self.shift_in is not None:
+            self.sr = self.shift_in() & 0xFF
+        if mode == 4:
+            self._start_shift()  # free running, never flags
+        elif mode:
+            self._flag(SHIFT)
+
+    def _external_shift(self):
+        mode = (self.acr >> 2) & 7
+        if mode not in (3, 7) or not self.sr_bits:
+            return
+        if mode == 3:
+            self.sr = ((self.sr << 1) | self.cb2_level) & 0xFF
+        else:
+            self.sr = ((self.sr << 1) | (self.sr >> 7)) & 0xFF
+        self.sr_bits -= 1
+        if not self.sr_bits:
+            if mode == 7 and self.shift_out is not None:
+                self.shift_out(self.sr)
+            self._flag(SHIFT)
+
+    # control line inputs
+
+    def ca1(self, level):
+        level = bool(level)
+        if _edge(self.ca1_level, level, self.pcr & 0x01):
+            self._flag(CA1)
+        self.ca1_level = level
+
+    def ca2(self, level):
+        level = bool(level)
+        if not self.pcr & 0x08 and _edge(self.ca2_level, level,
+                                         self.pcr & 0x04):
+            self._flag(CA2)
+        self.ca2_level = level
+
+    def cb1(self, level):
+        level = bool(level)
+        old = self.cb1_level
+        self.cb1_level = level
+        if _edge(old, level, self.pcr & 0x10):
+            self._flag(CB1)
+        if level and not old:
+            self._external_shift()
+
+    def cb2(self, level):
+        level = bool(level)
+        if not self.pcr & 0x80 and _edge(self.cb2_level, level,
+                                         self.pcr & 0x40):
+            self._flag(CB2)
+        self.cb2_level = level
+
+    # interrupts
+
+    def _flag(self, bits):
+        self.ifr |= bits
+        self._update_irq()
+
+    def _clear(self, bits):
+        if self.ifr & bits:
+            self.ifr &= ~bits
+            self._update_irq()
+
+    def _update_irq(self):
+        asserted = bool(self.ifr & self.ier & 0x7F)
+        if asserted != self.irq_line:
+            self.irq_line = asserted
+            if self.irq is not None:
+                self.irq(asserted)
@@ -0,0 +1,39 @@
+"""Programs and comparisons shared by the test modules."""
+
+from be6502emu.bench.workloads import HELLO_ROM
+from be6502emu.machine import Machine
+from be6502emu.mpu import MPU
+
+
+def state(mpu):
+    """Everything that tells two processors apart, memory included."""
+    return (mpu.pc, mpu.a, mpu.x, mpu.y, mpu.sp, mpu.p, mpu.processorCycles,
+            mpu.waiting, mpu.stopped, bytes(mpu.bus.memory))
+
+
+def counter(engine="reference"):
+    """An MPU at $0200 counting at $00, copying the count to $0300."""
+    mpu = MPU(engine=engine)
+    # $0200 LDX $00; INX; STX $00; STX $0300; JMP $0200
+    mpu.load(0x0200, (0xA6, 0x00, 0xE8, 0x86, 0x00, 0x8E, 0x00, 0x03, 0x4C,
+                      0x00, 0x02))
+    mpu.pc = 0x0200
+    return mpu
+
+
+def timer_machine(engine):
+    """A Machine printing hello world, then sleeping between VIA timer
+    interrupts and counting them at $00."""
+    # $802F JMP $8200
+    # $8200 LDA #$40; STA ACR; LDA #$C0; STA IER; LDA #$E6; STA T1CL;
+    #       LDA #$03; STA T1CH; CLI; WAI; BRA *-1
+    # $8100 INC $00; BIT T1CL; RTI
+    rom = bytearray(HELLO_ROM)
+    rom[0x30:0x32] = (0x00, 0x82)
+    rom[0x200:0x218] = (
+        0xA9, 0x40, 0x8D, 0x0B, 0x60, 0xA9, 0xC0, 0x8D, 0x0E, 0x60,
+        0xA9, 0xE6, 0x8D, 0x04, 0x60, 0xA9, 0x03, 0x8D, 0x05, 0x60,
+        0x58, 0xCB, 0x80, 0xFD)
+    rom[0x100:0x106] = (0xE6, 0x00, 0x2C, 0x04, 0x60, 0x40)
+    rom[0x7FFC:0x8000] = (0x00, 0x80, 0x00, 0x81)
+    return Machine(bytes(rom), engine=engine)
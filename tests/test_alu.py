@@ -0,0 +1,47 @@
+import random
+
+from be6502emu import alu
+from be6502emu.mpu import MPU
+
+
+def _reference(op, p, a, data):
+    mpu = MPU()
+    mpu.p = p
+    mpu.a = a
+    mpu.memory[0x0000] = data
+    getattr(mpu, op)(mpu.ProgramCounter)
+    return mpu.a, mpu.p
+
+
+def test_decimal_tables_match_reference_on_bcd_operands():
+    digits = [(n // 10) << 4 | n % 10 for n in range(100)]
+    for name, op in (("ADC", "opADC"), ("SBC", "opSBC")):
+        table = alu.table(name)
+        for p in (MPU.DECIMAL, MPU.DECIMAL | MPU.CARRY):
+            for a in digits:
+                for data in digits[::7]:
+                    value = table[alu.adc_index(p, a, data)]
+                    expected_a, expected_p = _reference(op, p, a, data)
+                    assert expected_a == value & 0xFF
+                    assert expected_p == p & ~0xC3 | value >> 8
+
+
+def test_arithmetic_tables_match_reference_on_random_operands():
+    rng = random.Random(65)
+    for name, op in (("ADC", "opADC"), ("SBC", "opSBC")):
+        table = alu.table(name)
+        for _ in range(2000):
+            p = rng.choice((0, 1, 8, 9)) | MPU.BREAK | MPU.UNUSED
+            a = rng.randrange(256)
+            data = rng.randrange(256)
+            value = table[alu.adc_index(p, a, data)]
+            assert _reference(op, p, a, data) == (
+                value & 0xFF, p & ~0xC3 | value >> 8)
+
+
+def test_lazy_table_rebinds_its_global():
+    namespace: dict[str, object] = {}
+    namespace["NZ"] = alu.LazyTable("NZ", namespace)
+    assert MPU.ZERO == namespace["NZ"][0]  # type: ignore[index]
+    assert namespace["NZ"] is alu.table("NZ")
+    assert MPU.NEGATIVE == namespace["NZ"][0x80]  # type: ignore[index]
@@ -0,0 +1,122 @@
+import pytest
+
+from be6502emu.bench import workloads
+from be6502emu.mpu import MPU
+
+np = pytest.importorskip("numpy")
+batch_module = pytest.importorskip("be6502emu.batch")
+BatchMPU = batch_module.BatchMPU
+
+
+def _registers(mpu):
+    return (mpu.a, mpu.x, mpu.y, mpu.sp, mpu.p, mpu.pc, mpu.processorCycles,
+            mpu.waiting, mpu.stopped)
+
+
+def test_lanes_match_the_reference_on_random_memory():
+    # random bytes reach every opcode, WAI and STP included
+    generator = np.random.default_rng(6502)
+    lanes = 64
+    images = generator.integers(0, 256, (lanes, 0x10000), dtype=np.uint8)
+    registers = generator.integers(0, 256, (5, lanes))
+    registers[4] |= MPU.BREAK | MPU.UNUSED
+    batch = BatchMPU(lanes, images, pc=0x0200)
+    for name, values in zip(("a", "x", "y", "sp", "p"), registers):
+        getattr(batch, name)[:] = values
+    result = batch.run(cycles=400, instructions=100)
+    assert {"instructions", "stopped", "waiting"} <= set(result.reason)
+
+    for index in range(lanes):
+        mpu = MPU(bytearray(images[index].tobytes()), pc=0x0200)
+        mpu.a, mpu.x, mpu.y, mpu.sp, mpu.p = map(int, registers[:, index])
+        expected = mpu.run(cycles=400, instructions=100)
+        lane = batch.lane(index)
+        assert _registers(mpu) == _registers(lane)
+        assert bytes(mpu.dump()) == lane.dump()
+        assert (expected.cycles, expected.instructions, expected.reason) == (
+            result.cycles[index], result.instructions[index],
+            result.reason[index])
+
+
+def test_lanes_diverge_on_their_inputs():
+    # decimal counters starting from different values, so carries differ
+    batch = BatchMPU.from_mpu(workloads.bcd("reference"), 100)
+    starts = [int("%02d" % n, 16) for n in range(100)]
+    batch.memory[:, 0x10] = starts
+    result = batch.run(instructions=1 + 12 * 150)
+    assert ["instructions"] * 100 == result.reason
+    assert {1, 2} == set(batch.memory[:, 0x11].tolist())
+    for index in (0, 37, 99):
+        mpu = workloads.bcd("reference")
+        mpu.memory[0x10] = starts[index]
+        mpu.run(instructions=1 + 12 * 150)
+        lane = batch.lane(index)
+        assert _registers(mpu) == _registers(lane)
+        assert bytes(mpu.dump(0, 0x20)) == lane.dump(0, 0x20)
+    assert ["until_pc"] * 100 == batch.run(until_pc=0x0215).reason
+    assert [0x0215] * 100 == batch.pc.tolist()
+
+
+def test_instruction_counts_are_per_lane():
+    mpu = workloads.recursion("block")
+    batch = BatchMPU.from_mpu(mpu, 3)
+    batch.stopped[1] = True
+    result = batch.run(instructions=500)
+    assert ["instructions", "stopped", "instructions"] == result.reason
+    assert [500, 0, 500] == result.instructions.tolist()
+    mpu.run(instructions=500)
+    assert _registers(mpu) == _registers(batch.lane(2))
+    assert bytes(mpu.dump()) == batch.lane(0).dump()
+
+
+def test_interrupts_wake_and_vector_lanes():
+    mpu = MPU(pc=0x0200)
+    # $0200 CLI; WAI; JMP $0201; $0300 INC $20; RTI
+    mpu.load(0x0200, (0x58, 0xCB, 0x4C, 0x01, 0x02))
+    mpu.load(0x0300, (0xE6, 0x20, 0x40))
+    mpu.load(MPU.IRQ, (0x00, 0x03))
+    mpu.load(MPU.NMI, (0x00, 0x03))
+    batch = BatchMPU.from_mpu(mpu, 4)
+    assert ["waiting"] * 4 == batch.run(instructions=10).reason
+    batch.irq([1, 2])
+    batch.nmi(3)
+    assert [True, False, False, False] == batch.waiting.tolist()
+    result = batch.run(instructions=5)
+    assert ["waiting"] * 4 == result.reason
+    assert [0, 4, 4, 4] == result.instructions.tolist()
+    assert [0, 1, 1, 1] == batch.memory[:, 0x20].tolist()
+
+    mpu.run(instructions=10)
+    mpu.irq()
+    mpu.run(instructions=5)
+    assert _registers(mpu) == _registers(batch.lane(1))
+    # a halted lane waits out a cycle budget
+    result = batch.run(cycles=100)
+    assert [100] * 4 == result.cycles.tolist()
+
+
+def test_lane_api():
+    batch = BatchMPU(2, pc=None)
+    lane = batch.lane(-1)
+    assert 1 == lane.index
+    lane.load(0xFFFC, (0x00, 0x02))
+    lane.load(0x0200, (0xA9, 0x42, 0xDB))  # LDA #$42; STP
+    batch.reset()
+    assert (0x0000, 0x0200) == (batch.lane(0).pc, lane.pc)
+    lane.x = 7
+    assert 7 == batch.x[1]
+    batch.run(instructions=5)
+    assert (0x42, 0x0203, True) == (lane.a, lane.pc, lane.stopped)
+    assert "0203 42 07 00 ff" in repr(lane)
+
+    mpu = lane.to_mpu("generated")
+    assert _registers(lane) == _registers(mpu)
+    assert lane.dump(0x0200, 3) == bytes(mpu.dump(0x0200, 3))
+    assert 2 == len(batch) == len(list(batch))
+
+    with pytest.raises(IndexError):
+        batch.lane(2)
+    with pytest.raises(ValueError):
+        batch.run()
+    with pytest.raises(ValueError):
+        BatchMPU(0)
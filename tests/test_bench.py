@@ -0,0 +1,94 @@
+import json
+
+import pytest
+
+from be6502emu import bench
+from be6502emu.bench import workloads
+from be6502emu.machine import Machine
+from be6502emu.mpu import MPU
+
+
+def _by_name(name):
+    return next(w for w in bench.WORKLOADS if w.name == name)
+
+
+@pytest.mark.parametrize("name", [w.name for w in bench.WORKLOADS])
+def test_engines_agree_on_every_workload(name):
+    workload = _by_name(name)
+    states = []
+    for engine in MPU.ENGINES:
+        mpu = workload.build(engine)
+        result = mpu.run(instructions=20000)
+        assert ("instructions", 20000) == (result.reason, result.instructions)
+        states.append((mpu.a, mpu.x, mpu.y, mpu.sp, mpu.p, mpu.pc,
+                       mpu.processorCycles, mpu.dump(0, 0x3000)))
+    assert states[0] == states[1] == states[2]
+
+
+def test_workloads_do_their_work():
+    mpu = workloads.copy("reference")
+    mpu.run(instructions=20000)
+    assert mpu.dump(0x1000, 0x800) == mpu.dump(0x2000, 0x800)
+
+    mpu = workloads.storm("reference")
+    result = mpu.run(instructions=5000)
+    # an interrupt every 100 cycles
+    interrupts = result.cycles // workloads.STORM_PERIOD
+    assert interrupts - 1 <= mpu.memory[0x20] <= interrupts
+
+    mpu = workloads.bcd("reference")
+    mpu.run(instructions=1 + 12 * 150)
+    assert (0x50, 0x01) == (mpu.memory[0x10], mpu.memory[0x11])
+    assert 0x50 == mpu.memory[0x12]
+
+    machine = Machine(workloads.HELLO_ROM)
+    # printed, about to start over
+    result = machine.run(cycles=100000, until_pc=0x802F)
+    assert "until_pc" == result.reason
+    assert "Hello, world!" == machine.lcd.text()[0].rstrip()
+
+
+def test_measure_reports_throughput():
+    ticks = iter([0.0, 0.5, 1.0, 1.25])
+    result = bench.measure(_by_name("alu"), "reference", instructions=1000,
+                           repeat=2, timer=lambda: next(ticks))
+    assert 4000 == result["instructions_per_second"]
+    mpu = workloads.alu("reference")
+    mpu.run(instructions=1000)
+    cycles = mpu.run(instructions=1000).cycles
+    assert round(cycles * 4 / 1e6, 3) == result["mhz"]
+
+
+def test_baseline_round_trips_and_gates(tmp_path):
+    path = tmp_path / "baseline.json"
+    results = bench.run_all(bench.WORKLOADS[:2], ("reference",),
+                            instructions=500, repeat=1)
+    assert ["alu", "bcd"] == list(results)
+    bench.save(path, results)
+    assert results == bench.load(path)
+
+    slower = json.loads(json.dumps(results))
+    ips = slower["bcd"]["reference"]["instructions_per_second"]
+    slower["bcd"]["reference"]["instructions_per_second"] = ips * 0.85
+    assert [] == bench.compare(slower, results, threshold=0.2)
+    assert [bench.Regression("bcd", "reference", ips, ips * 0.85)] == (
+        bench.compare(slower, results, threshold=0.1))
+    assert [] == bench.compare(slower, {}, threshold=0.1)
+
+    document = json.loads(path.read_text())
+    document["version"] = 0
+    path.write_text(json.dumps(document))
+    with pytest.raises(ValueError):
+        bench.load(path)
+
+
+def test_command_line_fails_on_regression(tmp_path, capsys):
+    path = tmp_path / "baseline.json"
+    argv = ["-w", "alu", "-e", "reference", "-n", "500", "-r", "1"]
+    assert 0 == bench.main(argv + ["--save", str(path)])
+    results = bench.load(path)
+    results["alu"]["reference"]["instructions_per_second"] *= 1000
+    bench.save(path, results)
+    assert 1 == bench.main(argv + ["--baseline", str(path)])
+    out = capsys.readouterr().out
+    assert "regression: alu on reference" in out
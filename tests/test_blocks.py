@@ -0,0 +1,95 @@
+from be6502emu.mpu import MPU
+from tests.helpers import state
+
+
+def _write(memory, start_address, bytes):  # NOQA
+    # fmt: off
+    memory[start_address: start_address + len(bytes)] = bytes
+    # fmt: on
+
+
+def _loop_program(mpu):
+    # $0200 LDX #$00
+    # $0202 LDY #$00
+    # $0204 TXA
+    # $0205 CLC
+    # $0206 ADC #$03
+    # $0208 STA $0300,X
+    # $020B JSR $0220
+    # $020E INX
+    # $020F BNE $0204
+    # $0211 JMP $0211
+    _write(mpu.memory, 0x0200, (0xA2, 0x00, 0xA0, 0x00, 0x8A, 0x18, 0x69,
+                                0x03, 0x9D, 0x00, 0x03, 0x20, 0x20, 0x02,
+                                0xE8, 0xD0, 0xF3, 0x4C, 0x11, 0x02))
+    # $0220 INY
+    # $0221 ADC $10
+    # $0223 STA $10
+    # $0225 RTS
+    _write(mpu.memory, 0x0220, (0xC8, 0x65, 0x10, 0x85, 0x10, 0x60))
+    mpu.pc = 0x0200
+
+
+def test_block_engine_matches_reference():
+    reference = MPU()
+    _loop_program(reference)
+    blocks = MPU(engine="block")
+    _loop_program(blocks)
+
+    for budget in (1, 7, 50, 333, 5000):
+        expected = reference.run(cycles=budget)
+        result = blocks.run(cycles=budget)
+        assert expected == result
+        assert state(reference) == state(blocks)
+
+    assert blocks.blocks.built > 0
+
+
+def test_block_engine_stops_on_instruction_and_pc_limits():
+    reference = MPU()
+    _loop_program(reference)
+    blocks = MPU(engine="block")
+    _loop_program(blocks)
+
+    assert reference.run(instructions=123) == blocks.run(instructions=123)
+    assert state(reference) == state(blocks)
+    assert reference.run(until_pc=0x020E) == blocks.run(until_pc=0x020E)
+    assert state(reference) == state(blocks)
+
+
+def test_block_engine_sees_self_modifying_code():
+    reference = MPU()
+    blocks = MPU(engine="block")
+    for mpu in (reference, blocks):
+        # $0200 LDA $10
+        # $0202 STA $0206
+        # $0205 LDA $0300
+        # $0208 STA $11
+        # $020A INC $10
+        # $020C JMP $0200
+        _write(mpu.memory, 0x0200, (0xA5, 0x10, 0x8D, 0x06, 0x02, 0xAD, 0x00,
+                                    0x03, 0x85, 0x11, 0xE6, 0x10, 0x4C, 0x00,
+                                    0x02))
+        _write(mpu.memory, 0x0300, range(0x50, 0x60))
+        mpu.pc = 0x0200
+        mpu.run(instructions=6 * 10)
+
+    assert 0x59 == blocks.memory[0x11]
+    assert state(reference) == state(blocks)
+    assert blocks.blocks.invalidated > 0
+
+
+def test_block_engine_sees_reloaded_code():
+    reference = MPU()
+    blocks = MPU(engine="block")
+    for mpu in (reference, blocks):
+        # $0200 LDA #$33; JMP $0200
+        mpu.load(0x0200, (0xA9, 0x33, 0x4C, 0x00, 0x02))
+        mpu.pc = 0x0200
+        mpu.run(instructions=10)
+        # LDX #$33 in place of the LDA
+        mpu.load(0x0200, [0xA2, 0x33])
+        mpu.run(instructions=10)
+
+    assert (0x33, 0x33) == (blocks.a, blocks.x)
+    assert state(reference) == state(blocks)
@@ -0,0 +1,126 @@
+from be6502emu.bus import Bus, ben_eater
+from be6502emu.mpu import MPU
+
+
+class Registers:
+    def __init__(self):
+        self.values = bytearray(16)
+        self.reads = []
+        self.writes = []
+
+    def read(self, addr):
+        self.reads.append(addr)
+        return self.values[addr & 0x0F]
+
+    def write(self, addr, value):
+        self.writes.append((addr, value))
+        self.values[addr & 0x0F] = value
+
+
+def _write(memory, start_address, bytes):
+    memory[start_address:start_address + len(bytes)] = bytes
+
+
+def test_rom_ignores_stores():
+    bus = Bus()
+    bus.map_rom(0x8000, 0x10000, b"\xEA" * 0x8000)
+    bus[0x8000] = 0x00
+    assert 0xEA == bus[0x8000]
+    bus[0x0200] = 0x11
+    assert 0x11 == bus[0x0200]
+
+
+def test_unmapped_space_reads_zero():
+    bus = Bus()
+    bus.load(0x4000, b"\x55")
+    bus.unmap(0x4000, 0x6000)
+    bus[0x4001] = 0x66
+    assert 0x00 == bus[0x4000]
+    assert 0x00 == bus[0x4001]
+
+
+def test_ben_eater_preset_mirrors_via_registers():
+    via = Registers()
+    bus = ben_eater(rom=b"\x00" * 0x7FFC + b"\x00\x80\x00\x00", via=via)
+    mpu = MPU(memory=bus, pc=None)
+    assert 0x8000 == mpu.pc
+    # LDA #$FF; STA $6002; STA $7FF3; LDA $6012
+    bus.load(0x0200, (0xA9, 0xFF, 0x8D, 0x02, 0x60, 0x8D, 0xF3, 0x7F,
+                      0xAD, 0x12, 0x60))
+    mpu.pc = 0x0200
+    mpu.run(instructions=4)
+    assert [(0x6002, 0xFF), (0x7FF3, 0xFF)] == via.writes
+    assert [0x6012] == via.reads
+    assert 0xFF == mpu.a
+
+
+def test_mirror_repeats_a_mapping():
+    bus = Bus()
+    bus.mirror(0x0800, 0x2000, 0x0000, 0x0800)
+    bus[0x0010] = 0x42
+    assert 0x42 == bus[0x0810]
+    assert 0x42 == bus[0x1810]
+
+
+def test_hooks_only_watch_their_page():
+    bus = Bus()
+    seen = []
+
+    def hook(addr, value):
+        seen.append((addr, value))
+
+    bus.add_write_hook(0x02, hook)
+    bus.add_read_hook(0x02, hook)
+    bus[0x0200] = 0x01
+    bus[0x0300] = 0x02
+    assert 0x01 == bus[0x0200]
+    assert [(0x0200, 0x01), (0x0200, 0x01)] == seen
+    bus.remove_write_hook(0x02, hook)
+    bus.remove_read_hook(0x02, hook)
+    bus[0x0201] = 0x03
+    assert 2 == len(seen)
+    assert bus.writePages[0x02] is bus.storage[0x02]
+
+
+def test_dump_is_zero_copy_for_plain_memory():
+    bus = Bus()
+    view = bus.dump(0x0200, 2)
+    bus[0x0200] = 0x12
+    assert 0x12 == view[0]
+
+
+def test_block_cache_sees_stores_through_the_bus():
+    mpu = MPU(engine="block")
+    # $0200 LDA #$01; $0202 JMP $0200
+    _write(mpu.memory, 0x0200, (0xA9, 0x01, 0x4C, 0x00, 0x02))
+    mpu.pc = 0x0200
+    mpu.run(instructions=4)
+    assert 0x02 in mpu.bus.writeHooks
+    mpu.memory[0x0201] = 0x02
+    mpu.run(instructions=1)
+    assert 0x02 == mpu.a
+    mpu.blocks.clear()
+    assert {} == mpu.bus.writeHooks
+
+
+def test_processor_follows_the_bus_in_and_out_of_flat():
+    mpu = MPU()
+    bus = mpu.bus
+    assert bus.flat is bus.memory
+    # $0200 STA $0300; LDA $0301
+    bus.load(0x0200, (0x8D, 0x00, 0x03, 0xAD, 0x01, 0x03))
+    registers = Registers()
+    registers.values[1] = 0x5A
+    bus.map_device(0x0300, 0x0400, registers)
+    assert bus.flat is None
+    mpu.a = 0x42
+    mpu.pc = 0x0200
+    mpu.run(instructions=2)
+    assert [(0x0300, 0x42)] == registers.writes
+    assert 0x5A == mpu.a
+    bus.map_ram(0x0300, 0x0400)
+    assert bus.flat is bus.memory
+    mpu.pc = 0x0200
+    mpu.run(instructions=1)
+    assert 0x5A == bus[0x0300]
+    assert mpu.fork().bus.flat is None
@@ -0,0 +1,58 @@
+import random
+
+import pytest
+
+from be6502emu import codegen
+from be6502emu.mpu import MPU
+from tests.helpers import state
+
+IMPLEMENTED = [op for op in range(256) if MPU.disassemble[op][0] != "???"]
+
+
+def _machine(engine, memory, rng):
+    mpu = MPU(memory=bytearray(memory), engine=engine)
+    mpu.pc = rng.randrange(0x0200, 0xFF00)
+    mpu.a = rng.randrange(256)
+    mpu.x = rng.randrange(256)
+    mpu.y = rng.randrange(256)
+    mpu.sp = rng.randrange(256)
+    mpu.p = rng.randrange(256) | mpu.BREAK | mpu.UNUSED
+    return mpu
+
+
+def test_every_implemented_opcode_is_generated():
+    instruct, factories = codegen.handlers(MPU)
+    for opcode in IMPLEMENTED:
+        assert instruct[opcode] is not MPU.instruct[opcode]
+        mode = MPU.disassemble[opcode][1]
+        assert (factories[opcode] is not None) == (
+            mode in codegen.FACTORY_MODES)
+
+
+@pytest.mark.parametrize("opcode", IMPLEMENTED)
+def test_generated_handler_matches_reference(opcode):
+    rng = random.Random(opcode)
+    memory = rng.randbytes(0x10000)
+    for _ in range(8):
+        seed = rng.random()
+        reference = _machine("reference", memory, random.Random(seed))
+        generated = _machine("generated", memory, random.Random(seed))
+        reference.memory[reference.pc] = opcode
+        generated.memory[generated.pc] = opcode
+        reference.step()
+        generated.step()
+        assert state(reference) == state(generated)
+
+
+def test_engines_agree_on_random_programs():
+    rng = random.Random(6502)
+    opcodes = [op for op in IMPLEMENTED if MPU.disassemble[op][0] != "WAI"]
+    memory = bytearray(rng.choice(opcodes) for _ in range(0x10000))
+    memory[0xFFF0:] = b"\xea" * 16  # NOP
+
+    machines = [_machine(engine, memory, random.Random(1))
+                for engine in MPU.ENGINES]
+    for budget in (3, 100, 2500):
+        results = [mpu.run(instructions=budget) for mpu in machines]
+        assert len(set(results)) == 1
+        assert len(set(state(mpu) for mpu in machines)) == 1
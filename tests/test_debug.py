@@ -0,0 +1,124 @@
+import pytest
+
+from be6502emu.bus import HookedReadPage, HookedWritePage
+from be6502emu.debug import Breakpoints, Hit
+from be6502emu.mpu import MPU
+from tests.helpers import counter, timer_machine
+
+
+def test_breakpoints_are_a_bitmap():
+    breakpoints = Breakpoints()
+    assert not breakpoints
+    for addr in (0x0000, 0x1234, 0xFFFF, 0x1234):
+        breakpoints.add(addr)
+    assert 3 == len(breakpoints)
+    assert 0x1234 in breakpoints and 0x1235 not in breakpoints
+    assert [0x0000, 0x1234, 0xFFFF] == list(breakpoints)
+    breakpoints.discard(0x1234)
+    breakpoints.discard(0x1235)
+    assert [0x0000, 0xFFFF] == list(breakpoints)
+    with pytest.raises(ValueError):
+        breakpoints.add(0x10000)
+    breakpoints.clear()
+    assert not breakpoints and not any(breakpoints.bits)
+
+
+@pytest.mark.parametrize("engine", MPU.ENGINES)
+def test_run_stops_at_a_breakpoint(engine):
+    mpu = counter(engine)
+    mpu.breakpoints.add(0x0205)
+    result = mpu.run(cycles=100000)
+    assert "breakpoint" == result.reason
+    assert Hit("execute", 0x0205, None) == result.hit
+    assert (3, 0x0205, 1) == (result.instructions, mpu.pc, mpu.memory[0])
+    # continuing executes the instruction at the breakpoint first
+    result = mpu.run(cycles=100000)
+    assert (5, 0x0205, 2) == (result.instructions, mpu.pc, mpu.memory[0])
+    mpu.breakpoints.discard(0x0205)
+    assert "cycles" == mpu.run(cycles=1000).reason
+
+
+def test_breakpoints_give_way_to_earlier_limits():
+    mpu = counter("block")
+    mpu.breakpoints.add(0x0208)
+    assert "instructions" == mpu.run(instructions=2).reason
+    assert "until_pc" == mpu.run(until_pc=0x0205).reason
+    result = mpu.run(instructions=10)
+    assert ("breakpoint", 0x0208) == (result.reason, mpu.pc)
+
+
+@pytest.mark.parametrize("engine", MPU.ENGINES)
+def test_run_stops_at_a_breakpoint_on_the_handler_entry(engine):
+    mpu = MPU(engine=engine)
+    # $0000 CLI; INX; JMP $0001; $0300 INY; RTI
+    mpu.load(0x0000, (0x58, 0xE8, 0x4C, 0x01, 0x00))
+    mpu.load(0x0300, (0xC8, 0x40))
+    mpu.load(MPU.IRQ, (0x00, 0x03))
+    mpu.breakpoints.add(0x0300)
+    mpu.scheduler.post(100, lambda c: mpu.set_irq("line", True))
+    result = mpu.run(cycles=100000)
+    assert "breakpoint" == result.reason
+    assert Hit("execute", 0x0300, None) == result.hit
+    assert (0x0300, 0) == (mpu.pc, mpu.y)
+    assert mpu.processorCycles < 110
+
+
+@pytest.mark.parametrize("engine", MPU.ENGINES)
+def test_write_watchpoint_stops_after_the_store(engine):
+    mpu = counter(engine)
+    mpu.memory[0x0000] = 0x10
+    mpu.watchpoints.add(0x0300)
+    result = mpu.run(cycles=100000)
+    assert "watchpoint" == result.reason
+    assert Hit("write", 0x0300, 0x11) == result.hit
+    assert (4, 0x0208) == (result.instructions, mpu.pc)
+    assert 0x11 == mpu.memory[0x0300]
+    result = mpu.run(cycles=100000)
+    assert Hit("write", 0x0300, 0x12) == result.hit
+    assert 5 == result.instructions
+
+
+@pytest.mark.parametrize("engine", MPU.ENGINES)
+def test_read_watchpoint_covers_a_range(engine):
+    mpu = counter(engine)
+    mpu.watchpoints.add(0x00F0, 0x0110, read=True, write=False)
+    assert isinstance(mpu.bus.readPages[0x00], HookedReadPage)
+    assert isinstance(mpu.bus.readPages[0x01], HookedReadPage)
+    # unwatched memory keeps its plain entries
+    assert mpu.bus.readPages[0x02] is mpu.bus.storage[0x02]
+    result = mpu.run(cycles=1000)
+    assert "cycles" == result.reason and result.hit is None
+
+    # $0200 LDX $00 reading $F0 instead
+    mpu.memory[0x0201] = 0xF0
+    mpu.pc = 0x0200
+    result = mpu.run(cycles=1000)
+    assert ("watchpoint", Hit("read", 0x00F0, 0)) == (result.reason,
+                                                      result.hit)
+    assert 1 <= result.instructions <= 4
+
+
+def test_watchpoints_can_be_removed():
+    mpu = counter()
+    pages = list(mpu.bus.writePages)
+    mpu.watchpoints.add(0x0000, write=True)
+    mpu.watchpoints.add(0x0300, read=True, write=True)
+    assert isinstance(mpu.bus.writePages[0x03], HookedWritePage)
+    assert 2 == len(mpu.watchpoints)
+    mpu.watchpoints.remove(0x0000)
+    assert "watchpoint" == mpu.run(cycles=1000).reason
+    mpu.watchpoints.clear()
+    assert pages == mpu.bus.writePages
+    assert not mpu.bus.readHooks and not mpu.bus.writeHooks
+    with pytest.raises(ValueError):
+        mpu.watchpoints.add(0x0300, read=False, write=False)
+
+
+def test_watching_a_device_register():
+    machine = timer_machine("block")
+    # the firmware acknowledges each timer interrupt reading T1CL
+    machine.mpu.watchpoints.add(0x6004, read=True, write=False)
+    result = machine.run(cycles=100000)
+    assert ("watchpoint", 0x6004) == (result.reason, result.hit.address)
+    assert 1 == machine.bus[0x0000]
+    assert 0x8105 == machine.mpu.pc
@@ -0,0 +1,60 @@
+import time
+
+import pytest
+
+from be6502emu.bench.workloads import HELLO_ROM
+from be6502emu.emulator import main
+
+
+def _rom(tmp_path, program, size=0x8000):
+    rom = bytearray(size)
+    rom[0:len(program)] = program
+    rom[0x7FFC:0x7FFE] = (0x00, 0x80)
+    path = tmp_path / "a.out"
+    path.write_bytes(rom)
+    return str(path)
+
+
+# $8000 LDA #$42; STA $00; STP
+STOPS = (0xA9, 0x42, 0x85, 0x00, 0xDB)
+# $8000 INC $00; JMP $8000
+LOOPS = (0xE6, 0x00, 0x4C, 0x00, 0x80)
+
+
+def test_runs_until_stp(tmp_path, capsys):
+    assert 0 == main([_rom(tmp_path, STOPS), "--fast"])
+    out = capsys.readouterr().out
+    assert out.startswith("3 instructions, ")
+    assert "(stopped)" in out
+    assert "MHz" in out
+
+
+@pytest.mark.parametrize("limit, expected", [
+    (["--cycles", "80000"], "20000 instructions, 80000 cycles"),
+    (["-n", "1001"], "1001 instructions, 4005 cycles"),
+])
+def test_stops_at_limits(tmp_path, capsys, limit, expected):
+    assert 0 == main([_rom(tmp_path, LOOPS), "--fast", "--engine",
+                      "reference"] + limit)
+    assert expected in capsys.readouterr().out
+
+
+def test_throttles_to_the_clock(tmp_path, capsys):
+    started = time.perf_counter()
+    main([_rom(tmp_path, LOOPS), "--clock", "1000000", "--cycles", "50000"])
+    assert time.perf_counter() - started >= 0.045
+    assert "50000 cycles" in capsys.readouterr().out
+
+
+def test_prints_the_lcd(tmp_path, capsys):
+    rom = bytearray(HELLO_ROM)
+    rom[0x30:0x32] = (0x2F, 0x80)  # JMP $802F once printed
+    main([_rom(tmp_path, rom), "--fast", "--cycles", "20000"])
+    assert "|Hello, world!   |" in capsys.readouterr().out
+
+
+def test_rejects_images_of_the_wrong_size(tmp_path, capsys):
+    with pytest.raises(SystemExit) as e:
+        main([_rom(tmp_path, STOPS, size=0x10000)])
+    assert 2 == e.value.code
+    assert "must be 32768 bytes" in capsys.readouterr().err
@@ -0,0 +1,67 @@
+from tests.helpers import counter, state, timer_machine
+
+
+def test_forks_diverge_without_touching_each_other():
+    mpu = counter("block")
+    mpu.run(instructions=50)
+    child = mpu.fork()
+    child.memory[0x0000] = 0x80
+    mpu.run(instructions=50)
+    child.run(instructions=50)
+    assert 20 == mpu.memory[0x0000] == mpu.memory[0x0300]
+    assert 0x8A == child.memory[0x0000] == child.memory[0x0300]
+    assert child.processorCycles == mpu.processorCycles
+
+
+def test_fork_runs_like_the_original():
+    mpu = counter()
+    mpu.run(instructions=100)
+    child = mpu.fork()
+    mpu.run(instructions=500)
+    child.run(instructions=500)
+    assert state(mpu) == state(child)
+
+
+def test_only_written_pages_are_copied():
+    mpu = counter()
+    child = mpu.fork()
+    before = list(child.bus.storage)
+    child.run(instructions=5)
+    changed = [page for page in range(0x100)
+               if child.bus.storage[page] is not before[page]]
+    assert [0x00, 0x03] == changed
+    assert mpu.bus.storage[0x02] is child.bus.storage[0x02]
+    # the original copies what it writes as well
+    mpu.memory[0x0201] = 0x01
+    assert 0x00 == child.memory[0x0201]
+    assert mpu.bus.storage[0x02] is not child.bus.storage[0x02]
+
+
+def test_many_children_from_one_state():
+    mpu = counter()
+    mpu.run(instructions=40)
+    children = [mpu.fork() for _ in range(1000)]
+    for value, child in enumerate(children):
+        child.memory[0x0000] = value & 0xFF
+        child.run(instructions=4)
+    assert all(child.memory[0x0300] == (value + 1) & 0xFF
+               for value, child in enumerate(children))
+    assert 8 == mpu.memory[0x0000]
+
+
+def test_machine_fork_has_its_own_devices():
+    machine = timer_machine("block")
+    machine.run(cycles=30000)
+    child = machine.fork()
+    assert child.via is not machine.via
+    assert child.bus.devices[0x60] is child.via
+    assert machine.lcd.text() == child.lcd.text()
+    for each in (machine, child):
+        each.run(cycles=20000)
+    assert state(machine.mpu) == state(child.mpu)
+    assert machine.via.snapshot() == child.via.snapshot()
+    # a snapshot of the fork restores into the original
+    child.bus[0x0000] = 0
+    machine.restore(child.snapshot())
+    assert 0 == machine.bus[0x0000]
+    assert state(machine.mpu) == state(child.mpu)
@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+
+from be6502emu.gdbstub import GDBStub, checksum, packet
+from be6502emu.mpu import MPU
+from tests.helpers import counter
+
+
+class Client:
+    """Just enough of GDB's side of the protocol."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    async def send(self, payload):
+        self.writer.write(packet(payload))
+        await self.writer.drain()
+        assert b"+" == await self.reader.readexactly(1)
+
+    async def receive(self):
+        assert b"$" == await self.reader.readexactly(1)
+        data = await self.reader.readuntil(b"#")
+        sent = await self.reader.readexactly(2)
+        assert int(sent, 16) == checksum(data[:-1])
+        self.writer.write(b"+")
+        return data[:-1].decode()
+
+    async def ask(self, payload):
+        await self.send(payload)
+        return await self.receive()
+
+
+def _session(mpu, script, **options):
+    async def main():
+        stub = GDBStub(mpu, **options)
+        port = await stub.start()
+        client = Client(*await asyncio.open_connection("127.0.0.1", port))
+        try:
+            return await script(client)
+        finally:
+            await client.ask("D")
+            await stub.detached.wait()
+            await stub.close()
+    return asyncio.run(main())
+
+
+def test_packets_are_framed_with_a_checksum():
+    assert b"$OK#9a" == packet("OK")
+    assert b"$#00" == packet("")
+
+
+def test_registers_and_memory():
+    mpu = counter()
+    mpu.a, mpu.x, mpu.y, mpu.p, mpu.sp = 1, 2, 3, 0x30, 0xFD
+
+    async def script(client):
+        assert "01020330fd0002" == await client.ask("g")
+        assert "OK" == await client.ask("G" + "0a0b0c31f03412")
+        assert "a6" == await client.ask("m200,1")
+        assert "OK" == await client.ask("M300,2:beef")
+        assert "beef" == await client.ask("m300,2")
+        assert "E01" == await client.ask("mffff,2")
+        assert "E01" == await client.ask("G00")
+        assert "" == await client.ask("vMustReplyEmpty")
+
+    _session(mpu, script)
+    assert (0x0A, 0x0B, 0x0C, 0x31, 0xF0, 0x1234) == (
+        mpu.a, mpu.x, mpu.y, mpu.p, mpu.sp, mpu.pc)
+    assert (0xBE, 0xEF) == (mpu.memory[0x0300], mpu.memory[0x0301])
+
+
+@pytest.mark.parametrize("engine", MPU.ENGINES)
+def test_breakpoints_and_stepping(engine):
+    mpu = counter(engine)
+
+    async def script(client):
+        assert "OK" == await client.ask("Z0,205,1")
+        assert "S05" == await client.ask("c")
+        assert 0x0205 == mpu.pc
+        assert "S05" == await client.ask("s")
+        assert 0x0208 == mpu.pc
+        assert "S05" == await client.ask("c")
+        assert 2 == mpu.memory[0x0000]
+        assert "OK" == await client.ask("z0,205,1")
+        assert "OK" == await client.ask("Z2,300,1")
+        assert "T05watch:300;" == await client.ask("c200")
+        assert "OK" == await client.ask("z2,300,1")
+        assert "E01" == await client.ask("z2,300,1")
+        assert "OK" == await client.ask("Z4,300,1")
+        assert "T05awatch:300;" == await client.ask("c200")
+        assert "OK" == await client.ask("z4,300,1")
+        assert "OK" == await client.ask("Z3,0,1")
+        assert "T05rwatch:0;" == await client.ask("c200")
+        assert "OK" == await client.ask("z3,0,1")
+
+    _session(mpu, script)
+    assert not mpu.breakpoints and not mpu.watchpoints
+
+
+def test_interrupting_a_running_target():
+    mpu = counter()
+
+    async def script(client):
+        await client.send("c")
+        await asyncio.sleep(0.05)
+        client.writer.write(b"\x03")
+        return await client.receive()
+
+    assert "S02" == _session(mpu, script, slice=1000)
+    assert mpu.processorCycles > 1000
+
+
+def test_bad_checksums_are_rejected():
+    mpu = counter()
+
+    async def script(client):
+        client.writer.write(b"$g#00")
+        assert b"-" == await client.reader.readexactly(1)
+        return await client.ask("g")
+
+    assert "00000030ff0002" == _session(mpu, script)
+
+
+def test_only_localhost():
+    async def main():
+        await GDBStub(MPU()).start(host="0.0.0.0")
+
+    with pytest.raises(ValueError):
+        asyncio.run(main())
@@ -0,0 +1,100 @@
+import pytest
+
+from be6502emu.idle import find_loop
+from be6502emu.machine import Machine
+from be6502emu.mpu import MPU
+from tests.helpers import state
+
+
+def _write(memory, start_address, bytes):
+    memory[start_address:start_address + len(bytes)] = bytes
+
+
+def _nested_delay(mpu):
+    # $0200 LDY #$20
+    # $0202 LDX #$00
+    # $0204 DEX
+    # $0205 BNE $0204
+    # $0207 DEY
+    # $0208 BNE $0202
+    # $020A INC $10
+    # $020C JMP $020C
+    _write(mpu.memory, 0x0200, (0xA0, 0x20, 0xA2, 0x00, 0xCA, 0xD0, 0xFD,
+                                0x88, 0xD0, 0xF8, 0xE6, 0x10, 0x4C, 0x0C,
+                                0x02))
+    mpu.pc = 0x0200
+
+
+@pytest.mark.parametrize("budget", [
+    {"cycles": 1}, {"cycles": 777}, {"cycles": 20000}, {"cycles": 45000},
+    {"instructions": 9}, {"instructions": 5000}, {"instructions": 16000},
+    {"until_pc": 0x0207}, {"until_pc": 0x020C},
+])
+def test_skipping_matches_stepping(budget):
+    reference = MPU()
+    _nested_delay(reference)
+    expected = reference.run(**budget)
+
+    mpu = MPU(engine="block")
+    _nested_delay(mpu)
+    result = mpu.run(**budget)
+    assert expected == result
+    assert state(reference) == state(mpu)
+
+
+def test_countdown_and_jump_loops_are_skipped():
+    mpu = MPU(engine="block")
+    _nested_delay(mpu)
+    result = mpu.run(cycles=1000000)
+    assert 1 == mpu.memory[0x10]
+    assert 0x020C == mpu.pc
+    assert result.cycles - mpu.blocks.skipped < 2000
+
+    mpu = MPU(engine="block")
+    mpu.blocks.skip_idle = False
+    _nested_delay(mpu)
+    mpu.run(cycles=1000000)
+    assert 0 == mpu.blocks.skipped
+
+
+def _poller():
+    # $8000 LDA #$40; STA $600B; LDA #$C0; STA $600E
+    # $800A LDA #$00; STA $6004; LDA #$10; STA $6005
+    # $8014 LDA $600D; AND #$40; BEQ $8014
+    # $801B INC $00; BIT $6004; BRA $8014
+    rom = bytearray(0x8000)
+    rom[0:0x22] = bytes((
+        0xA9, 0x40, 0x8D, 0x0B, 0x60, 0xA9, 0xC0, 0x8D, 0x0E, 0x60,
+        0xA9, 0x00, 0x8D, 0x04, 0x60, 0xA9, 0x10, 0x8D, 0x05, 0x60,
+        0xAD, 0x0D, 0x60, 0x29, 0x40, 0xF0, 0xF9, 0xE6, 0x00, 0x2C,
+        0x04, 0x60, 0x80, 0xF2))
+    rom[0x7FFC:0x7FFE] = (0x00, 0x80)
+    return rom
+
+
+def test_polling_a_device_register_is_skipped():
+    reference = Machine(_poller())
+    reference.mpu.p |= reference.mpu.INTERRUPT
+    expected = reference.run(cycles=50000)
+
+    machine = Machine(_poller(), engine="block")
+    machine.mpu.p |= machine.mpu.INTERRUPT
+    result = machine.run(cycles=50000)
+    assert expected == result
+    assert state(reference.mpu) == state(machine.mpu)
+    assert 12 == machine.bus[0x0000]
+    assert machine.mpu.blocks.skipped > 40000
+
+
+def test_loops_with_stores_or_unstable_reads_are_not_idle():
+    mpu = MPU()
+    # $0000 STA $10; JMP $0000
+    _write(mpu.memory, 0x0000, (0x85, 0x10, 0x4C, 0x00, 0x00))
+    assert find_loop(mpu, mpu.bus, 0x0000) is None
+    # $0000 LDA $6004 (T1C-L); BNE $0000
+    machine = Machine()
+    machine.bus.load(0x0000, (0xAD, 0x04, 0x60, 0xD0, 0xFB))
+    assert find_loop(machine.mpu, machine.bus, 0x0000) is None
+    # $0000 LDA $600D (IFR); BEQ $0000
+    machine.bus.load(0x0000, (0xAD, 0x0D, 0x60, 0xF0, 0xFB))
+    assert find_loop(machine.mpu, machine.bus, 0x0000) is not None
@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+from be6502emu.instruments import Instruments
+from be6502emu.mpu import MPU
+from tests.helpers import counter, state
+
+
+class Clock:
+    """A timer advancing 10ns per call."""
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        self.now += 10
+        return self.now
+
+
+@pytest.mark.parametrize("engine", MPU.ENGINES)
+def test_sampling_leaves_execution_unchanged(engine):
+    reference = counter()
+    reference.run(instructions=5000)
+    mpu = counter(engine)
+    mpu.instruments = instruments = Instruments(interval=7)
+    for _ in range(10):
+        assert 500 == mpu.run(instructions=500).instructions
+    assert state(reference) == state(mpu)
+    assert 5000 == instruments.instructions
+    assert 5000 // 7 == sum(instruments.samples)
+
+
+def test_every_opcode_of_a_loop_gets_sampled():
+    mpu = counter()
+    # a prime interval walks through the 5 instructions of the loop
+    mpu.instruments = instruments = Instruments(interval=101,
+                                                timer=Clock())
+    mpu.run(instructions=101 * 50)
+    assert 50 == sum(instruments.samples)
+    for opcode in (0xA6, 0xE8, 0x86, 0x8E, 0x4C):
+        assert 10 == instruments.samples[opcode]
+    assert 30 == instruments.cycles[0x86]
+    # each sample reads the timer twice, 10ns apart, less the overhead
+    assert 10 == instruments.overhead
+    assert 0 == sum(instruments.nanoseconds)
+
+
+def test_summary_aggregates_by_mnemonic_and_mode():
+    mpu = counter()
+    mpu.instruments = instruments = Instruments(interval=1)
+    mpu.run(instructions=50)
+    summary = json.loads(instruments.to_json())
+    assert 1 == summary["version"]
+    assert 50 == summary["samples"] == summary["instructions"]
+    assert {"mnemonic": "STX", "mode": "abs", "samples": 10,
+            "instructions": 10, "cycles": 40} == {
+        key: value for key, value in summary["opcodes"]["0x8E"].items()
+        if "nanoseconds" not in key and "ns_" not in key}
+    assert 20 == summary["mnemonics"]["STX"]["samples"]
+    assert 70 == summary["mnemonics"]["STX"]["cycles"]
+    assert ["abs", "imp", "zpg"] == list(summary["modes"])
+    assert 20 == summary["modes"]["abs"]["samples"]
+    stx = summary["mnemonics"]["STX"]
+    assert stx["ns_per_instruction"] == round(
+        stx["nanoseconds"] / stx["samples"], 1)
+
+
+def test_instruments_are_off_by_default():
+    mpu = counter()
+    assert mpu.instruments is None
+    with pytest.raises(ValueError):
+        Instruments().summary()
+    with pytest.raises(ValueError):
+        Instruments(interval=0)
@@ -0,0 +1,90 @@
+import hashlib
+
+import pytest
+
+from be6502emu.bench.workloads import HELLO_ROM
+from be6502emu.jobs import Job, JobRunner, Worker
+
+
+def _rom(code):
+    rom = bytearray(0x8000)
+    rom[0:len(code)] = code
+    rom[0x7FFC:0x7FFE] = (0x00, 0x80)
+    return bytes(rom)
+
+
+# $8000 LDA $6001; STA $00; JMP $8000, copying port A to $00
+PORT = _rom((0xAD, 0x01, 0x60, 0x85, 0x00, 0x4C, 0x00, 0x80))
+
+
+def _ram(**bytes_at):
+    ram = bytearray(0x4000)
+    for address, value in bytes_at.items():
+        ram[int(address[1:], 16)] = value
+    return hashlib.sha256(ram).hexdigest()
+
+
+def test_worker_resets_a_warm_machine_between_jobs():
+    worker = Worker()
+    job = Job(HELLO_ROM, cycles=200000, name="hello")
+    first = worker.run(job)
+    assert first.error is None
+    assert "Hello, world!".ljust(16) + "\n" + " " * 16 in [
+        text for cycle, text in first.transcript]
+    assert first.cycles >= 200000
+    machine = worker.machines[hashlib.sha256(HELLO_ROM).hexdigest()].machine
+    assert 0x8000 in machine.mpu.blocks.blocks
+    built = machine.mpu.blocks.built
+
+    second = worker.run(job, index=1)
+    assert first._replace(index=1) == second
+    assert machine is worker.machines[
+        hashlib.sha256(HELLO_ROM).hexdigest()].machine
+    # the blocks decoded from ROM survived the reset
+    assert built == machine.mpu.blocks.built
+
+
+def test_scripts_drive_the_inputs():
+    worker = Worker(engine="reference")
+    result = worker.run(Job(PORT, [(500, "poke", 0x0010, 0x77),
+                                   (1000, "port_a", 0x5A)], cycles=2000))
+    assert 0x5A == result.registers["a"]
+    assert _ram(x00=0x5A, x10=0x77) == result.hashes["ram"]
+    assert "cycles" == result.reason
+    assert () == result.transcript
+    # nothing of the previous job is left over
+    result = worker.run(Job(PORT, cycles=2000))
+    assert _ram(x00=0xFF) == result.hashes["ram"]
+
+
+def test_machines_are_kept_for_the_latest_roms():
+    worker = Worker(machines=1)
+    worker.run(Job(PORT, cycles=100))
+    worker.run(Job(HELLO_ROM, cycles=100))
+    assert [hashlib.sha256(HELLO_ROM).hexdigest()] == list(worker.machines)
+
+
+def test_failures_are_reported_per_job():
+    worker = Worker()
+    result = worker.run(Job(PORT, [(10, "press", 1)], cycles=100, name="x"))
+    assert "x" == result.name
+    assert result.registers is None
+    assert result.error.startswith("ValueError: bad script entry")
+
+
+def test_runner_streams_results_from_the_pool():
+    jobs = [Job(HELLO_ROM, cycles=200000, name="hello")]
+    jobs += [Job(PORT, [(100, "port_a", value)], cycles=1000, name=value)
+             for value in range(6)]
+    jobs.append(Job(PORT, [(100, "bogus")], cycles=1000))
+    worker = Worker()
+    with JobRunner(workers=2) as runner:
+        results = list(runner.run(jobs))
+        assert sorted(range(len(jobs))) == sorted(r.index for r in results)
+        ordered = runner.map(jobs)
+    assert [r.index for r in ordered] == list(range(len(jobs)))
+    for index, job in enumerate(jobs):
+        assert worker.run(job, index) == ordered[index]
+    assert ordered[-1].error is not None
+    with pytest.raises(ValueError):
+        list(JobRunner(workers=1).run([Job(b"\xEA" * 100)]))
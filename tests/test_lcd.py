@@ -0,0 +1,181 @@
+import pytest
+
+from be6502emu.bench.workloads import HELLO_ROM
+from be6502emu.lcd import HD44780
+from be6502emu.machine import Machine
+from be6502emu.mpu import MPU
+from be6502emu.scheduler import Scheduler
+from be6502emu.via import Port
+
+E, RW, RS = 0x80, 0x40, 0x20
+
+
+def _lcd(**wiring):
+    mpu = MPU()
+    lcd = HD44780(Scheduler(mpu))
+    data, control = Port(), Port()
+    data.ddr = control.ddr = 0xFF
+    control.update(output=0x00)
+    if wiring:
+        lcd.attach(data, **wiring)
+    else:
+        lcd.attach(data, control)
+    changes = []
+    lcd.connect(lambda frame, cells: changes.append(cells))
+    return mpu, lcd, data, control, changes
+
+
+def _strobe(port, value, bits):
+    port.update(output=value | bits)
+    port.update(output=value | bits | E)
+    port.update(output=value | bits)
+
+
+def _send(data, control, value, rs=0):
+    data.update(output=value)
+    _strobe(control, 0, rs)
+
+
+def _init(data, control):
+    for value in (0x38, 0x0C, 0x06, 0x01):
+        _send(data, control, value)
+
+
+def _print(data, control, text):
+    for char in text.encode():
+        _send(data, control, char, RS)
+
+
+def test_instructions_and_data_are_latched_on_the_falling_edge():
+    mpu, lcd, data, control, changes = _lcd()
+    _init(data, control)
+    data.update(output=ord("A"))
+    control.update(output=RS | E)
+    assert [" " * 16] * 2 == lcd.text()
+    control.update(output=RS)
+    assert ["A" + " " * 15, " " * 16] == lcd.text()
+    assert [[(0, 0)]] == changes
+    assert 1 == lcd.address
+
+
+def test_listeners_only_hear_about_visible_changes():
+    mpu, lcd, data, control, changes = _lcd()
+    _init(data, control)
+    _print(data, control, "Hi")
+    assert [[(0, 0)], [(0, 1)]] == changes
+    version = lcd.version
+    # the same character again, then one past the visible columns
+    _send(data, control, 0x80)
+    _print(data, control, "H")
+    _send(data, control, 0x80 | 20)
+    _print(data, control, "x")
+    assert version == lcd.version
+    assert 2 == len(changes)
+    # moving the cursor, hiding and showing it change no characters
+    _send(data, control, 0x0F)
+    _send(data, control, 0x14)
+    assert version == lcd.version
+    _send(data, control, 0x08)
+    assert [(0, 0), (0, 1)] == changes[-1]
+    _send(data, control, 0x0C)
+    assert ["Hi" + " " * 14, " " * 16] == lcd.text()
+    assert version + 2 == lcd.version
+
+
+def test_custom_character_rewrites_mark_the_cells_showing_them():
+    mpu, lcd, data, control, changes = _lcd()
+    _init(data, control)
+    for char in (0x00, 0x01, 0x08):
+        _send(data, control, char, RS)
+    changes.clear()
+    _send(data, control, 0x40)  # CGRAM address 0, character 0
+    _send(data, control, 0x1F, RS)
+    assert [[(0, 0), (0, 2)]] == changes
+    assert 0x1F == lcd.cgram[0]
+    assert "???" == lcd.text()[0][:3]
+
+
+def test_second_line_wraps_and_display_shifts():
+    mpu, lcd, data, control, changes = _lcd()
+    _init(data, control)
+    _send(data, control, 0x80 | 0x27)
+    _print(data, control, "ab")
+    assert 0x41 == lcd.address
+    assert "b" + " " * 15 == lcd.text()[1]
+    _send(data, control, 0x1C)  # display right
+    assert "a" == lcd.text()[0][0]
+    assert " b" == lcd.text()[1][:2]
+    _send(data, control, 0x02)  # home undoes the shift
+    assert 0 == lcd.shift
+    assert (0, 0) == (lcd.cursor or (0, 0))
+
+
+def test_busy_flag_reads_for_the_execution_time():
+    mpu, lcd, data, control, changes = _lcd()
+    _init(data, control)
+    data.update(ddr=0x00)
+    mpu.processorCycles += 1519
+    control.update(output=RW | E)
+    assert 0x80 == data.pins
+    control.update(output=RW)
+    assert 0xFF == data.pins
+    mpu.processorCycles += 1
+    control.update(output=RW | E)
+    assert 0x00 == data.pins
+    control.update(output=RW)
+    overruns = lcd.overruns
+    _send(data, control, 0x01)
+    _send(data, control, 0x01)
+    assert overruns + 1 == lcd.overruns
+
+
+def test_four_bit_interface_transfers_nibbles():
+    mpu, lcd, port, control, changes = _lcd(e=E, rw=RW, rs=RS,
+                                            data_mask=0x0F)
+
+    def nibble(value, bits=0):
+        _strobe(port, value, bits)
+
+    # the 8-bit function set switching to 4 bits, then two halves each
+    nibble(0x2)
+    for value in (0x28, 0x0C, 0x06, 0x01):
+        nibble(value >> 4)
+        nibble(value & 0x0F)
+    assert 0x28 == lcd.function
+    nibble(0x4, RS)
+    assert lcd.frame[0][0] == 0x20
+    nibble(0x8, RS)
+    assert "H" == lcd.text()[0][0]
+
+    # reading the address counter back in two halves
+    mpu.processorCycles += 2000
+    port.update(ddr=0xF0, output=RW)
+    values = []
+    for _ in range(2):
+        port.update(output=RW | E)
+        values.append(port.pins & 0x0F)
+        port.update(output=RW)
+    assert [0x0, 0x1] == values
+
+
+@pytest.mark.parametrize("engine", MPU.ENGINES)
+def test_hello_world_firmware(engine):
+    machine = Machine(HELLO_ROM, engine=engine)
+    frames = []
+    machine.lcd.connect(lambda frame, cells: frames.append(frame))
+    # until the JMP starting over once the message is printed
+    assert "until_pc" == machine.run(cycles=20000, until_pc=0x802F).reason
+    assert ["Hello, world!   ", " " * 16] == machine.lcd.text()
+    assert (0, 13) == machine.lcd.cursor
+    assert 0 == machine.lcd.overruns
+    # one frame per character but the space
+    assert 12 == len(frames)
+    # the clear instruction kept the firmware polling for 1.52ms
+    assert machine.mpu.processorCycles > 1520
+
+
+def test_machine_wiring_is_optional():
+    assert Machine(lcd=None).lcd is None
+    assert not Machine(lcd=None).via.port_a.listeners
+    with pytest.raises(ValueError):
+        Machine(lcd="i2c")
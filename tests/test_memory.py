@@ -0,0 +1,68 @@
+import mmap
+
+import pytest
+
+from be6502emu.mpu import MPU
+
+
+def test_default_memory_is_a_bytearray():
+    mpu = MPU()
+    assert isinstance(mpu.bus.memory, bytearray)
+    assert 0x10000 == len(mpu.memory)
+
+
+def test_stores_reject_values_wider_than_a_byte():
+    mpu = MPU()
+    with pytest.raises(ValueError):
+        mpu.memory[0x0000] = 0x100
+
+
+def test_user_buffer_is_shared_not_copied():
+    buffer = mmap.mmap(-1, 0x10000)
+    mpu = MPU(memory=buffer)
+    # $0000 LDA #$42
+    # $0002 STA $1234
+    mpu.load(0x0000, (0xA9, 0x42, 0x8D, 0x34, 0x12))
+    mpu.run(instructions=2)
+    assert 0x42 == buffer[0x1234]
+    buffer[0x1235] = 0x99
+    assert 0x99 == mpu.memory[0x1235]
+
+
+def test_dump_is_a_live_read_only_view():
+    mpu = MPU()
+    mpu.load(0x0200, b"\x01\x02\x03")
+    view = mpu.dump(0x0200, 3)
+    assert b"\x01\x02\x03" == bytes(view)
+    mpu.memory[0x0201] = 0xFF
+    assert 0xFF == view[1]
+    with pytest.raises(TypeError):
+        view[0] = 0
+
+
+def test_short_memory_is_rejected():
+    with pytest.raises(ValueError):
+        MPU(memory=bytearray(0x100))
+
+
+def test_list_memory_still_works():
+    mpu = MPU(memory=0x10000 * [0x00])
+    mpu.load(0x0000, (0xA9, 0x80))
+    mpu.step()
+    assert 0x80 == mpu.a
+    assert b"\xa9\x80" == bytes(mpu.dump(0x0000, 2))
+
+
+@pytest.mark.parametrize("engine", MPU.ENGINES)
+def test_memory_can_be_replaced(engine):
+    mpu = MPU(engine=engine)
+    mpu.watchpoints.add(0x0010)
+    mpu.run(instructions=2)  # BRK through the zeroed vector
+    memory = 0x10000 * [0x00]
+    # $0000 LDA #$80; STA $10
+    memory[0:4] = (0xA9, 0x80, 0x85, 0x10)
+    mpu.memory = memory
+    mpu.pc = 0x0000
+    result = mpu.run(instructions=2)
+    assert "watchpoint" == result.reason
+    assert 0x80 == memory[0x10] == mpu.memory[0x10]
@@ -0,0 +1,73 @@
+import pytest
+
+from be6502emu.mpu import MPU
+from be6502emu.profiler import Profiler
+from tests.helpers import timer_machine
+
+
+def _calls(engine="reference"):
+    mpu = MPU(engine=engine)
+    # $0200 LDX #$F0; JSR $0300; JSR $0310; STP
+    # $0300 LDA $0480,X; JSR $0310; RTS
+    # $0310 NOP; RTS
+    mpu.memory[0x0200:0x0209] = (0xA2, 0xF0, 0x20, 0x00, 0x03, 0x20, 0x10,
+                                 0x03, 0xDB)
+    mpu.memory[0x0300:0x0307] = (0xBD, 0x80, 0x04, 0x20, 0x10, 0x03, 0x60)
+    mpu.memory[0x0310:0x0312] = (0xEA, 0x60)
+    mpu.pc = 0x0200
+    mpu.profiler = Profiler()
+    return mpu
+
+
+@pytest.mark.parametrize("engine", MPU.ENGINES)
+def test_counts_and_cycles_per_address(engine):
+    mpu = _calls(engine)
+    mpu.run(instructions=11)
+    profiler = mpu.profiler
+    assert (1, 5, 1) == (profiler.counts[0x0300], profiler.cycles[0x0300],
+                         profiler.extra[0x0300])
+    assert (2, 4, 0) == (profiler.counts[0x0310], profiler.cycles[0x0310],
+                         profiler.extra[0x0310])
+    assert mpu.processorCycles == profiler.total == sum(profiler.cycles)
+    assert (0x0311, 2, 12, 0) == profiler.hot(1)[0]
+    assert 9 == len(profiler.hot())
+
+
+def test_shadow_stack_follows_calls():
+    mpu = _calls()
+    mpu.run(instructions=11)
+    stp = mpu.profiler.cycles[0x0208]
+    assert {
+        (0x0200,): 2 + 6 + 6 + stp,
+        (0x0200, 0x0300): 5 + 6 + 6,
+        (0x0200, 0x0300, 0x0310): 2 + 6,
+        (0x0200, 0x0310): 2 + 6,
+    } == mpu.profiler.stacks
+    assert ("main %d\nmain;sub 17\nmain;sub;$0310 8\nmain;$0310 8\n"
+            % (14 + stp)) == mpu.profiler.collapsed({0x0200: "main",
+                                                     0x0300: "sub"})
+
+
+def test_interrupts_get_frames():
+    machine = timer_machine("reference")
+    machine.mpu.profiler = profiler = Profiler()
+    machine.run(cycles=50000)
+    handlers = [stack for stack in profiler.stacks if 0x8100 in stack]
+    assert [(0x8000, 0x8100)] == handlers
+    assert 3 * profiler.counts[0x8100] == sum(
+        profiler.counts[0x8100:0x8106])
+    # the busy-wait loop polling the LCD is the hottest spot
+    hottest = profiler.hot(1)[0][0]
+    assert 0x8046 <= hottest < 0x8057
+    report = profiler.report(5).splitlines()
+    assert 6 == len(report)
+    assert report[0].split() == ["address", "count", "cycles", "%", "extra"]
+    assert report[1].startswith("$%04X " % hottest)
+
+
+def test_profiling_is_off_by_default():
+    mpu = _calls()
+    mpu.profiler = None
+    mpu.run(instructions=11)
+    assert mpu.fork().profiler is None
+    assert "" == Profiler().collapsed()
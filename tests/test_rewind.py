@@ -0,0 +1,126 @@
+import pytest
+
+from be6502emu.bus import HookedWritePage
+from be6502emu.mpu import MPU
+from be6502emu.rewind import Rewind
+from tests.helpers import counter, state, timer_machine
+
+
+def _states(rewind, count):
+    states = [state(rewind.mpu)]
+    for _ in range(count):
+        rewind.step()
+        states.append(state(rewind.mpu))
+    return states
+
+
+@pytest.mark.parametrize("engine", MPU.ENGINES)
+def test_stepping_back_undoes_the_journal(engine):
+    mpu = counter(engine)
+    rewind = Rewind(mpu, interval=64)
+    states = _states(rewind, 300)
+    assert 300 == rewind.history
+    rewind.step_back()
+    assert states[299] == state(mpu)
+    rewind.step_back(150)
+    assert states[149] == state(mpu)
+    assert 149 == rewind.history
+    # going forward again records a new future
+    assert states[149:] == _states(rewind, 151)
+    rewind.step_back(300)
+    assert states[0] == state(mpu)
+    with pytest.raises(ValueError):
+        rewind.step_back()
+
+
+def test_registers_are_journaled_as_deltas():
+    mpu = counter()
+    rewind = Rewind(mpu, interval=1000)
+    states = _states(rewind, 500)
+    mpu.a = 0x99  # changed by hand between two instructions
+    states[-1] = state(mpu)
+    states += _states(rewind, 500)[1:]
+    segment = rewind.segments[-1]
+    assert 1000 == len(segment)
+    # PC and one other register change per instruction of the counter
+    assert len(segment.deltas) < 6 * len(segment)
+    rewind.step_back(400)
+    assert states[600] == state(mpu)
+    rewind.step_back(101)
+    assert states[499] == state(mpu)
+
+
+def test_device_accesses_are_replayed_from_a_keyframe():
+    machine = timer_machine("reference")
+    rewind = Rewind(machine, interval=1000)
+    states = []
+    for _ in range(8000):
+        states.append((state(machine.mpu), machine.via.snapshot(),
+                       machine.lcd.text()))
+        rewind.step()
+    rewind.step_back(2500)
+    assert states[5500] == (state(machine.mpu), machine.via.snapshot(),
+                            machine.lcd.text())
+    rewind.step_back(5000)
+    assert states[500] == (state(machine.mpu), machine.via.snapshot(),
+                           machine.lcd.text())
+
+
+def test_run_back_to_finds_the_latest_visit():
+    mpu = counter()
+    rewind = Rewind(mpu)
+    result = rewind.run(instructions=20)
+    assert (20, "instructions") == (result.instructions, result.reason)
+    cycles = mpu.processorCycles
+    # STX $0300 was last about to execute 2 instructions ago
+    assert 2 == rewind.run_back_to(0x0205)
+    assert 0x0205 == mpu.pc
+    assert 4 == mpu.memory[0x0000] == mpu.memory[0x0300] + 1
+    assert cycles - 4 - 3 == mpu.processorCycles
+    with pytest.raises(ValueError):
+        rewind.run_back_to(0x1234)
+    assert "until_pc" == rewind.run(until_pc=0x0200).reason
+
+
+def test_history_is_capped():
+    mpu = counter()
+    rewind = Rewind(mpu, interval=100, limit=16384)
+    rewind.run(instructions=5000)
+    assert rewind.size <= 16384
+    assert 100 <= rewind.history < 5000
+    assert rewind.size == sum(segment.size for segment in rewind.segments)
+    rewind.step_back(rewind.history)
+    with pytest.raises(ValueError):
+        rewind.step_back()
+
+
+def test_running_outside_the_rewind_restarts_the_history():
+    mpu = counter()
+    rewind = Rewind(mpu)
+    rewind.run(instructions=10)
+    mpu.run(instructions=10)
+    with pytest.raises(ValueError):
+        rewind.step_back()
+    expected = state(mpu)
+    rewind.run(instructions=10)
+    assert 10 == rewind.history
+    rewind.step_back(10)
+    assert expected == state(mpu)
+
+
+def test_closing_removes_every_hook():
+    mpu = counter()
+    pages = list(mpu.bus.writePages)
+    with Rewind(mpu) as rewind:
+        assert isinstance(mpu.bus.writePages[0], HookedWritePage)
+        rewind.run(instructions=10)
+    assert pages == mpu.bus.writePages
+    assert not mpu.bus.writeHooks and not mpu.bus.readHooks
+
+
+def test_limit_must_hold_a_keyframe():
+    mpu = counter()
+    mpu.memory[0x1000:0x2000] = bytes(range(256)) * 16
+    with pytest.raises(ValueError):
+        Rewind(mpu, limit=len(mpu.snapshot()) - 1)
+    assert not mpu.bus.writeHooks
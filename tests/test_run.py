@@ -0,0 +1,156 @@
+import pytest
+
+from be6502emu.mpu import MPU
+
+
+def _write(memory, start_address, bytes):  # NOQA
+    # fmt: off
+    memory[start_address: start_address + len(bytes)] = bytes
+    # fmt: on
+
+
+def _countdown(mpu):
+    # $0000 LDX #$10
+    # $0002 DEX
+    # $0003 BNE $0002
+    # $0005 NOP
+    _write(mpu.memory, 0x0000, (0xA2, 0x10, 0xCA, 0xD0, 0xFD, 0xEA))
+
+
+def test_run_matches_step():
+    stepped = MPU()
+    _countdown(stepped)
+    for _ in range(34):
+        stepped.step()
+
+    mpu = MPU()
+    _countdown(mpu)
+    result = mpu.run(instructions=34)
+    assert 34 == result.instructions
+    assert "instructions" == result.reason
+    assert stepped.processorCycles == result.cycles
+    assert (stepped.pc, stepped.a, stepped.x, stepped.y, stepped.p) == (
+        mpu.pc, mpu.a, mpu.x, mpu.y, mpu.p)
+
+
+def test_run_stops_on_cycle_budget():
+    mpu = MPU()
+    _countdown(mpu)
+    result = mpu.run(cycles=20)
+    assert "cycles" == result.reason
+    assert result.cycles >= 20
+    assert mpu.processorCycles == result.cycles
+
+
+def test_run_stops_at_until_pc():
+    mpu = MPU()
+    _countdown(mpu)
+    result = mpu.run(until_pc=0x0005)
+    assert "until_pc" == result.reason
+    assert 0x0005 == mpu.pc
+    assert 0x00 == mpu.x
+    assert 33 == result.instructions
+
+
+def test_run_returns_when_waiting():
+    mpu = MPU()
+    # $0000 WAI
+    mpu.memory[0x0000] = 0xCB
+    result = mpu.run(instructions=10)
+    assert "waiting" == result.reason
+    assert 1 == result.instructions
+    assert mpu.waiting
+
+    result = mpu.run(cycles=100)
+    assert "waiting" == result.reason
+    assert 0 == result.instructions
+    assert 100 == result.cycles
+
+
+def test_run_requires_a_limit():
+    with pytest.raises(ValueError):
+        MPU().run()
+
+
+def _sleeper(mpu):
+    # $0000 CLI; WAI; INX; JMP $0001
+    # $0200 INY; RTI
+    _write(mpu.memory, 0x0000, (0x58, 0xCB, 0xE8, 0x4C, 0x01, 0x00))
+    _write(mpu.memory, 0x0200, (0xC8, 0x40))
+    _write(mpu.memory, 0xFFFE, (0x00, 0x02))
+
+
+@pytest.mark.parametrize("engine", MPU.ENGINES)
+def test_wai_fast_forwards_to_the_interrupt(engine):
+    mpu = MPU(engine=engine)
+    _sleeper(mpu)
+    mpu.scheduler.post(10000, lambda c: mpu.set_irq("timer", True))
+    mpu.scheduler.post(10005, lambda c: mpu.set_irq("timer", False))
+    result = mpu.run(cycles=20000)
+    assert "waiting" == result.reason
+    # the handler ran once, then back to sleep
+    assert (1, 1) == (mpu.x, mpu.y)
+    assert result.instructions < 20
+    assert 20000 <= mpu.processorCycles < 20010
+
+
+@pytest.mark.parametrize("engine", MPU.ENGINES)
+def test_run_stops_at_until_pc_on_the_handler_entry(engine):
+    mpu = MPU(engine=engine)
+    _sleeper(mpu)
+    mpu.scheduler.post(1000, lambda c: mpu.set_irq("timer", True))
+    result = mpu.run(cycles=20000, until_pc=0x0200)
+    assert "until_pc" == result.reason
+    assert 0x0200 == mpu.pc
+    assert 0 == mpu.y
+    assert mpu.processorCycles < 1010
+
+
+def test_masked_interrupt_resumes_after_wai():
+    mpu = MPU()
+    _sleeper(mpu)
+    mpu.memory[0x0000] = 0xEA  # NOP instead of CLI
+    mpu.p |= mpu.INTERRUPT
+    mpu.run(instructions=2)
+    assert mpu.waiting
+    mpu.irq()
+    assert not mpu.waiting
+    assert 0x0002 == mpu.pc
+    mpu.step()
+    assert 1 == mpu.x
+    assert 0 == mpu.y
+
+
+def test_nmi_ends_wai():
+    mpu = MPU()
+    _sleeper(mpu)
+    _write(mpu.memory, 0xFFFA, (0x00, 0x02))
+    mpu.run(instructions=2)
+    mpu.nmi()
+    assert not mpu.waiting
+    assert 0x0200 == mpu.pc
+
+
+def test_step_skips_to_the_next_event_while_waiting():
+    mpu = MPU()
+    _sleeper(mpu)
+    mpu.run(instructions=2)
+    mpu.scheduler.post(5000, lambda c: None)
+    mpu.step()
+    assert 5000 == mpu.processorCycles
+
+
+def test_stp_stops_until_reset():
+    mpu = MPU()
+    # $0000 STP; INX
+    _write(mpu.memory, 0x0000, (0xDB, 0xE8))
+    result = mpu.run(instructions=10)
+    assert "stopped" == result.reason
+    assert 1 == result.instructions
+    mpu.set_irq("line", True)
+    mpu.nmi()
+    result = mpu.run(cycles=1000)
+    assert "stopped" == result.reason
+    assert 0 == mpu.x
+    mpu.reset()
+    assert not mpu.stopped
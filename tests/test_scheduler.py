@@ -0,0 +1,109 @@
+import pytest
+
+from be6502emu.mpu import MPU
+from be6502emu.scheduler import NEVER, Scheduler
+
+
+def test_events_fire_in_cycle_then_posting_order():
+    mpu = MPU()
+    scheduler = Scheduler(mpu)
+    fired = []
+    scheduler.post(20, lambda cycle: fired.append(("b", cycle)))
+    scheduler.post(10, lambda cycle: fired.append(("a", cycle)))
+    scheduler.post(20, lambda cycle: fired.append(("c", cycle)))
+    assert 10 == scheduler.next_deadline()
+
+    mpu.processorCycles = 19
+    assert 1 == scheduler.run_due()
+    mpu.processorCycles = 25
+    assert 2 == scheduler.run_due()
+    assert [("a", 10), ("b", 20), ("c", 20)] == fired
+    assert scheduler.next_deadline() is None
+
+
+def test_cancelled_events_never_fire():
+    mpu = MPU()
+    scheduler = Scheduler(mpu)
+    fired = []
+    event = scheduler.post_in(5, fired.append)
+    scheduler.post_in(8, fired.append)
+    scheduler.cancel(event)
+    assert 1 == len(scheduler)
+    assert 8 == scheduler.next_deadline()
+    mpu.processorCycles = 10
+    scheduler.run_due()
+    assert [8] == fired
+    assert not event.pending
+
+
+def _write(memory, start_address, bytes):
+    memory[start_address:start_address + len(bytes)] = bytes
+
+
+@pytest.mark.parametrize("engine", MPU.ENGINES)
+def test_run_fires_events_between_instructions(engine):
+    mpu = MPU(engine=engine)
+    # $0000 INX; JMP $0000
+    _write(mpu.memory, 0x0000, (0xE8, 0x4C, 0x00, 0x00))
+    seen = []
+    for cycle in (100, 101, 250):
+        mpu.scheduler.post(cycle, lambda c: seen.append(
+            (c, mpu.processorCycles, mpu.pc)))
+    result = mpu.run(cycles=300)
+    assert "cycles" == result.reason
+    assert [100, 101, 250] == [entry[0] for entry in seen]
+    for cycle, now, pc in seen:
+        assert cycle <= now < cycle + 3
+        assert pc in (0x0000, 0x0001)
+    assert mpu.scheduler.next_deadline() is None
+
+
+@pytest.mark.parametrize("engine", MPU.ENGINES)
+def test_irq_line_is_level_triggered(engine):
+    mpu = MPU(engine=engine)
+    # $0000 NOP x 8; CLI; $0009 JMP $0009
+    # $0200 INC $10; SEI; JMP $0009 (leaves I set, handler never returns)
+    _write(mpu.memory, 0x0000, (0xEA,) * 8 + (0x58, 0x4C, 0x09, 0x00))
+    _write(mpu.memory, 0x0200, (0xE6, 0x10, 0x78, 0x4C, 0x09, 0x00))
+    _write(mpu.memory, 0xFFFE, (0x00, 0x02))
+    mpu.p |= mpu.INTERRUPT
+    mpu.scheduler.post(4, lambda c: mpu.set_irq("test", True))
+    mpu.run(cycles=100)
+    # masked until CLI, then taken exactly once
+    assert 1 == mpu.memory[0x0010]
+    assert 0x0009 <= mpu.pc <= 0x000B
+    mpu.set_irq("test", False)
+    assert not mpu.irqSources
+
+
+@pytest.mark.parametrize("engine", MPU.ENGINES)
+def test_masked_irq_is_only_rechecked_once_unmasked(engine):
+    mpu = MPU(engine=engine)
+    # $0000 LDA #$00; PHA; NOP; NOP; PLP; NOP
+    # $0200 INC $10; JMP $0202
+    _write(mpu.memory, 0x0000, (0xA9, 0x00, 0x48, 0xEA, 0xEA, 0x28, 0xEA))
+    _write(mpu.memory, 0x0200, (0xE6, 0x10, 0x4C, 0x02, 0x02))
+    _write(mpu.memory, 0xFFFE, (0x00, 0x02))
+    mpu.p |= mpu.INTERRUPT
+    mpu.set_irq("test", True)
+    mpu.run(instructions=4)
+    # nothing due, so the engine was not sent back after each instruction
+    assert NEVER == mpu.scheduler.deadline
+    assert 0x0005 == mpu.pc
+    # PLP clears I and the interrupt is taken right after it
+    mpu.run(instructions=2)
+    assert 1 == mpu.memory[0x0010]
+    assert 0x0202 == mpu.pc
+    assert 2 + 3 + 2 + 2 + 4 + 7 + 5 == mpu.processorCycles
+
+
+def test_step_fires_due_events():
+    mpu = MPU()
+    # $0000 NOP; NOP
+    _write(mpu.memory, 0x0000, (0xEA, 0xEA))
+    fired = []
+    mpu.scheduler.post(3, fired.append)
+    mpu.step()
+    assert not fired
+    mpu.step()
+    assert [3] == fired
@@ -0,0 +1,85 @@
+import pytest
+
+from be6502emu.mpu import MPU
+from tests.helpers import state, timer_machine
+
+
+def _write(memory, start_address, bytes):
+    memory[start_address:start_address + len(bytes)] = bytes
+
+
+def test_restoring_replays_a_plain_mpu():
+    mpu = MPU(engine="block")
+    # $0200 LDX #$00; INX; STX $10; TXA; STA $0300,X; JMP $0202
+    _write(mpu.memory, 0x0200, (0xA2, 0x00, 0xE8, 0x86, 0x10, 0x8A, 0x9D,
+                                0x00, 0x03, 0x4C, 0x02, 0x02))
+    mpu.pc = 0x0200
+    mpu.run(instructions=100)
+    data = mpu.snapshot()
+    mpu.run(instructions=1000)
+    expected = state(mpu)
+    mpu.restore(data)
+    mpu.run(instructions=1000)
+    assert expected == state(mpu)
+    # the code page, zero page and $0300 page differ from blank memory
+    assert len(data) < 1024
+
+
+@pytest.mark.parametrize("engine", MPU.ENGINES)
+def test_restoring_replays_a_machine_with_devices(engine):
+    machine = timer_machine(engine)
+    machine.run(cycles=3000)  # part way through the busy waits
+    data = machine.snapshot()
+    machine.run(cycles=40000)
+    expected = (state(machine.mpu), machine.via.snapshot(),
+                machine.lcd.text(), machine.bus[0x0000])
+    assert "Hello, world!   " == expected[2][0]
+    assert 30 <= expected[3]
+
+    machine.restore(data)
+    assert 3000 <= machine.mpu.processorCycles < 3010
+    machine.run(cycles=40000)
+    assert expected == (state(machine.mpu), machine.via.snapshot(),
+                        machine.lcd.text(), machine.bus[0x0000])
+
+
+def test_restoring_into_a_fresh_machine():
+    machine = timer_machine("reference")
+    machine.run(cycles=30000)
+    data = machine.snapshot()
+    assert len(data) < 2048
+
+    other = timer_machine("reference")
+    frames = []
+    other.lcd.connect(lambda frame, cells: frames.append(frame))
+    other.restore(data)
+    assert machine.lcd.text() == other.lcd.text()
+    assert 1 == len(frames)
+    for each in (machine, other):
+        each.run(cycles=10000)
+    assert state(machine.mpu) == state(other.mpu)
+
+
+def test_pending_irq_survives_a_restore():
+    machine = timer_machine("reference")
+    machine.run(cycles=30000)
+    machine.mpu.p |= machine.mpu.INTERRUPT
+    while not machine.mpu.irqSources:
+        machine.mpu.step()
+    data = machine.snapshot()
+    machine.mpu.irqSources.clear()
+    machine.restore(data)
+    assert {"via"} == machine.mpu.irqSources
+
+
+def test_rejects_foreign_snapshots():
+    machine = timer_machine("reference")
+    data = machine.snapshot()
+    with pytest.raises(ValueError, match="base image"):
+        machine.mpu.restore(data, devices=machine._devices())
+    with pytest.raises(ValueError, match="version"):
+        machine.restore(data[:4] + b"\x09\x00" + data[6:])
+    with pytest.raises(ValueError, match="not a snapshot"):
+        machine.restore(b"\x00" * 16)
+    with pytest.raises(ValueError, match="devices"):
+        machine.mpu.restore(data, machine.image, [machine.via])
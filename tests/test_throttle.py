@@ -0,0 +1,90 @@
+import pytest
+
+from be6502emu.throttle import Throttle
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _throttle(**options):
+    clock = Clock()
+    options.setdefault("spin", 0.0)
+    return clock, Throttle(1000000, timer=clock, sleep=clock.sleep,
+                           **options)
+
+
+def test_sleeps_until_slices_are_due():
+    clock, throttle = _throttle()
+    assert 10000 == throttle.stride
+    throttle.start(0)
+    clock.now += 0.004  # the slice took 4ms to emulate
+    assert 0.0 == throttle.pace(10000)
+    assert [pytest.approx(0.006)] == clock.sleeps
+    clock.now += 0.002
+    throttle.pace(20000)
+    assert pytest.approx(0.008) == clock.sleeps[-1]
+    assert 2 == throttle.stats.slices
+    assert 0.0 == throttle.stats.worst
+
+
+def test_catches_up_within_the_limit():
+    clock, throttle = _throttle(catch_up=0.05)
+    throttle.start(0)
+    clock.now += 0.04  # a hiccup
+    assert pytest.approx(0.03) == throttle.pace(10000)
+    clock.now += 0.001
+    assert pytest.approx(0.021) == throttle.pace(20000)
+    for cycle in (30000, 40000, 50000):
+        clock.now += 0.001
+        throttle.pace(cycle)
+    assert [pytest.approx(0.006)] == clock.sleeps
+    stats = throttle.stats
+    assert 0 == stats.slips
+    assert pytest.approx(0.03) == stats.worst
+    assert pytest.approx((0.03 + 0.021 + 0.012 + 0.003) / 5) == stats.mean
+
+
+def test_drops_lag_beyond_the_limit():
+    clock, throttle = _throttle(catch_up=0.05)
+    throttle.start(0)
+    clock.now += 1.0
+    throttle.pace(10000)
+    stats = throttle.stats
+    assert 1 == stats.slips
+    assert pytest.approx(0.99) == stats.dropped
+    # paced from the stall on rather than running flat out
+    throttle.pace(20000)
+    assert [pytest.approx(0.01)] == clock.sleeps
+
+
+def test_spins_out_the_end_of_a_sleep():
+    clock, throttle = _throttle(spin=0.002)
+    ticks = []
+
+    def timer():
+        ticks.append(clock.now)
+        clock.now += 0.0005
+        return clock.now
+
+    throttle.timer = timer
+    throttle.start(0)
+    throttle.pace(10000)
+    assert pytest.approx(0.0075) == clock.sleeps[0]
+    assert clock.now >= throttle.origin + 0.01
+    assert len(ticks) > 3
+
+
+def test_slow_clocks_step_a_cycle_at_a_time():
+    assert 1 == Throttle(1).stride
+    with pytest.raises(ValueError):
+        Throttle(0)
@@ -0,0 +1,78 @@
+import pytest
+
+from be6502emu.mpu import MPU
+from be6502emu.trace import RECORD, Entry, Trace, format_entry
+from tests.helpers import counter
+
+
+@pytest.mark.parametrize("engine", MPU.ENGINES)
+def test_run_records_the_last_instructions(engine):
+    mpu = counter(engine)
+    mpu.trace = trace = Trace(8)
+    result = mpu.run(instructions=23)
+    assert 23 == trace.recorded
+    assert 8 == len(trace) == len(list(trace.entries()))
+    entries = list(trace.entries())
+    # 4 loops of 5 instructions, then LDX $00; INX; STX $00
+    assert [0x0200, 0x0202, 0x0203, 0x0205, 0x0208, 0x0200, 0x0202,
+            0x0203] == [entry.pc for entry in entries]
+    assert Entry(result.cycles - 3, 0x0203, 0x86, 0x8E00, 0, 5, 0, 0xFF,
+                 mpu.p) == entries[-1]
+    assert [entry.cycle for entry in entries] == sorted(
+        entry.cycle for entry in entries)
+
+
+def test_tracing_is_off_by_default():
+    mpu = counter()
+    assert mpu.trace is None
+    mpu.run(instructions=10)
+    mpu.trace = trace = Trace(4)
+    mpu.run(instructions=2)
+    assert 2 == len(trace)
+    # step() is not traced
+    mpu.step()
+    assert 2 == len(trace)
+    assert mpu.fork().trace is None
+
+
+def test_lines_disassemble_on_demand():
+    mpu = MPU()
+    # $0200 LDA #$01; STA $0300,X; BNE $0200; LDA ($10),Y; ASL A
+    mpu.memory[0x0200:0x020C] = (0xA9, 0x01, 0x9D, 0x00, 0x03, 0xD0, 0xF9,
+                                 0xB1, 0x10, 0x0A, 0xDB, 0x00)
+    mpu.pc = 0x0200
+    mpu.trace = trace = Trace()
+    mpu.run(instructions=3)
+    mpu.pc = 0x0207
+    mpu.run(instructions=2)
+    lines = list(trace.lines(mpu.disassemble))
+    assert ["LDA #$01", "STA $0300,X", "BNE $0200", "LDA ($10),Y",
+            "ASL A"] == [line[28:41].strip() for line in lines]
+    assert "0200  A9 01 " in lines[0]
+    assert "0202  9D 00 03" in lines[1]
+    assert "0207  B1 10 " in lines[3]
+    assert lines[0].endswith("A=00 X=00 Y=00 SP=FF ..-B....")
+    assert lines[1].endswith("A=01 X=00 Y=00 SP=FF ..-B....")
+    assert format_entry(next(trace.entries()), mpu.disassemble) == lines[0]
+
+
+def test_dump_and_load_keep_the_order():
+    mpu = counter()
+    mpu.trace = trace = Trace(5)
+    mpu.run(instructions=13)
+    data = trace.dump()
+    assert len(data) < 32 + 5 * RECORD.size
+    loaded = Trace.load(data)
+    assert list(trace.entries()) == list(loaded.entries())
+    assert 13 == loaded.recorded
+    # a partly filled trace too
+    partial = Trace(100)
+    mpu.trace = partial
+    mpu.run(instructions=3)
+    assert list(partial.entries()) == list(
+        Trace.load(partial.dump()).entries())
+    assert 0 == len(Trace.load(Trace().dump()))
+    with pytest.raises(ValueError):
+        Trace.load(b"65SN" + data[4:])
+    with pytest.raises(ValueError):
+        Trace.load(data[:-1])
@@ -0,0 +1,85 @@
+import io
+import os
+
+import pytest
+
+from be6502emu.trace import RECORD, Trace
+from be6502emu.tracefile import (TraceReader, TraceWriter, delta_decode,
+                                 delta_encode)
+from tests.helpers import counter
+
+
+def test_delta_coding_round_trips():
+    records = bytes(range(256)) * (RECORD.size * 3 // 256 + 1)
+    records = records[:RECORD.size * 3]
+    encoded = delta_encode(records)
+    assert records[:RECORD.size] == encoded[:RECORD.size]
+    assert records == delta_decode(encoded)
+    assert b"" == delta_decode(delta_encode(b""))
+
+
+@pytest.mark.parametrize("delta", [True, False])
+def test_streamed_trace_matches_the_ring(tmp_path, delta):
+    path = tmp_path / "run.trace"
+    mpu = counter()
+    ring = counter()
+    ring.trace = Trace(5000)
+    with TraceWriter(path, batch=512, delta=delta) as writer:
+        mpu.trace = writer
+        mpu.run(instructions=3000)
+        mpu.run(instructions=1001)
+    ring.run(instructions=4001)
+    assert 4001 == writer.recorded
+
+    with TraceReader(path) as reader:
+        assert 4001 == len(reader)
+        assert 8 == len(reader.cycles)
+        assert list(ring.trace.entries()) == list(reader.entries())
+    size = os.path.getsize(path)
+    if delta:
+        assert size < 4001 * RECORD.size / 4
+    else:
+        assert size > 4001 * RECORD.size
+
+
+def test_reader_seeks_by_cycle(tmp_path):
+    path = tmp_path / "run.trace"
+    mpu = counter()
+    with TraceWriter(str(path), batch=100) as mpu.trace:
+        mpu.run(instructions=1000)
+    with TraceReader(str(path)) as reader:
+        everything = list(reader.entries())
+        target = everything[567].cycle
+        seeked = reader.entries(start=target)
+        assert everything[567] == next(seeked)
+        assert everything[568:] == list(seeked)
+        # between records, the next one
+        assert everything[568] == next(reader.entries(target + 1))
+        assert [] == list(reader.entries(everything[-1].cycle + 1))
+
+
+def test_unfinished_chunks_are_ignored():
+    data = io.BytesIO()
+    mpu = counter()
+    mpu.trace = writer = TraceWriter(data, batch=10)
+    mpu.run(instructions=35)
+    writer.close()
+    complete = data.getvalue()
+    reader = TraceReader(io.BytesIO(complete[:-5]))
+    assert 30 == len(reader) == len(list(reader.entries()))
+    with pytest.raises(ValueError):
+        TraceReader(io.BytesIO(b"65TR" + complete[4:]))
+
+
+def test_write_errors_surface_in_the_emulation_thread():
+    class Full(io.BytesIO):
+        def write(self, data):
+            if self.tell() > 100:
+                raise OSError("disk full")
+            return super().write(data)
+
+    mpu = counter()
+    mpu.trace = writer = TraceWriter(Full(), batch=10, delta=False)
+    with pytest.raises(OSError):
+        mpu.run(instructions=50)
+        writer.close()
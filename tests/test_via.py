@@ -0,0 +1,159 @@
+import pytest
+
+from be6502emu import via as v
+from be6502emu.machine import Machine
+from be6502emu.mpu import MPU
+from be6502emu.scheduler import Scheduler
+from be6502emu.via import VIA
+
+
+def _via():
+    mpu = MPU()
+    scheduler = Scheduler(mpu)
+    irqs = []
+    via = VIA(scheduler,
+              irq=lambda level: irqs.append((mpu.processorCycles, level)))
+    return mpu, via, irqs
+
+
+def _at(mpu, via, cycle):
+    mpu.processorCycles = cycle
+    via.scheduler.run_due()
+
+
+def test_t1_one_shot_flags_once_after_latch_plus_two_cycles():
+    mpu, via, irqs = _via()
+    via.write(v.IER, 0x80 | v.T1)
+    via.write(v.T1CL, 10)
+    via.write(v.T1CH, 0)
+    _at(mpu, via, 1)
+    assert 10 == via.read(v.T1CL)
+    _at(mpu, via, 11)
+    assert 0 == via.read(v.T1CL)
+    assert not via.ifr & v.T1
+    _at(mpu, via, 12)
+    assert v.IRQ | v.T1 == via.read(v.IFR)
+    assert [(12, True)] == irqs
+    assert 0xFF == via.read(v.T1CH)
+    # reading T1C-L cleared the flag and one-shot mode never sets it again
+    via.read(v.T1CL)
+    _at(mpu, via, 0x30000)
+    assert 0 == via.read(v.IFR)
+    assert [(12, True), (12, False)] == irqs
+
+
+def test_t1_free_run_repeats_and_toggles_pb7():
+    mpu, via, irqs = _via()
+    via.write(v.ACR, v.T1_FREE_RUN | v.PB7_OUTPUT)
+    via.write(v.IER, 0x80 | v.T1)
+    via.write(v.T1CL, 8)
+    via.write(v.T1CH, 0)
+    assert 0x00 == via.port_b.pins & 0x80
+    levels = []
+    for cycle in range(1, 31):
+        _at(mpu, via, cycle)
+        if via.ifr & v.T1:
+            levels.append((cycle, via.port_b.pins & 0x80))
+            via.write(v.IFR, v.T1)
+    assert [(10, 0x80), (20, 0x00), (30, 0x80)] == levels
+    assert [(10, True), (10, False), (20, True), (20, False),
+            (30, True), (30, False)] == irqs
+
+
+def test_t2_one_shot_and_pulse_counting():
+    mpu, via, irqs = _via()
+    via.write(v.T2CL, 3)
+    via.write(v.T2CH, 0)
+    _at(mpu, via, 4)
+    assert not via.ifr & v.T2
+    _at(mpu, via, 5)
+    assert via.ifr & v.T2
+    assert not irqs  # not enabled
+
+    via.write(v.ACR, v.T2_COUNT_PULSES)
+    via.write(v.T2CL, 2)
+    via.write(v.T2CH, 0)
+    assert not via.ifr & v.T2
+    for _ in range(2):
+        via.port_b.drive(0xFF)
+        via.port_b.drive(0xBF)
+    assert via.ifr & v.T2
+    assert 0 == via.read(v.T2CL)
+
+
+def test_interrupt_registers():
+    mpu, via, irqs = _via()
+    via.write(v.IER, 0x80 | v.CA1 | v.T1)
+    assert 0x80 | v.CA1 | v.T1 == via.read(v.IER)
+    via.write(v.IER, v.T1)
+    assert 0x80 | v.CA1 == via.read(v.IER)
+    via.ca1(False)  # negative edge by default
+    assert v.IRQ | v.CA1 == via.read(v.IFR)
+    assert [(0, True)] == irqs
+    via.read(v.ORA_NH)
+    assert via.ifr & v.CA1
+    via.read(v.ORA)
+    assert 0 == via.read(v.IFR)
+    assert [(0, True), (0, False)] == irqs
+
+
+def test_ports_mix_outputs_and_inputs():
+    mpu, via, irqs = _via()
+    seen = []
+    via.port_b.connect(seen.append)
+    via.write(v.DDRB, 0x0F)
+    via.write(v.ORB, 0x35)
+    via.port_b.drive(0xA0)
+    assert 0xA5 == via.read(v.ORB)
+    assert 0x0F == via.read(v.DDRB)
+    assert [0xF0, 0xF5, 0xA5] == seen
+
+
+def test_shift_out_under_phi2():
+    mpu, via, irqs = _via()
+    shifted = []
+    via.shift_out = shifted.append
+    via.write(v.ACR, 6 << 2)
+    via.write(v.SR, 0x5A)
+    _at(mpu, via, 15)
+    assert not shifted
+    _at(mpu, via, 16)
+    assert [0x5A] == shifted
+    assert via.ifr & v.SHIFT
+    via.read(v.SR)
+    assert not via.ifr & v.SHIFT
+
+
+def test_timer_interrupt_reaches_the_processor():
+    # $8000 LDA #$C0; STA $600E; LDA #$20; STA $6004; STZ $6005; CLI
+    # $800F JMP $800F
+    # $8012 INC $00; LDA $6004; RTI
+    rom = bytearray(0x8000)
+    rom[0:0x18] = bytes((
+        0xA9, 0xC0, 0x8D, 0x0E, 0x60, 0xA9, 0x20, 0x8D, 0x04, 0x60,
+        0x9C, 0x05, 0x60, 0x58, 0xEA, 0x4C, 0x0F, 0x80, 0xE6, 0x00,
+        0xAD, 0x04, 0x60, 0x40))
+    rom[0x7FFC:0x8000] = (0x00, 0x80, 0x12, 0x80)
+    machine = Machine(rom)
+    machine.run(cycles=200)
+    assert 1 == machine.bus[0x0000]
+    assert 0x800F <= machine.mpu.pc <= 0x8011
+
+
+@pytest.mark.parametrize("engine", MPU.ENGINES)
+def test_firmware_sleeping_between_timer_interrupts(engine):
+    # $8000 LDA #$40; STA $600B; LDA #$C0; STA $600E
+    # $800A LDA #$E6; STA $6004; LDA #$03; STA $6005  (T1 = 998 + 2)
+    # $8014 CLI; $8015 WAI; BRA $8015
+    # $8018 INC $00; BIT $6004; RTI
+    rom = bytearray(0x8000)
+    rom[0:0x1E] = bytes((
+        0xA9, 0x40, 0x8D, 0x0B, 0x60, 0xA9, 0xC0, 0x8D, 0x0E, 0x60,
+        0xA9, 0xE6, 0x8D, 0x04, 0x60, 0xA9, 0x03, 0x8D, 0x05, 0x60,
+        0x58, 0xCB, 0x80, 0xFD, 0xE6, 0x00, 0x2C, 0x04, 0x60, 0x40))
+    rom[0x7FFC:0x8000] = (0x00, 0x80, 0x18, 0x80)
+    machine = Machine(rom, engine=engine)
+    result = machine.run(cycles=100500)
+    assert "waiting" == result.reason
+    assert 100 == machine.bus[0x0000]
+    assert result.instructions < 600